@@ -0,0 +1,75 @@
+import math
+from collections import Counter
+from text_analysis import iter_tokens
+
+# ==============================================================================
+# BIGRAM (PHRASE) INDEX
+# ==============================================================================
+# Many queries are multi-word names ("new york", "world war") that /search
+# would otherwise score as bags of words. The build also indexes the adjacent
+# term pairs of the body that are collocations: pairs occurring together far
+# more often than the frequencies of their terms predict, by Dunning's
+# log-likelihood ratio. A pair is a term "w1 w2" of the bigram index
+# (postings_gcp/postings_bigram) with its number of occurrences in a document
+# as tf.
+#
+# Pairs are adjacent after stopword removal, the way analyze_query tokenizes a
+# query, so "university of california" holds "university california". A
+# bigram list is much shorter than the lists of its two terms; the frontend
+# uses it as the candidate set of the query and as a proximity signal.
+
+BIGRAM_SEPARATOR = " "
+
+
+def adjacent_pairs(tokens):
+    """ The bigram terms "w1 w2" of every adjacent pair of `tokens`, in order. """
+    return [f"{first}{BIGRAM_SEPARATOR}{second}" for first, second in zip(tokens, tokens[1:])]
+
+
+def bigram_terms(bigram):
+    """ The two tokens of a bigram term. """
+    return bigram.split(BIGRAM_SEPARATOR)
+
+
+def bigram_counts_batch(pairs, vocabulary=None):
+    """ Yields (bigram, (doc_id, tf)) for every (text, doc_id) of `pairs`, for
+        rdd.mapPartitions. With a `vocabulary`, pairs with a term outside it
+        are left out (the pairs themselves are taken over all tokens).
+    """
+    for text, doc_id in pairs:
+        tokens = list(iter_tokens(text))
+        counts = Counter(zip(tokens, tokens[1:]))
+        for (first, second), tf in counts.items():
+            if vocabulary is None or (first in vocabulary and second in vocabulary):
+                yield f"{first}{BIGRAM_SEPARATOR}{second}", (doc_id, tf)
+
+
+def _entropy_term(*counts):
+    """ sum(k * log(k / total)) over the non-zero counts. """
+    total = sum(counts)
+    return sum(k * math.log(k / total) for k in counts if k > 0)
+
+
+def log_likelihood_ratio(n_ab, n_a, n_b, n):
+    """ Dunning's G^2 of the pair (a, b) seen n_ab times, with a seen n_a times,
+        b n_b times, out of n tokens (the 2x2 contingency table of a first /
+        b second).
+    """
+    k11, k12, k21 = n_ab, n_a - n_ab, n_b - n_ab
+    k22 = max(n - n_a - n_b + n_ab, 0)
+    return 2 * (_entropy_term(k11, k12, k21, k22)
+                - _entropy_term(k11 + k12, k21 + k22) - _entropy_term(k11 + k21, k12 + k22))
+
+
+def collocation_score(n_ab, n_a, n_b, n):
+    """ The log-likelihood ratio of a pair seen more often than chance predicts,
+        0 for a pair seen as often or less (no association, or a negative one).
+    """
+    if n_ab * n <= n_a * n_b: return 0.0
+    return max(log_likelihood_ratio(n_ab, n_a, n_b, n), 0.0)
+
+
+def query_bigrams(query_tokens, bigram_index):
+    """ The distinct bigram terms of the adjacent query tokens that `bigram_index` holds, in order. """
+    if not bigram_index: return []
+    return [bigram for bigram in dict.fromkeys(adjacent_pairs(list(query_tokens))) if bigram in bigram_index.df]
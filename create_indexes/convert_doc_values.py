@@ -0,0 +1,59 @@
+import sys
+import gzip
+import csv
+import pickle
+import time
+import numpy as np
+from google.cloud import storage
+
+sys.path.insert(0, "..")
+from doc_stores import DocValueStore
+
+# --- CONFIGURATION ---
+# One-time conversion of PageRank (CSV.GZ) and page views (pickled dict) into
+# sorted .npy id/value arrays that the search frontend memory-maps at startup.
+BUCKET_NAME = 'wikipidia_ir_project'
+KEY_FILE_PATH = '../my_gcp_key.json'
+
+# 1. PageRank CSV (doc_id, pagerank) as written by create_pagerank.py
+pagerank_path = "../inverted_indexes_pkls/pagerank.csv.gz"
+
+# 2. PageViews dict as written by create_page_views.py
+pageviews_path = "../inverted_indexes_pkls/pageviews_index.pkl"
+
+# 3. Output prefixes (<prefix>_ids.npy, <prefix>_values.npy) and their bucket folders
+outputs = {
+    "pagerank": ("../inverted_indexes_pkls/pagerank", "postings_gcp/pagerank"),
+    "pageviews": ("../inverted_indexes_pkls/pageviews", "postings_gcp/pageviews"),
+}
+
+# --- MAIN LOGIC ---
+start_time = time.time()
+
+# Step 1: PageRank
+print(f"Reading PageRank from: {pagerank_path}...")
+pr_ids, pr_values = [], []
+with gzip.open(pagerank_path, 'rt') as f:
+    for row in csv.reader(f):
+        if len(row) >= 2:
+            pr_ids.append(int(row[0]))
+            pr_values.append(float(row[1]))
+stores = {"pagerank": DocValueStore.from_pairs(pr_ids, pr_values)}
+print(f"PageRank loaded. Total items: {len(pr_ids)}")
+
+# Step 2: PageViews
+print(f"Reading PageViews from: {pageviews_path}...")
+with open(pageviews_path, 'rb') as f:
+    wid2pv = pickle.load(f)
+stores["pageviews"] = DocValueStore.from_pairs(list(wid2pv.keys()), list(wid2pv.values()), np.int64)
+print(f"PageViews loaded. Total items: {len(wid2pv)}")
+
+# Step 3: Save and upload
+bucket = storage.Client.from_service_account_json(KEY_FILE_PATH).bucket(BUCKET_NAME)
+for name, (prefix, remote_folder) in outputs.items():
+    stores[name].save(prefix)
+    for suffix in ("_ids.npy", "_values.npy"):
+        bucket.blob(f"{remote_folder}/{name}{suffix}").upload_from_filename(f"{prefix}{suffix}")
+        print(f"   Uploaded {prefix}{suffix} to gs://{BUCKET_NAME}/{remote_folder}/{name}{suffix}")
+
+print(f"Done! Took {(time.time() - start_time) / 60:.2f} minutes.")
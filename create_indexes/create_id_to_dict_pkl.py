@@ -1,16 +1,42 @@
+import os
+import sys
+import heapq
+import random
+import shutil
 import pandas as pd
-import pickle
 import gcsfs
-import random
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from google.cloud import storage
 
+sys.path.insert(0, "..")
+from doc_stores import TitleStore, TitleStoreWriter
+
 # --- CONFIGURATION ---
 BUCKET_NAME = 'wikipidia_ir_project'
 KEY_FILE_PATH = '../my_gcp_key.json'
-OUTPUT_FILE = '../inverted_indexes_pkls/id_to_title.pkl'
+# Output: <prefix>_ids.npy, <prefix>_offsets.npy, <prefix>_blob.bin
+OUTPUT_PREFIX = '../inverted_indexes_pkls/titles'
+PARTS_DIR = '../inverted_indexes_pkls/title_parts'
+NUM_WORKERS = 8
+
 
+def write_part(fs, i, file_path):
+    """ Reads one parquet file and writes it as a sorted partial title store. """
+    with fs.open(file_path, 'rb') as f:
+        df = pd.read_parquet(f, columns=['id', 'title'])
 
-def create_dict_debug():
+    # FORCE INTEGER TYPE for ID (Crucial step!)
+    df['id'] = df['id'].astype(int)
+    df = df.sort_values('id')
+
+    part_prefix = os.path.join(PARTS_DIR, f"part_{i:04}")
+    with TitleStoreWriter(part_prefix) as writer:
+        for doc_id, title in zip(df['id'].tolist(), df['title'].tolist()):
+            writer.add(doc_id, title)
+    return part_prefix, len(df)
+
+
+def create_title_store():
     print("🚀 Authenticating...")
     fs = gcsfs.GCSFileSystem(project='ir-project-2025', token=KEY_FILE_PATH)
 
@@ -18,55 +44,43 @@ def create_dict_debug():
     files = fs.glob(f"{BUCKET_NAME}/*.parquet")
     print(f"✅ Found {len(files)} parquet files.")
 
-    full_dict = {}
-
-    for i, file_path in enumerate(files):
-        try:
-            print(f"\n[{i + 1}/{len(files)}] Reading {file_path}...")
-
-            # Read Data
-            df = pd.read_parquet(f"gs://{file_path}",
-                                 columns=['id', 'title'],
-                                 storage_options={'token': KEY_FILE_PATH})
-
-            # --- DEBUGGING PRINTS ---
-            if i == 0:
-                print(f"   📊 Data Types Detected:")
-                print(f"      ID: {df['id'].dtype}")
-                print(f"      Title: {df['title'].dtype}")
-                print(f"      First 3 rows:\n{df.head(3)}")
-
-            # FORCE INTEGER TYPE for ID (Crucial step!)
-            df['id'] = df['id'].astype(int)
-
-            # Convert to dict
-            chunk_dict = dict(zip(df['id'], df['title']))
-            full_dict.update(chunk_dict)
-
-            # Verify one random entry from this batch
-            random_key = random.choice(list(chunk_dict.keys()))
-            print(f"   ✅ Added {len(chunk_dict)} entries. Sample: ID {random_key} -> '{chunk_dict[random_key]}'")
-
-        except Exception as e:
-            print(f"   ❌ Error reading {file_path}: {e}")
+    # 1. Read the parquet files in parallel, each into its own sorted part
+    os.makedirs(PARTS_DIR, exist_ok=True)
+    part_prefixes = []
+    with ThreadPoolExecutor(NUM_WORKERS) as pool:
+        futures = {pool.submit(write_part, fs, i, file_path): file_path for i, file_path in enumerate(files)}
+        for future in as_completed(futures):
+            try:
+                part_prefix, n_rows = future.result()
+                part_prefixes.append(part_prefix)
+                print(f"   ✅ [{len(part_prefixes)}/{len(files)}] {futures[future]}: {n_rows} titles")
+            except Exception as e:
+                print(f"   ❌ Error reading {futures[future]}: {e}")
+
+    # 2. Stream a k-way merge of the parts into the final store
+    print("\n🔀 Merging parts...")
+    parts = [TitleStore.load(prefix) for prefix in sorted(part_prefixes)]
+    with TitleStoreWriter(OUTPUT_PREFIX) as writer:
+        for doc_id, title in heapq.merge(*(part.items() for part in parts), key=lambda x: x[0]):
+            writer.add(doc_id, title)
+    del parts
+    shutil.rmtree(PARTS_DIR)
 
     # --- FINAL VERIFICATION ---
+    store = TitleStore.load(OUTPUT_PREFIX)
     print("\n" + "=" * 40)
-    print(f"💾 Final Dictionary Size: {len(full_dict)}")
-
-    print("🔍 Inspecting 5 Random Entries from Final Dict:")
-    keys = list(full_dict.keys())
-    for _ in range(5):
-        k = random.choice(keys)
-        print(f"   Key: {k} (Type: {type(k)}) --> Value: '{full_dict[k]}'")
-
-    # Save to disk
-    print(f"\n💾 Saving to {OUTPUT_FILE}...")
-    with open(OUTPUT_FILE, 'wb') as f:
-        pickle.dump(full_dict, f)
+    print(f"💾 Final Store Size: {len(store)}")
+    print("🔍 Inspecting 5 Random Entries from Final Store:")
+    for doc_id in random.sample(store.doc_ids.tolist(), min(5, len(store))):
+        print(f"   Key: {doc_id} --> Value: '{store.get(doc_id)}'")
 
-    print("🎉 DONE! Now, you MUST upload this specific file to the bucket.")
+    # Upload to GCS
+    bucket = storage.Client.from_service_account_json(KEY_FILE_PATH).bucket(BUCKET_NAME)
+    for suffix in ("_ids.npy", "_offsets.npy", "_blob.bin"):
+        bucket.blob(f"postings_gcp/titles/titles{suffix}").upload_from_filename(f"{OUTPUT_PREFIX}{suffix}")
+        print(f"   Uploaded {OUTPUT_PREFIX}{suffix}")
+    print("🎉 DONE!")
 
 
 if __name__ == "__main__":
-    create_dict_debug()
\ No newline at end of file
+    create_title_store()
@@ -1,14 +1,19 @@
 import sys
 import os
-import re
 import pickle
 import math
-from collections import Counter, defaultdict
+from operator import add
+from collections import defaultdict
 from pathlib import Path
+import numpy as np
 from google.cloud import storage
-import nltk
-from nltk.corpus import stopwords
 from inverted_index_gcp import InvertedIndex
+from posting_codec import POSTING_FORMAT_BLOCKS, POSTING_FORMAT_IMPACTS, IMPACT_BITS
+from doc_stores import DOC_STATS_DTYPE, DocStatsStore, TitleStoreWriter
+from lexicon import write_lexicon, LEXICON_FILES
+from index_sync import GCSObjectStore, write_manifest
+from text_analysis import word_counts_batch, anchor_tokens_batch
+from bigrams import bigram_counts_batch, bigram_terms, collocation_score
 from pyspark.sql import SparkSession
 
 # ====================================================
@@ -16,6 +21,22 @@ from pyspark.sql import SparkSession
 # ====================================================
 BUCKET_NAME = 'wikipidia_ir_project'
 NUM_BUCKETS = 124
+# Posting lists are written with the delta + bit-packed block codec
+POSTING_FORMAT = POSTING_FORMAT_BLOCKS
+# Optional extra body layout: postings ordered by quantized BM25 impact
+WRITE_IMPACT_INDEX = False
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Bigram index of body collocations (bigrams.py): adjacent pairs of indexed terms found in at least
+# MIN_BIGRAM_DF documents with a log-likelihood ratio of at least MIN_BIGRAM_LLR (10.83: p < 0.001),
+# keeping the MAX_BIGRAMS strongest. Off by default: it is an extra pass over the whole corpus
+WRITE_BIGRAM_INDEX = False
+MIN_BIGRAM_DF = 20
+MIN_BIGRAM_LLR = 10.83
+MAX_BIGRAMS = 2_000_000
+# Optional document-partitioned copy of the indexes for shard_coordinator.py:
+# document doc_id goes to shard doc_id % N_SHARDS, written under shards/shard_XXX/ (0 = no shards)
+N_SHARDS = 0
 
 # Initialize Spark (if running as a standalone script)
 spark = SparkSession.builder \
@@ -27,16 +48,6 @@ spark = SparkSession.builder \
 client = storage.Client()
 bucket = client.bucket(BUCKET_NAME)
 
-# NLTK Setup
-nltk.download('stopwords', quiet=True)
-english_stopwords = frozenset(stopwords.words('english'))
-corpus_stopwords = ["category", "references", "also", "external", "links",
-                    "may", "first", "see", "history", "people", "one", "two",
-                    "part", "thumb", "including", "second", "following",
-                    "many", "however", "would", "became"]
-all_stopwords = english_stopwords.union(corpus_stopwords)
-RE_WORD = re.compile(r"""[\#\@\w](['\-]?\w){2,24}""", re.UNICODE)
-
 # ====================================================
 # 2. HELPER FUNCTIONS
 # ====================================================
@@ -48,28 +59,74 @@ def _hash(s):
 def token2bucket_id(token):
     return int(_hash(token), 16) % NUM_BUCKETS
 
-def word_count(text, doc_id):
-    tokens = [token.group() for token in RE_WORD.finditer(text.lower())]
-    tokens = [token for token in tokens if token not in all_stopwords]
-    dict_res = Counter(tokens)
-    return [(token, (doc_id, tf)) for token, tf in dict_res.items()]
-
 def reduce_word_counts(unsorted_pl):
     return sorted(unsorted_pl, key=lambda x: x[0])
 
 def calculate_df(postings):
     return postings.map(lambda x: (x[0], len(x[1])))
 
-def partition_postings_and_write(postings, folder_name):
+def calculate_max_tf(postings):
+    return postings.map(lambda x: (x[0], max(tf for _, tf in x[1])))
+
+def partition_postings_and_write(postings, folder_name, posting_format=POSTING_FORMAT):
     map_to_buckets = postings.map(lambda x: (token2bucket_id(x[0]), x))
     grouped = map_to_buckets.groupByKey()
-    return grouped.map(lambda x: InvertedIndex.write_a_posting_list(x, BUCKET_NAME, folder_name))
+    return grouped.map(lambda x: InvertedIndex.write_a_posting_list(x, BUCKET_NAME, folder_name,
+                                                                    posting_format=posting_format))
+
+def collect_posting_locs(prefix):
+    super_posting_locs = defaultdict(list)
+    for blob in client.list_blobs(BUCKET_NAME, prefix=prefix):
+        if not blob.name.endswith("pickle"): continue
+        with blob.open("rb") as f:
+            posting_locs = pickle.load(f)
+            for k, v in posting_locs.items():
+                super_posting_locs[k].extend(v)
+    return super_posting_locs
+
+def calculate_doc_lengths(word_counts):
+    """ (doc_id, length in tokens) from (token, (doc_id, tf)) pairs. """
+    return word_counts.map(lambda x: (x[1][0], x[1][1])).reduceByKey(add)
+
+def bm25_impacts(postings, doc_lengths, n_docs, avgdl):
+    """ (term, [(doc_id, BM25), ...]) of every term of `postings`, with length
+        normalization (b=BM25_B against avgdl) as scored by /search.
+    """
+    def impact(tf, df, doc_len):
+        idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+        length_norm = 1 - BM25_B + BM25_B * doc_len / avgdl
+        return idf * (tf * (BM25_K1 + 1)) / (tf + BM25_K1 * length_norm)
+
+    by_doc = postings.flatMap(lambda x: [(doc_id, (x[0], tf, len(x[1]))) for doc_id, tf in x[1]])
+    return by_doc.join(doc_lengths) \
+        .map(lambda x: (x[1][0][0], (x[0], impact(x[1][0][1], x[1][0][2], x[1][1])))) \
+        .groupByKey().mapValues(sorted)
+
+def bigram_llr(bigram, count, term_totals, n_tokens):
+    """ Collocation score of a bigram seen `count` times, from the totals of its terms. """
+    first, second = bigram_terms(bigram)
+    return collocation_score(count, term_totals[first], term_totals[second], n_tokens)
+
+def shard_of(doc_id):
+    return doc_id % N_SHARDS
+
+def shard_postings(postings, shard):
+    """ The postings of the documents of one shard, dropping terms left without any. """
+    return postings.mapValues(lambda pl: [(doc_id, tf) for doc_id, tf in pl if shard_of(doc_id) == shard]) \
+        .filter(lambda x: len(x[1]) > 0)
 
 def upload_file(local_path, remote_path):
     blob = bucket.blob(remote_path)
     blob.upload_from_filename(local_path)
     print(f"   Uploaded {local_path} to gs://{BUCKET_NAME}/{remote_path}")
 
+def upload_lexicon(index, index_name, remote_folder):
+    """ Writes the memory-mapped lexicon of `index` and uploads it next to its postings. """
+    local_dir = f"../inverted_indexes_pkls/{index_name}_lexicon"
+    write_lexicon(index, local_dir)
+    for file_name in LEXICON_FILES:
+        upload_file(f"{local_dir}/{file_name}", f"{remote_folder}/lexicon/{file_name}")
+
 # ====================================================
 # 3. DATA LOADING
 # ====================================================
@@ -82,33 +139,33 @@ if not parquet_paths:
 
 print(f"✅ Found {len(parquet_paths)} parquet files. Loading...")
 parquetFile = spark.read.parquet(*parquet_paths)
+N_DOCS = parquetFile.count()
 
 # ====================================================
-# 4. CREATE ID-TO-TITLE DICTIONARY (What you missed)
+# 4. CREATE ID-TO-TITLE STORE
 # ====================================================
-print("🚀 Creating ID-to-Title Dictionary...")
-
-# Select only ID and Title columns
-id_title_pairs = parquetFile.select("id", "title").rdd
+print("🚀 Creating ID-to-Title Store...")
 
-# Collect into a local dictionary (Ensure Driver has enough RAM)
-id_to_title_dict = id_title_pairs.collectAsMap()
+# Select only ID and Title columns, sorted by ID across the cluster
+id_title_pairs = parquetFile.select("id", "title").rdd.map(lambda x: (x[0], x[1])).sortByKey()
 
-# Save to Pickle
-local_dict_file = "../inverted_indexes_pkls/id_to_title.pkl"
-with open(local_dict_file, 'wb') as f:
-    pickle.dump(id_to_title_dict, f)
+# Stream to the driver one partition at a time (no driver-side dict)
+local_title_prefix = "../inverted_indexes_pkls/titles"
+with TitleStoreWriter(local_title_prefix) as writer:
+    for doc_id, title in id_title_pairs.toLocalIterator():
+        writer.add(doc_id, title)
 
 # Upload to GCS
-upload_file(local_dict_file, "postings_gcp/id_to_title/id_to_title.pkl")
-print("✅ ID-to-Title Dictionary Done!")
+for suffix in ("_ids.npy", "_offsets.npy", "_blob.bin"):
+    upload_file(f"{local_title_prefix}{suffix}", f"postings_gcp/titles/titles{suffix}")
+print("✅ ID-to-Title Store Done!")
 
 # ====================================================
 # 5. CREATE BODY INDEX
 # ====================================================
 print("🚀 Creating Body Index...")
 doc_text_pairs = parquetFile.select("text", "id").rdd
-word_counts_rdd = doc_text_pairs.flatMap(lambda x: word_count(x[0], x[1]))
+word_counts_rdd = doc_text_pairs.mapPartitions(word_counts_batch)
 postings = word_counts_rdd.groupByKey().mapValues(reduce_word_counts)
 
 # Filter low frequency terms
@@ -117,54 +174,114 @@ postings_filtered = postings.filter(lambda x: len(x[1]) > 50)
 # Calculate DF
 w2df_body = calculate_df(postings_filtered)
 w2df_dict_body = w2df_body.collectAsMap()
+w2maxtf_dict_body = calculate_max_tf(postings_filtered).collectAsMap()
+body_lengths = calculate_doc_lengths(word_counts_rdd)
 
 # Write Posting Lists
 _ = partition_postings_and_write(postings_filtered, "postings_gcp/postings_body").collect()
 
 # Save Global Index
-super_posting_locs = defaultdict(list)
-blobs = client.list_blobs(BUCKET_NAME, prefix='postings_gcp/postings_body')
-for blob in blobs:
-    if not blob.name.endswith("pickle"): continue
-    with blob.open("rb") as f:
-        posting_locs = pickle.load(f)
-        for k, v in posting_locs.items():
-            super_posting_locs[k].extend(v)
+super_posting_locs = collect_posting_locs('postings_gcp/postings_body/')
 
 inverted = InvertedIndex()
 inverted.posting_locs = super_posting_locs
 inverted.df = w2df_dict_body
-inverted.write_index('.', 'index_body')
-upload_file('../inverted_indexes_pkls/index_body.pkl', 'postings_gcp/postings_body/index.pkl')
+inverted.posting_format = POSTING_FORMAT
+inverted.max_tf = w2maxtf_dict_body
+inverted.n_docs = N_DOCS
+inverted.avgdl = body_lengths.values().sum() / N_DOCS
+upload_lexicon(inverted, 'index_body', 'postings_gcp/postings_body')
 print("✅ Body Index Done!")
 
+# ====================================================
+# 5b. CREATE IMPACT-ORDERED BODY INDEX (OPTIONAL)
+# ====================================================
+if WRITE_IMPACT_INDEX:
+    print("🚀 Creating Impact-Ordered Body Index...")
+    impacts = bm25_impacts(postings_filtered, body_lengths, N_DOCS, inverted.avgdl)
+
+    # One global scale, so quantized impacts of different terms can be summed
+    max_impact = impacts.map(lambda x: max(s for _, s in x[1])).max()
+    impact_scale = max_impact / (2 ** IMPACT_BITS - 1)
+    quantized = impacts.mapValues(
+        lambda pl: [(doc_id, max(1, int(round(s / impact_scale)))) for doc_id, s in pl])
+
+    _ = partition_postings_and_write(quantized, "postings_gcp/postings_body_impact",
+                                     POSTING_FORMAT_IMPACTS).collect()
+
+    inverted_impact = InvertedIndex()
+    inverted_impact.posting_locs = collect_posting_locs('postings_gcp/postings_body_impact/')
+    inverted_impact.df = w2df_dict_body
+    inverted_impact.posting_format = POSTING_FORMAT_IMPACTS
+    inverted_impact.impact_scale = impact_scale
+    inverted_impact.n_docs = N_DOCS
+    inverted_impact.avgdl = inverted.avgdl
+    upload_lexicon(inverted_impact, 'index_body_impact', 'postings_gcp/postings_body_impact')
+    print("✅ Impact-Ordered Body Index Done!")
+
+# ====================================================
+# 5c. CREATE BIGRAM INDEX (OPTIONAL)
+# ====================================================
+# Pairs are counted over all tokens and kept when both terms are in the body
+# index. A pair's collocation score compares its count with the totals of its
+# terms over the n_tokens body tokens; only the selected pairs get postings.
+if WRITE_BIGRAM_INDEX:
+    print("🚀 Creating Bigram Index...")
+    body_vocabulary = spark.sparkContext.broadcast(frozenset(w2df_dict_body))
+    term_totals = spark.sparkContext.broadcast(
+        word_counts_rdd.filter(lambda x: x[0] in body_vocabulary.value)
+        .map(lambda x: (x[0], x[1][1])).reduceByKey(add).collectAsMap())
+    n_tokens = body_lengths.values().sum()
+
+    bigram_counts = doc_text_pairs.mapPartitions(lambda pairs: bigram_counts_batch(pairs, body_vocabulary.value))
+    # (bigram, (count, df)), then the strongest collocations
+    bigram_stats = bigram_counts.map(lambda x: (x[0], (x[1][1], 1))) \
+        .reduceByKey(lambda a, b: (a[0] + b[0], a[1] + b[1])) \
+        .filter(lambda x: x[1][1] >= MIN_BIGRAM_DF)
+    scored = bigram_stats.map(lambda x: (x[0], bigram_llr(x[0], x[1][0], term_totals.value, n_tokens))) \
+        .filter(lambda x: x[1] >= MIN_BIGRAM_LLR)
+    selected = spark.sparkContext.broadcast(
+        frozenset(bigram for bigram, _ in scored.top(MAX_BIGRAMS, key=lambda x: x[1])))
+
+    postings_bigram = bigram_counts.filter(lambda x: x[0] in selected.value) \
+        .groupByKey().mapValues(reduce_word_counts)
+    _ = partition_postings_and_write(postings_bigram, "postings_gcp/postings_bigram").collect()
+
+    inverted_bigram = InvertedIndex()
+    inverted_bigram.posting_locs = collect_posting_locs('postings_gcp/postings_bigram/')
+    inverted_bigram.df = calculate_df(postings_bigram).collectAsMap()
+    inverted_bigram.max_tf = calculate_max_tf(postings_bigram).collectAsMap()
+    inverted_bigram.posting_format = POSTING_FORMAT
+    inverted_bigram.n_docs = N_DOCS
+    inverted_bigram.avgdl = inverted.avgdl
+    upload_lexicon(inverted_bigram, 'index_bigram', 'postings_gcp/postings_bigram')
+    print(f"✅ Bigram Index Done! ({len(inverted_bigram.df)} bigrams)")
+
 # ====================================================
 # 6. CREATE TITLE INDEX
 # ====================================================
 print("🚀 Creating Title Index...")
 doc_title_pairs = parquetFile.select("title", "id").rdd
-word_counts_title = doc_title_pairs.flatMap(lambda x: word_count(x[0], x[1]))
+word_counts_title = doc_title_pairs.mapPartitions(word_counts_batch)
 postings_title = word_counts_title.groupByKey().mapValues(reduce_word_counts)
 
 w2df_title = calculate_df(postings_title)
 w2df_dict_title = w2df_title.collectAsMap()
+w2maxtf_dict_title = calculate_max_tf(postings_title).collectAsMap()
+title_lengths = calculate_doc_lengths(word_counts_title)
 
 _ = partition_postings_and_write(postings_title, "postings_gcp/postings_title").collect()
 
-super_posting_locs_title = defaultdict(list)
-blobs = client.list_blobs(BUCKET_NAME, prefix='postings_gcp/postings_title')
-for blob in blobs:
-    if not blob.name.endswith("pickle"): continue
-    with blob.open("rb") as f:
-        posting_locs = pickle.load(f)
-        for k, v in posting_locs.items():
-            super_posting_locs_title[k].extend(v)
+super_posting_locs_title = collect_posting_locs('postings_gcp/postings_title/')
 
 inverted_title = InvertedIndex()
 inverted_title.posting_locs = super_posting_locs_title
 inverted_title.df = w2df_dict_title
-inverted_title.write_index('.', 'index_title')
-upload_file('../inverted_indexes_pkls/index_title.pkl', 'postings_gcp/postings_title/index.pkl')
+inverted_title.posting_format = POSTING_FORMAT
+inverted_title.max_tf = w2maxtf_dict_title
+inverted_title.n_docs = N_DOCS
+inverted_title.avgdl = title_lengths.values().sum() / N_DOCS
+upload_lexicon(inverted_title, 'index_title', 'postings_gcp/postings_title')
 print("✅ Title Index Done!")
 
 # ====================================================
@@ -174,11 +291,7 @@ print("🚀 Creating Anchor Index...")
 pages_links = parquetFile.select("id", "anchor_text").rdd
 anchor_pairs = pages_links.flatMap(lambda x: [(row.id, row.text) for row in x.anchor_text])
 
-def anchor_to_tokens(pid, text):
-    tokens = [token.group() for token in RE_WORD.finditer(text.lower()) if token.group() not in all_stopwords]
-    return [(t, pid) for t in tokens]
-
-word_counts_anchor = anchor_pairs.flatMap(lambda x: anchor_to_tokens(x[0], x[1]))
+word_counts_anchor = anchor_pairs.mapPartitions(anchor_tokens_batch)
 postings_anchor = word_counts_anchor.map(lambda x: (x, 1)) \
     .reduceByKey(lambda a, b: a + b) \
     .map(lambda x: (x[0][0], (x[0][1], x[1]))) \
@@ -186,23 +299,103 @@ postings_anchor = word_counts_anchor.map(lambda x: (x, 1)) \
 
 w2df_anchor = calculate_df(postings_anchor)
 w2df_dict_anchor = w2df_anchor.collectAsMap()
+w2maxtf_dict_anchor = calculate_max_tf(postings_anchor).collectAsMap()
+anchor_lengths = word_counts_anchor.map(lambda x: (x[1], 1)).reduceByKey(add)
 
 _ = partition_postings_and_write(postings_anchor, "postings_gcp/postings_anchor").collect()
 
-super_posting_locs_anchor = defaultdict(list)
-blobs = client.list_blobs(BUCKET_NAME, prefix='postings_gcp/postings_anchor')
-for blob in blobs:
-    if not blob.name.endswith("pickle"): continue
-    with blob.open("rb") as f:
-        posting_locs = pickle.load(f)
-        for k, v in posting_locs.items():
-            super_posting_locs_anchor[k].extend(v)
+super_posting_locs_anchor = collect_posting_locs('postings_gcp/postings_anchor/')
 
 inverted_anchor = InvertedIndex()
 inverted_anchor.posting_locs = super_posting_locs_anchor
 inverted_anchor.df = w2df_dict_anchor
-inverted_anchor.write_index('.', 'index_anchor')
-upload_file('../inverted_indexes_pkls/index_anchor.pkl', 'postings_gcp/postings_anchor/index.pkl')
+inverted_anchor.posting_format = POSTING_FORMAT
+inverted_anchor.max_tf = w2maxtf_dict_anchor
+inverted_anchor.n_docs = N_DOCS
+inverted_anchor.avgdl = anchor_lengths.values().sum() / N_DOCS
+upload_lexicon(inverted_anchor, 'index_anchor', 'postings_gcp/postings_anchor')
 print("✅ Anchor Index Done!")
 
+# ====================================================
+# 8. CREATE DOCUMENT STATISTICS STORE
+# ====================================================
+print("🚀 Creating Document Statistics...")
+# Body TF-IDF norm over the indexed (filtered) vocabulary, with the idf of /search_body
+idf_body = spark.sparkContext.broadcast({w: math.log10(N_DOCS / df) for w, df in w2df_dict_body.items()})
+body_norms = word_counts_rdd.filter(lambda x: x[0] in idf_body.value) \
+    .map(lambda x: (x[1][0], (x[1][1] * idf_body.value[x[0]]) ** 2)) \
+    .reduceByKey(add) \
+    .mapValues(math.sqrt)
+
+# One (body_len, title_len, anchor_len, body_norm) row per document
+all_ids = parquetFile.select("id").rdd.map(lambda x: (x[0], (0, 0, 0, 0.0)))
+doc_stats = spark.sparkContext.union([
+    all_ids,
+    body_lengths.mapValues(lambda n: (n, 0, 0, 0.0)),
+    title_lengths.mapValues(lambda n: (0, n, 0, 0.0)),
+    anchor_lengths.mapValues(lambda n: (0, 0, n, 0.0)),
+    body_norms.mapValues(lambda norm: (0, 0, 0, norm)),
+]).reduceByKey(lambda a, b: tuple(x + y for x, y in zip(a, b)))
+
+# Streamed to the driver row by row instead of collecting a dict
+rows = np.fromiter(doc_stats.map(lambda x: (x[0],) + x[1]).toLocalIterator(), dtype=DOC_STATS_DTYPE)
+local_stats_file = "../inverted_indexes_pkls/doc_stats.npy"
+DocStatsStore.write(local_stats_file, rows['doc_id'], rows['body_len'], rows['title_len'],
+                    rows['anchor_len'], rows['body_norm'])
+upload_file(local_stats_file, "postings_gcp/doc_stats/doc_stats.npy")
+print("✅ Document Statistics Done!")
+
+# ====================================================
+# 8b. CREATE DOCUMENT-PARTITIONED SHARDS (OPTIONAL)
+# ====================================================
+# Every shard gets body/title/anchor (and bigram) postings and lexicons with the shard's own
+# df, plus the doc stats and titles of its documents, in the layout of the
+# whole index under shards/shard_XXX/ (see serve_shard.py). The body norms are
+# the ones computed above with the collection idf, and the coordinator scores
+# with the collection statistics of the lexicons above, so a sharded query
+# ranks like one over the whole index.
+if N_SHARDS:
+    print(f"🚀 Creating {N_SHARDS} Document Shards...")
+    shard_fields = [("body", postings_filtered, inverted), ("title", postings_title, inverted_title),
+                    ("anchor", postings_anchor, inverted_anchor)]
+    if WRITE_BIGRAM_INDEX:
+        shard_fields.append(("bigram", postings_bigram, inverted_bigram))
+    for shard in range(N_SHARDS):
+        prefix = f"shards/shard_{shard:03d}"
+        local_dir = f"../inverted_indexes_pkls/{prefix}"
+        os.makedirs(local_dir, exist_ok=True)
+        shard_rows = rows[rows['doc_id'] % N_SHARDS == shard]
+
+        for field, field_postings, full_index in shard_fields:
+            postings_shard = shard_postings(field_postings, shard)
+            folder = f"{prefix}/postings_gcp/postings_{field}"
+            _ = partition_postings_and_write(postings_shard, folder).collect()
+            shard_index = InvertedIndex()
+            shard_index.posting_locs = collect_posting_locs(f"{folder}/")
+            shard_index.df = calculate_df(postings_shard).collectAsMap()
+            shard_index.max_tf = calculate_max_tf(postings_shard).collectAsMap()
+            shard_index.posting_format = POSTING_FORMAT
+            shard_index.n_docs = len(shard_rows)
+            shard_index.avgdl = full_index.avgdl
+            upload_lexicon(shard_index, f"{prefix}/index_{field}", folder)
+
+        DocStatsStore.write(f"{local_dir}/doc_stats.npy", shard_rows['doc_id'], shard_rows['body_len'],
+                            shard_rows['title_len'], shard_rows['anchor_len'], shard_rows['body_norm'])
+        upload_file(f"{local_dir}/doc_stats.npy", f"{prefix}/postings_gcp/doc_stats/doc_stats.npy")
+        with TitleStoreWriter(f"{local_dir}/titles") as writer:
+            for doc_id, title in id_title_pairs.filter(lambda x, shard=shard: shard_of(x[0]) == shard) \
+                    .toLocalIterator():
+                writer.add(doc_id, title)
+        for suffix in ("_ids.npy", "_offsets.npy", "_blob.bin"):
+            upload_file(f"{local_dir}/titles{suffix}", f"{prefix}/postings_gcp/titles/titles{suffix}")
+        print(f"✅ Shard {shard + 1}/{N_SHARDS} Done!")
+
+# ====================================================
+# 9. WRITE THE INDEX MANIFEST
+# ====================================================
+# File list, sizes and checksums of everything under postings_gcp/, used by
+# index_sync.py to bring serving VMs up to date
+manifest = write_manifest(GCSObjectStore(bucket))
+print(f"✅ Manifest written: {len(manifest['files'])} files, index version {manifest['index_version']}")
+
 print("\n🎉 ALL TASKS COMPLETE.")
\ No newline at end of file
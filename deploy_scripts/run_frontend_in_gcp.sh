@@ -62,6 +62,8 @@ gcloud compute ssh $GOOGLE_ACCOUNT_NAME@$INSTANCE_NAME --zone $ZONE
 
 # 7. Run the server
 nohup ~/venv/bin/python ~/search_frontend.py > ~/frontend.log 2>&1 &
+# or, one worker per core sharing the loaded indexes (kill -HUP <master pid> restarts the workers):
+# nohup ~/venv/bin/python ~/serve_prefork.py --port 8080 > ~/frontend.log 2>&1 &
 
 # 8. Start querying
 curl "http://127.0.0.1:8080/search?query=hello"
@@ -22,11 +22,16 @@ pip install \
   'google-cloud-storage' \
   'numpy>=1.23.2,<3'
 "
-# 1. Create a directory for your data
-sudo -u "${APP_USER}" mkdir -p "${APP_HOME}/data"
-
-# 2. Download data from your bucket (REPLACE WITH YOUR BUCKET NAME)
-# NOTE: The -r flag is for directories (like your postings folder)
-sudo -u "${APP_USER}" gsutil -m cp -r gs://YOUR_BUCKET_NAME_HERE/* "${APP_HOME}/data/"
+# 1. Download data from your bucket (REPLACE WITH YOUR BUCKET NAME)
+# The server runs from ${APP_HOME} and reads the index from ${APP_HOME}/postings_gcp,
+# where SYNC_INDEX_ON_STARTUP syncs it too.
+# With index_sync.py copied to the VM, only missing or changed files are fetched
+# (in parallel, resumed and checksum-verified against the index manifest)
+if [ -f "${APP_HOME}/index_sync.py" ]; then
+  sudo -u "${APP_USER}" bash -lc "cd '${APP_HOME}' && '${VENV_DIR}/bin/python' index_sync.py sync --bucket YOUR_BUCKET_NAME_HERE '${APP_HOME}'"
+else
+  # NOTE: The -r flag is for directories (like your postings folder)
+  sudo -u "${APP_USER}" gsutil -m cp -r gs://YOUR_BUCKET_NAME_HERE/postings_gcp "${APP_HOME}/"
+fi
 
 echo "Startup script finished successfully!"
\ No newline at end of file
@@ -0,0 +1,226 @@
+import os
+import mmap
+from array import array
+import numpy as np
+
+# ==============================================================================
+# DOCUMENT STORES (ARRAY-BACKED, MEMORY-MAPPED)
+# ==============================================================================
+# Per-document data is kept as NumPy arrays sorted by doc_id and saved as .npy,
+# so the serving side maps them with np.load(mmap_mode='r') instead of
+# unpickling multi-million entry dicts. The position of a doc_id in the sorted
+# array is its dense doc index.
+
+def find_rows(sorted_ids, doc_ids):
+    """ Returns (row, found mask) of every doc id in a sorted id array.
+
+    The queried ids are cast to the dtype of `sorted_ids` (ids out of its range
+    are simply not found): searchsorted would otherwise convert the whole
+    sorted array to the query dtype on every call.
+    """
+    doc_ids = np.asarray(doc_ids, dtype=np.int64)
+    if len(sorted_ids) == 0:
+        return np.zeros(len(doc_ids), dtype=np.int64), np.zeros(len(doc_ids), dtype=bool)
+    in_range = (doc_ids >= 0) & (doc_ids <= np.iinfo(sorted_ids.dtype).max)
+    keys = np.where(in_range, doc_ids, 0).astype(sorted_ids.dtype)
+    rows = np.minimum(np.searchsorted(sorted_ids, keys), len(sorted_ids) - 1)
+    return rows, in_range & (sorted_ids[rows] == keys)
+
+
+DOC_STATS_DTYPE = np.dtype([('doc_id', '<u4'), ('body_len', '<u4'), ('title_len', '<u2'),
+                            ('anchor_len', '<u4'), ('body_norm', '<f4')])
+
+
+class DocStatsStore:
+    """ Per-document statistics: field lengths (in tokens, after stopword
+        removal) and the TF-IDF norm of the body vector.
+    """
+
+    def __init__(self, stats):
+        self.stats = stats
+        # The id column of the row-wise file is strided; binary search needs it contiguous.
+        self.doc_ids = np.ascontiguousarray(stats['doc_id'])
+        self._summaries = {}
+
+    def __len__(self):
+        return len(self.stats)
+
+    @classmethod
+    def load(cls, path):
+        return cls(np.load(path, mmap_mode='r'))
+
+    @staticmethod
+    def write(path, doc_ids, body_len, title_len, anchor_len, body_norm):
+        """ Writes the store to `path` (.npy), sorting rows by doc_id. """
+        stats = np.empty(len(doc_ids), dtype=DOC_STATS_DTYPE)
+        stats['doc_id'] = doc_ids
+        stats['body_len'] = body_len
+        stats['title_len'] = np.minimum(title_len, np.iinfo(np.uint16).max)
+        stats['anchor_len'] = anchor_len
+        stats['body_norm'] = body_norm
+        stats.sort(order='doc_id')
+        np.save(path, stats)
+
+    def doc_index(self, doc_ids):
+        """ Returns (dense doc index, found mask) for an array of doc ids. """
+        return find_rows(self.doc_ids, doc_ids)
+
+    def column(self, name, doc_ids, default=0):
+        """ Values of column `name` as float64 for every doc id (`default` where unknown). """
+        index, found = self.doc_index(doc_ids)
+        if len(self.doc_ids) == 0:
+            return np.full(len(found), default, dtype=np.float64)
+        return np.where(found, self.stats[name][index].astype(np.float64), default)
+
+    def mean(self, name):
+        return self._summary(name)[0]
+
+    def min_positive(self, name):
+        """ Smallest non-zero value of a column, used for score upper bounds. """
+        return self._summary(name)[1]
+
+    def _summary(self, name):
+        if name not in self._summaries:
+            values = np.asarray(self.stats[name], dtype=np.float64)
+            positive = values[values > 0]
+            self._summaries[name] = (float(values.mean()) if len(values) else 0.0,
+                                     float(positive.min()) if len(positive) else 0.0)
+        return self._summaries[name]
+
+
+class DocValueStore:
+    """ One number per document (PageRank, page views): sorted doc ids and the
+        matching values, stored as two .npy files so both map without copies.
+    """
+
+    def __init__(self, doc_ids, values):
+        self.doc_ids = doc_ids
+        self.values = values
+        self._max = None
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    @classmethod
+    def empty(cls, value_dtype=np.float64):
+        return cls(np.empty(0, dtype=np.uint32), np.empty(0, dtype=value_dtype))
+
+    @classmethod
+    def from_pairs(cls, doc_ids, values, value_dtype=np.float64):
+        """ An in-memory store from unsorted (doc_id, value) columns. """
+        doc_ids = np.asarray(doc_ids, dtype=np.uint32)
+        order = np.argsort(doc_ids, kind='stable')
+        return cls(doc_ids[order], np.asarray(values, dtype=value_dtype)[order])
+
+    @classmethod
+    def load(cls, prefix):
+        return cls(np.load(f"{prefix}_ids.npy", mmap_mode='r'),
+                   np.load(f"{prefix}_values.npy", mmap_mode='r'))
+
+    def save(self, prefix):
+        """ Writes `<prefix>_ids.npy` and `<prefix>_values.npy`. """
+        np.save(f"{prefix}_ids.npy", np.ascontiguousarray(self.doc_ids))
+        np.save(f"{prefix}_values.npy", np.ascontiguousarray(self.values))
+
+    def lookup(self, doc_ids, default=0):
+        """ Values for an array of doc ids (`default` where unknown). """
+        rows, found = find_rows(self.doc_ids, doc_ids)
+        if len(self.doc_ids) == 0:
+            return np.full(len(found), default, dtype=self.values.dtype)
+        return np.where(found, self.values[rows], default).astype(self.values.dtype)
+
+    def max(self):
+        if self._max is None:
+            self._max = self.values.max().item() if len(self.values) else 0
+        return self._max
+
+
+class TitleStore:
+    """ doc_id -> title: sorted doc ids, offsets into a UTF-8 blob (one more
+        offset than titles) and the blob, written as <prefix>_ids.npy,
+        <prefix>_offsets.npy and <prefix>_blob.bin and memory-mapped when loaded.
+    """
+
+    def __init__(self, doc_ids, offsets, blob):
+        self.doc_ids = doc_ids
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    @classmethod
+    def empty(cls):
+        return cls(np.empty(0, dtype=np.uint32), np.zeros(1, dtype=np.uint64), b'')
+
+    @classmethod
+    def from_pairs(cls, doc_ids, titles):
+        """ An in-memory store from unsorted (doc_id, title) columns. """
+        doc_ids = np.asarray(doc_ids, dtype=np.uint32)
+        order = np.argsort(doc_ids, kind='stable')
+        encoded = [(titles[i] or '').encode('utf-8') for i in order.tolist()]
+        lengths = np.fromiter(map(len, encoded), dtype=np.uint64, count=len(encoded))
+        offsets = np.concatenate(([0], np.cumsum(lengths))).astype(np.uint64)
+        return cls(doc_ids[order], offsets, b''.join(encoded))
+
+    @classmethod
+    def load(cls, prefix):
+        with open(f"{prefix}_blob.bin", 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        return cls(np.load(f"{prefix}_ids.npy", mmap_mode='r'),
+                   np.load(f"{prefix}_offsets.npy", mmap_mode='r'), blob)
+
+    def save(self, prefix):
+        with TitleStoreWriter(prefix) as writer:
+            for doc_id, title in self.items():
+                writer.add(doc_id, title)
+
+    def title(self, row):
+        return self.blob[int(self.offsets[row]):int(self.offsets[row + 1])].decode('utf-8')
+
+    def titles(self, doc_ids, default="N/A"):
+        """ Titles of a batch of doc ids (e.g. the top-k of a query), `default` where unknown. """
+        rows, found = find_rows(self.doc_ids, doc_ids)
+        return [self.title(row) if ok else default for row, ok in zip(rows.tolist(), found.tolist())]
+
+    def get(self, doc_id, default=None):
+        return self.titles([doc_id], default)[0]
+
+    def items(self):
+        """ (doc_id, title) pairs in doc id order. """
+        for row, doc_id in enumerate(self.doc_ids.tolist()):
+            yield doc_id, self.title(row)
+
+
+class TitleStoreWriter:
+    """ Streams (doc_id, title) pairs, in ascending doc id order, into a
+        TitleStore on disk. Only the id and offset arrays are kept in memory;
+        a repeated doc id keeps its first title.
+    """
+
+    def __init__(self, prefix):
+        self._prefix = prefix
+        self._blob = open(f"{prefix}_blob.bin", 'wb')
+        self._doc_ids = array('I')
+        self._offsets = array('Q', [0])
+
+    def add(self, doc_id, title):
+        if self._doc_ids and doc_id <= self._doc_ids[-1]:
+            if doc_id == self._doc_ids[-1]: return
+            raise ValueError(f"doc ids must be added in ascending order ({doc_id} after {self._doc_ids[-1]})")
+        encoded = (title or '').encode('utf-8')
+        self._blob.write(encoded)
+        self._doc_ids.append(doc_id)
+        self._offsets.append(self._offsets[-1] + len(encoded))
+
+    def close(self):
+        self._blob.close()
+        np.save(f"{self._prefix}_ids.npy", np.frombuffer(self._doc_ids, dtype=np.uint32))
+        np.save(f"{self._prefix}_offsets.npy", np.frombuffer(self._offsets, dtype=np.uint64))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,297 @@
+import os
+import sys
+import json
+import time
+import base64
+import shutil
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from google.cloud import storage
+from google.api_core.exceptions import RequestRangeNotSatisfiable
+from requests.adapters import HTTPAdapter
+
+# ==============================================================================
+# INDEX MANIFEST & SYNC
+# ==============================================================================
+# The build writes a manifest next to the index files in the bucket:
+#   {"version": 1, "index_version": "...", "created": ..., "files": {name: {"size": n, "md5": "..."}}}
+# where md5 is base64 encoded, as in the GCS object metadata.
+#
+# `sync` brings a local directory up to date with a manifest: files whose size
+# and checksum already match are kept, the others are downloaded in parallel
+# into `<file>.part` and renamed into place only after their checksum was
+# verified. An interrupted download resumes from the bytes already in its
+# .part file. Checksums of verified local files are remembered in
+# SYNC_STATE_FILE (by size and mtime), so a re-sync does not hash unchanged files.
+#
+#   python index_sync.py sync --bucket wikipidia_ir_project .
+#   python index_sync.py sync --source /mnt/index_copy .     (a directory acting as the bucket)
+#
+# The stores also serve byte ranges (read_range), for reading postings in place (remote_postings.py).
+
+MANIFEST_VERSION = 1
+MANIFEST_NAME = "postings_gcp/manifest.json"
+# Files of the serving index (postings, lexicons, document stores)
+INDEX_PREFIXES = ("postings_gcp/",)
+SYNC_STATE_FILE = ".index_sync_state.json"
+SYNC_WORKERS = 16
+CHUNK_SIZE = 8 * 1024 * 1024
+
+
+def md5_of_file(path):
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            md5.update(chunk)
+    return base64.b64encode(md5.digest()).decode('ascii')
+
+
+# ==============================================================================
+# OBJECT STORES
+# ==============================================================================
+
+class LocalObjectStore:
+    """ A local directory used as the bucket (tests, or a mounted copy). """
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, name):
+        return os.path.join(self.root, *name.split('/'))
+
+    def list(self, prefix=""):
+        """ (name, size) of every object whose name starts with `prefix`. """
+        for dir_path, _, file_names in os.walk(self.root):
+            for file_name in file_names:
+                path = os.path.join(dir_path, file_name)
+                name = os.path.relpath(path, self.root).replace(os.sep, '/')
+                if name.startswith(prefix):
+                    yield name, os.path.getsize(path)
+
+    def md5(self, name):
+        return md5_of_file(self._path(name))
+
+    def read(self, name):
+        with open(self._path(name), 'rb') as f:
+            return f.read()
+
+    def write(self, name, data):
+        path = self._path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    def download(self, name, f, start=0):
+        """ Appends the bytes of `name` from offset `start` on to file object `f`. """
+        with open(self._path(name), 'rb') as src:
+            src.seek(start)
+            shutil.copyfileobj(src, f, CHUNK_SIZE)
+
+    def read_range(self, name, start, end):
+        """ Bytes [start, end) of `name`, fewer if the object ends before `end`. """
+        with open(self._path(name), 'rb') as f:
+            f.seek(start)
+            return f.read(end - start)
+
+
+class GCSObjectStore:
+    """ A GCS bucket. The client's connection pool is shared by all threads. """
+
+    def __init__(self, bucket):
+        self.bucket = bucket
+
+    @classmethod
+    def from_name(cls, bucket_name, key_file=None, pool_size=None):
+        """ Opens `bucket_name`; `pool_size` widens the client's HTTP connection
+            pool (10 by default) for that many concurrent requests.
+        """
+        client = storage.Client.from_service_account_json(key_file) if key_file else storage.Client()
+        if pool_size:
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            client._http.mount("https://", adapter)
+        return cls(client.bucket(bucket_name))
+
+    def list(self, prefix=""):
+        for blob in self.bucket.list_blobs(prefix=prefix):
+            yield blob.name, blob.size
+
+    def md5(self, name):
+        blob = self.bucket.get_blob(name)
+        if blob.md5_hash: return blob.md5_hash
+        # Composite objects carry no MD5; hash their content
+        md5 = hashlib.md5(blob.download_as_bytes())
+        return base64.b64encode(md5.digest()).decode('ascii')
+
+    def read(self, name):
+        return self.bucket.blob(name).download_as_bytes()
+
+    def write(self, name, data):
+        self.bucket.blob(name).upload_from_string(data)
+
+    def download(self, name, f, start=0):
+        self.bucket.blob(name).download_to_file(f, start=start or None)
+
+    def read_range(self, name, start, end):
+        # GCS ranges are inclusive; one request, no checksum of a partial object
+        try:
+            return self.bucket.blob(name).download_as_bytes(start=start, end=end - 1, checksum=None)
+        except RequestRangeNotSatisfiable:
+            return b''
+
+
+# ==============================================================================
+# MANIFEST
+# ==============================================================================
+
+def build_manifest(store, prefixes=INDEX_PREFIXES, exclude=(MANIFEST_NAME,), workers=SYNC_WORKERS):
+    """ Manifest of every object under `prefixes`. The index version is a
+        digest of the file list, so it changes whenever any file does.
+    """
+    objects = {name: size for prefix in prefixes for name, size in store.list(prefix)
+               if name not in exclude and not name.endswith('/')}
+    with ThreadPoolExecutor(workers) as pool:
+        hashes = dict(zip(objects, pool.map(store.md5, objects)))
+    files = {name: {"size": objects[name], "md5": hashes[name]} for name in sorted(objects)}
+    index_version = hashlib.sha1(json.dumps(files, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+    return {"version": MANIFEST_VERSION, "index_version": index_version,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()), "files": files}
+
+
+def write_manifest(store, manifest_name=MANIFEST_NAME, **kwargs):
+    manifest = build_manifest(store, **kwargs)
+    store.write(manifest_name, json.dumps(manifest, indent=1).encode('utf-8'))
+    return manifest
+
+
+def read_manifest(store, manifest_name=MANIFEST_NAME):
+    manifest = json.loads(store.read(manifest_name))
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise ValueError(f"Unsupported manifest version {manifest.get('version')}")
+    return manifest
+
+
+# ==============================================================================
+# SYNC
+# ==============================================================================
+
+class _SyncState:
+    """ Checksums of verified local files, keyed by name, valid while the
+        file's size and mtime are unchanged.
+    """
+
+    def __init__(self, local_root):
+        self._path = os.path.join(local_root, SYNC_STATE_FILE)
+        self._lock = threading.Lock()
+        try:
+            with open(self._path) as f:
+                self._entries = json.load(f)
+        except (OSError, ValueError):
+            self._entries = {}
+
+    def md5(self, name, path):
+        st = os.stat(path)
+        entry = self._entries.get(name)
+        if entry and entry[0] == st.st_size and entry[1] == st.st_mtime_ns:
+            return entry[2]
+        md5 = md5_of_file(path)
+        self.remember(name, path, md5)
+        return md5
+
+    def remember(self, name, path, md5):
+        st = os.stat(path)
+        with self._lock:
+            self._entries[name] = [st.st_size, st.st_mtime_ns, md5]
+
+    def save(self):
+        with self._lock:
+            tmp = self._path + ".tmp"
+            with open(tmp, 'w') as f:
+                json.dump(self._entries, f)
+            os.replace(tmp, self._path)
+
+
+def _download(store, name, expected, path, retries):
+    """ Downloads `name` to `path` through `path`.part, resuming a partial
+        download; returns the number of bytes fetched.
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    part = path + ".part"
+    fetched = 0
+    for attempt in range(retries + 1):
+        start = os.path.getsize(part) if os.path.exists(part) else 0
+        if start > expected["size"]:
+            os.remove(part)
+            start = 0
+        with open(part, 'ab') as f:
+            if start < expected["size"]:
+                store.download(name, f, start)
+        fetched += os.path.getsize(part) - start
+        if os.path.getsize(part) == expected["size"] and md5_of_file(part) == expected["md5"]:
+            os.replace(part, path)
+            return fetched
+        # A corrupt or stale partial file: start over
+        os.remove(part)
+    raise IOError(f"Checksum mismatch for {name} after {retries + 1} attempts")
+
+
+def sync(store, local_root, manifest_name=MANIFEST_NAME, workers=SYNC_WORKERS, retries=1):
+    """ Makes `local_root` match the manifest in `store`. Returns a summary:
+        index_version, and the number of files kept, downloaded and failed
+        and the bytes downloaded.
+    """
+    manifest = read_manifest(store, manifest_name)
+    state = _SyncState(local_root)
+    summary = dict(index_version=manifest["index_version"], kept=0, downloaded=0, failed=0, bytes=0)
+
+    def sync_file(name, expected):
+        path = os.path.join(local_root, *name.split('/'))
+        if os.path.exists(path) and os.path.getsize(path) == expected["size"] \
+                and state.md5(name, path) == expected["md5"]:
+            return "kept", 0
+        n_bytes = _download(store, name, expected, path, retries)
+        state.remember(name, path, expected["md5"])
+        return "downloaded", n_bytes
+
+    start = time.time()
+    try:
+        with ThreadPoolExecutor(workers) as pool:
+            futures = {pool.submit(sync_file, name, expected): name for name, expected in manifest["files"].items()}
+            for future in as_completed(futures):
+                try:
+                    outcome, n_bytes = future.result()
+                except Exception as e:
+                    print(f"   ❌ Failed to sync {futures[future]}: {e}")
+                    summary["failed"] += 1
+                    continue
+                summary[outcome] += 1
+                summary["bytes"] += n_bytes
+                if outcome == "downloaded":
+                    print(f"   ⬇️ {futures[future]} ({n_bytes / 2 ** 20:.1f} MB)")
+    finally:
+        state.save()
+    print(f"✅ Index {summary['index_version']}: {summary['downloaded']} downloaded "
+          f"({summary['bytes'] / 2 ** 20:.1f} MB), {summary['kept']} up to date, {summary['failed']} failed "
+          f"in {time.time() - start:.1f}s")
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write or sync the index manifest.")
+    parser.add_argument('command', choices=['manifest', 'sync'])
+    parser.add_argument('local_root', nargs='?', default='.')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--bucket', help="GCS bucket name")
+    source.add_argument('--source', help="local directory acting as the bucket")
+    parser.add_argument('--key-file', default=None)
+    parser.add_argument('--workers', type=int, default=SYNC_WORKERS)
+    args = parser.parse_args()
+
+    store = LocalObjectStore(args.source) if args.source else GCSObjectStore.from_name(args.bucket, args.key_file)
+    if args.command == 'manifest':
+        manifest = write_manifest(store, workers=args.workers)
+        print(f"✅ Wrote manifest of {len(manifest['files'])} files, index version {manifest['index_version']}")
+    else:
+        summary = sync(store, args.local_root, workers=args.workers)
+        sys.exit(1 if summary["failed"] else 0)
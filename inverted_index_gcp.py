@@ -7,6 +7,8 @@ import pickle
 from google.cloud import storage
 from collections import defaultdict
 from contextlib import closing
+from posting_codec import (POSTING_FORMAT_TUPLES, LIST_HEADER, encode_posting_list,
+                           decode_posting_list, read_list_header)
 
 PROJECT_ID = 'YOUR-PROJECT-ID-HERE'
 def get_bucket(bucket_name):
@@ -84,6 +86,16 @@ TF_MASK = 2 ** 16 - 1 # Masking the 16 low bits of an integer
 
 
 class InvertedIndex:  
+    # On-disk posting list format (see posting_codec). Indexes pickled before the
+    # attribute existed fall back to this class default, the 6-byte tuples.
+    posting_format = POSTING_FORMAT_TUPLES
+    # Score units of one quantized impact step, for impact-ordered indexes.
+    impact_scale = 1.0
+    # Corpus statistics of the indexed field: number of documents and average
+    # document length in tokens. None for indexes built before they were stored.
+    n_docs = None
+    avgdl = None
+
     def __init__(self, docs={}):
         """ Initializes the inverted index and add documents to it (if provided).
         Parameters:
@@ -94,6 +106,9 @@ class InvertedIndex:
         self.df = Counter()
         # stores total frequency per term
         self.term_total = Counter()
+        # stores the largest tf per term, the term-level score upper bound used
+        # by the top-k query processor (block-level bounds are in the postings)
+        self.max_tf = Counter()
         # stores posting list per term while building the index (internally), 
         # otherwise too big to store in memory.
         self._posting_list = defaultdict(list)
@@ -118,6 +133,7 @@ class InvertedIndex:
         self.term_total.update(w2cnt)
         for w, cnt in w2cnt.items():
             self.df[w] = self.df.get(w, 0) + 1
+            self.max_tf[w] = max(self.max_tf[w], cnt)
             self._posting_list[w].append((doc_id, cnt))
 
     def write_index(self, base_dir, name, bucket_name=None):
@@ -127,6 +143,20 @@ class InvertedIndex:
         #### GLOBAL DICTIONARIES ####
         self._write_globals(base_dir, name, bucket_name)
 
+    def write_posting_lists(self, base_dir, posting_format=POSTING_FORMAT_TUPLES):
+        """ Writes the in-memory posting lists (small indexes, e.g. a delta
+            segment) to local files in `base_dir`, and records their locations,
+            relative to `base_dir`, in posting_locs.
+        """
+        w_pl = [(w, sorted(self._posting_list[w])) for w in sorted(self._posting_list)]
+        self.write_a_posting_list((0, w_pl), base_dir, posting_format=posting_format)
+        with open(str(Path(base_dir) / '0_posting_locs.pickle'), 'rb') as f:
+            locs = pickle.load(f)
+        self.posting_locs = defaultdict(list)
+        for w, w_locs in locs.items():
+            self.posting_locs[w] = [(Path(name).name, offset) for name, offset in w_locs]
+        self.posting_format = posting_format
+
     def _write_globals(self, base_dir, name, bucket_name):
         path = str(Path(base_dir) / f'{name}.pkl')
         bucket = None if bucket_name is None else get_bucket(bucket_name)
@@ -141,43 +171,47 @@ class InvertedIndex:
         del state['_posting_list']
         return state
 
+    def _read_posting_bytes(self, reader, w):
+        locs = self.posting_locs[w]
+        if self.posting_format == POSTING_FORMAT_TUPLES:
+            return reader.read(locs, self.df[w] * TUPLE_SIZE)
+        _, _, n_bytes = read_list_header(reader.read(locs, LIST_HEADER.size))
+        return reader.read(locs, n_bytes)
+
     def posting_lists_iter(self, base_dir, bucket_name=None):
         """ A generator that reads one posting list from disk and yields 
             a (word:str, [(doc_id:int, tf:int), ...]) tuple.
         """
         with closing(MultiFileReader(base_dir, bucket_name)) as reader:
-            for w, locs in self.posting_locs.items():
-                b = reader.read(locs, self.df[w] * TUPLE_SIZE)
-                posting_list = []
-                for i in range(self.df[w]):
-                    doc_id = int.from_bytes(b[i*TUPLE_SIZE:i*TUPLE_SIZE+4], 'big')
-                    tf = int.from_bytes(b[i*TUPLE_SIZE+4:(i+1)*TUPLE_SIZE], 'big')
-                    posting_list.append((doc_id, tf))
-                yield w, posting_list
+            for w in self.posting_locs:
+                b = self._read_posting_bytes(reader, w)
+                pl = decode_posting_list(b, self.posting_format)
+                yield w, list(zip(pl['doc_id'].tolist(), pl['tf'].tolist()))
 
     def read_a_posting_list(self, base_dir, w, bucket_name=None):
         posting_list = []
         if not w in self.posting_locs:
             return posting_list
         with closing(MultiFileReader(base_dir, bucket_name)) as reader:
-            locs = self.posting_locs[w]
-            b = reader.read(locs, self.df[w] * TUPLE_SIZE)
-            for i in range(self.df[w]):
-                doc_id = int.from_bytes(b[i*TUPLE_SIZE:i*TUPLE_SIZE+4], 'big')
-                tf = int.from_bytes(b[i*TUPLE_SIZE+4:(i+1)*TUPLE_SIZE], 'big')
-                posting_list.append((doc_id, tf))
+            b = self._read_posting_bytes(reader, w)
+            pl = decode_posting_list(b, self.posting_format)
+            posting_list = list(zip(pl['doc_id'].tolist(), pl['tf'].tolist()))
         return posting_list
 
     @staticmethod
-    def write_a_posting_list(b_w_pl, base_dir, bucket_name=None):
+    def write_a_posting_list(b_w_pl, base_dir, bucket_name=None,
+                             posting_format=POSTING_FORMAT_TUPLES):
+        """ Writes the posting lists of one bucket with the codec of
+            `posting_format`. The index built from the returned locations must
+            carry the same `posting_format`.
+        """
         posting_locs = defaultdict(list)
         bucket_id, list_w_pl = b_w_pl
         
         with closing(MultiFileWriter(base_dir, bucket_id, bucket_name)) as writer:
             for w, pl in list_w_pl: 
                 # convert to bytes
-                b = b''.join([(doc_id << 16 | (tf & TF_MASK)).to_bytes(TUPLE_SIZE, 'big')
-                              for doc_id, tf in pl])
+                b = encode_posting_list(pl, posting_format)
                 # write to file(s)
                 locs = writer.write(b)
                 # save file locations to index
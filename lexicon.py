@@ -0,0 +1,187 @@
+import os
+import sys
+import json
+import mmap
+import pickle
+from collections.abc import Mapping
+from functools import lru_cache
+import numpy as np
+from posting_codec import POSTING_FORMAT_TUPLES
+
+# ==============================================================================
+# TERM LEXICON (MEMORY-MAPPED)
+# ==============================================================================
+# A read-only replacement for the pickled InvertedIndex on the serving side.
+# A lexicon directory holds:
+#   terms.bin  - every term, UTF-8 encoded, concatenated in sorted byte order
+#   terms.npy  - one row per term (parallel columns): where the term sits in
+#                terms.bin, df, term_total, max_tf and its range in locs.npy
+#   locs.npy   - the (file id, offset) locations of all posting lists
+#   meta.json  - format version, the posting file table (file id -> name) and
+#                the index attributes (posting_format, impact_scale, n_docs, avgdl)
+# Opening it maps the arrays instead of building millions of Python objects,
+# and a term is found by binary search over the sorted terms.
+
+LEXICON_VERSION = 1
+LEXICON_FILES = ("meta.json", "terms.bin", "terms.npy", "locs.npy")
+TERM_DTYPE = np.dtype([('term_start', '<u8'), ('term_len', '<u2'), ('df', '<u4'),
+                       ('term_total', '<u8'), ('max_tf', '<u4'),
+                       ('loc_start', '<u8'), ('n_locs', '<u2')])
+LOC_DTYPE = np.dtype([('file_id', '<u4'), ('offset', '<u8')])
+# InvertedIndex attributes carried in meta.json
+META_ATTRIBUTES = ("posting_format", "impact_scale", "n_docs", "avgdl")
+# Recently looked up terms (a query reads df, locations and max_tf of a term)
+TERM_CACHE_SIZE = 65536
+
+
+def write_lexicon(index, out_dir):
+    """ Writes the lexicon of an InvertedIndex (its df, term_total, max_tf and
+        posting_locs) to `out_dir`. A max_tf of 0 means unknown.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    term_total = getattr(index, 'term_total', {})
+    max_tf = getattr(index, 'max_tf', {})
+    terms = sorted(set(index.df) | set(index.posting_locs), key=lambda t: t.encode('utf-8'))
+    encoded = [term.encode('utf-8') for term in terms]
+    locs = [index.posting_locs.get(term, []) for term in terms]
+    files = sorted({file_name for term_locs in locs for file_name, _ in term_locs})
+    file_ids = {file_name: i for i, file_name in enumerate(files)}
+
+    table = np.zeros(len(terms), dtype=TERM_DTYPE)
+    term_len = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+    n_locs = np.fromiter(map(len, locs), dtype=np.int64, count=len(locs))
+    table['term_len'] = term_len
+    table['term_start'] = np.cumsum(term_len) - term_len
+    table['df'] = [index.df.get(term, 0) for term in terms]
+    table['term_total'] = [term_total.get(term, 0) for term in terms]
+    table['max_tf'] = [max_tf.get(term, 0) for term in terms]
+    table['n_locs'] = n_locs
+    table['loc_start'] = np.cumsum(n_locs) - n_locs
+
+    loc_table = np.zeros(int(n_locs.sum()), dtype=LOC_DTYPE)
+    loc_table['file_id'] = [file_ids[file_name] for term_locs in locs for file_name, _ in term_locs]
+    loc_table['offset'] = [offset for term_locs in locs for _, offset in term_locs]
+
+    with open(os.path.join(out_dir, "terms.bin"), 'wb') as f:
+        f.write(b''.join(encoded))
+    np.save(os.path.join(out_dir, "terms.npy"), table)
+    np.save(os.path.join(out_dir, "locs.npy"), loc_table)
+    meta = {"version": LEXICON_VERSION, "files": files}
+    for name in META_ATTRIBUTES:
+        meta[name] = getattr(index, name, None)
+    with open(os.path.join(out_dir, "meta.json"), 'w') as f:
+        json.dump(meta, f)
+
+
+class Lexicon:
+    """ Memory-mapped term lexicon, with the lookup interface of InvertedIndex:
+        `df`, `term_total`, `max_tf` and `posting_locs` behave as read-only
+        dicts keyed by term, and the index attributes come from meta.json.
+    """
+    posting_format = POSTING_FORMAT_TUPLES
+    impact_scale = 1.0
+    n_docs = None
+    avgdl = None
+
+    def __init__(self, lexicon_dir):
+        with open(os.path.join(lexicon_dir, "meta.json")) as f:
+            meta = json.load(f)
+        if meta.get("version") != LEXICON_VERSION:
+            raise ValueError(f"Unsupported lexicon version {meta.get('version')} in {lexicon_dir}")
+        for name in META_ATTRIBUTES:
+            if meta.get(name) is not None:
+                setattr(self, name, meta[name])
+        self.files = meta["files"]
+
+        self._table = np.load(os.path.join(lexicon_dir, "terms.npy"), mmap_mode='r')
+        self._locs = np.load(os.path.join(lexicon_dir, "locs.npy"), mmap_mode='r')
+        with open(os.path.join(lexicon_dir, "terms.bin"), 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            self._blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        self._term_start = self._table['term_start']
+        self._term_len = self._table['term_len']
+        self.find = lru_cache(maxsize=TERM_CACHE_SIZE)(self._find)
+
+        self.df = _LexiconColumn(self, 'df')
+        self.term_total = _LexiconColumn(self, 'term_total')
+        self.max_tf = _LexiconColumn(self, 'max_tf')
+        self.posting_locs = _LexiconLocs(self)
+
+    def __len__(self):
+        return len(self._table)
+
+    def term(self, i):
+        """ The i-th term in sorted order, as UTF-8 bytes. """
+        start = int(self._term_start[i])
+        return self._blob[start:start + int(self._term_len[i])]
+
+    def terms(self):
+        for i in range(len(self)):
+            yield self.term(i).decode('utf-8')
+
+    def _find(self, token):
+        """ Row of `token` in the lexicon, or -1 when it is not indexed. """
+        key = token.encode('utf-8')
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.term(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < len(self) and self.term(lo) == key else -1
+
+    def value(self, i, column):
+        return int(self._table[column][i])
+
+    def locs(self, i):
+        """ Posting locations of row i as a list of (file_name, offset). """
+        start, n = int(self._table['loc_start'][i]), int(self._table['n_locs'][i])
+        rows = self._locs[start:start + n]
+        return [(self.files[file_id], offset)
+                for file_id, offset in zip(rows['file_id'].tolist(), rows['offset'].tolist())]
+
+
+class _LexiconColumn(Mapping):
+    """ Read-only dict view of one per-term column of a Lexicon. """
+
+    def __init__(self, lexicon, column):
+        self._lexicon = lexicon
+        self._column = column
+
+    def __getitem__(self, token):
+        i = self._lexicon.find(token)
+        if i < 0: raise KeyError(token)
+        return self._lexicon.value(i, self._column)
+
+    def __contains__(self, token):
+        return self._lexicon.find(token) >= 0
+
+    def __iter__(self):
+        return self._lexicon.terms()
+
+    def __len__(self):
+        return len(self._lexicon)
+
+
+class _LexiconLocs(_LexiconColumn):
+    """ Read-only dict view of the posting locations of a Lexicon. """
+
+    def __init__(self, lexicon):
+        super().__init__(lexicon, None)
+
+    def __getitem__(self, token):
+        i = self._lexicon.find(token)
+        if i < 0: raise KeyError(token)
+        return self._lexicon.locs(i)
+
+
+if __name__ == "__main__":
+    # One-time conversion of a pickled InvertedIndex:
+    #   python lexicon.py inverted_indexes_pkls/index_body.pkl inverted_indexes_pkls/index_body_lexicon
+    if len(sys.argv) != 3:
+        sys.exit("usage: python lexicon.py <index.pkl> <lexicon_dir>")
+    with open(sys.argv[1], 'rb') as f:
+        index = pickle.load(f)
+    write_lexicon(index, sys.argv[2])
+    print(f"✅ Wrote lexicon of {len(index.df)} terms to {sys.argv[2]}")
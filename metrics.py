@@ -0,0 +1,267 @@
+import json
+import time
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+# ==============================================================================
+# QUERY METRICS (SPANS, HISTOGRAMS, SLOW-QUERY LOG)
+# ==============================================================================
+# A Trace follows one request: named stage spans, one record per posting fetch
+# (time, bytes read, postings decoded) and the totals. The trace of the current
+# request is thread-local; posting fetches running on the I/O pool adopt it
+# (use_trace), so the reads they make are counted for the right request.
+# Finished traces feed Prometheus histograms (Registry.render gives the text
+# exposition format) and, above a latency threshold, a JSON-lines slow-query log.
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _labels(names, values):
+    if not names: return ""
+    pairs = (f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+             for name, value in zip(names, values))
+    return "{" + ",".join(pairs) + "}"
+
+
+class Counter:
+    """ A monotonically increasing counter per label values. """
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = defaultdict(float)
+
+    def inc(self, amount=1.0, *labels):
+        with self._lock:
+            self._values[labels] += amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, _labels(self.labelnames, labels), value) for labels, value in sorted(self._values.items())]
+
+
+class Histogram:
+    """ Observations counted into cumulative `le` buckets, per label values. """
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._series = {}  # label values -> [count per bucket..., +Inf count, sum]
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for labels, series in sorted(self._series.items()):
+                names = self.labelnames + ("le",)
+                for bound, count in zip(self.buckets, series):
+                    samples.append((f"{self.name}_bucket", _labels(names, labels + (repr(bound),)), count))
+                samples.append((f"{self.name}_bucket", _labels(names, labels + ("+Inf",)), series[-2]))
+                samples.append((f"{self.name}_sum", _labels(self.labelnames, labels), series[-1]))
+                samples.append((f"{self.name}_count", _labels(self.labelnames, labels), series[-2]))
+        return samples
+
+
+class Registry:
+    """ The metrics of a process. Gauges are read from callbacks at render time. """
+
+    def __init__(self):
+        self._metrics = []
+        self._gauges = []  # (name, help, fn returning {label values: value}, labelnames)
+
+    def counter(self, name, help, labelnames=()):
+        metric = Counter(name, help, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge_callback(self, name, help, fn, labelnames=()):
+        self._gauges.append((name, help, fn, tuple(labelnames)))
+
+    def render(self):
+        """ All metrics in the Prometheus text exposition format (version 0.0.4). """
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(f"{name}{labels} {value:g}" for name, labels, value in metric.samples())
+        for name, help, fn, labelnames in self._gauges:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.extend(f"{name}{_labels(labelnames, labels)} {value:g}" for labels, value in sorted(fn().items()))
+        return "\n".join(lines) + "\n"
+
+
+# ==============================================================================
+# TRACES & SPANS
+# ==============================================================================
+
+class Trace:
+    """ Timing and I/O of one search request. """
+
+    def __init__(self, endpoint, query):
+        self.endpoint = endpoint
+        self.query = query
+        self.started = time.perf_counter()
+        self.seconds = None
+        self.stages = defaultdict(float)  # stage -> seconds
+        self.fetches = []  # one dict per posting fetch
+        self.bytes_read = 0
+        self.postings_decoded = 0
+        self._lock = threading.Lock()
+
+    def add_stage(self, stage, seconds):
+        with self._lock:
+            self.stages[stage] += seconds
+
+    def add_io(self, n_bytes, n_postings, fetch=None):
+        with self._lock:
+            self.bytes_read += n_bytes
+            self.postings_decoded += n_postings
+            if fetch is not None:
+                fetch["bytes"] += n_bytes
+                fetch["postings"] += n_postings
+
+    def add_fetch(self, fetch):
+        with self._lock:
+            self.fetches.append(fetch)
+
+    def finish(self):
+        self.seconds = time.perf_counter() - self.started
+        return self
+
+    def to_dict(self):
+        return {"endpoint": self.endpoint, "query": self.query, "ms": round(self.seconds * 1000, 3),
+                "stages_ms": {stage: round(seconds * 1000, 3) for stage, seconds in self.stages.items()},
+                "bytes_read": self.bytes_read, "postings_decoded": self.postings_decoded,
+                "fetches": sorted(self.fetches, key=lambda fetch: -fetch["ms"])}
+
+
+_current = threading.local()
+
+
+def current_trace():
+    return getattr(_current, 'trace', None)
+
+
+@contextmanager
+def use_trace(trace):
+    """ Makes `trace` the current trace of this thread inside the block. """
+    previous = getattr(_current, 'trace', None)
+    _current.trace = trace
+    try:
+        yield trace
+    finally:
+        _current.trace = previous
+
+
+@contextmanager
+def span(stage):
+    """ Adds the time spent in the block to `stage` of the current trace. """
+    trace = current_trace()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add_stage(stage, time.perf_counter() - start)
+
+
+@contextmanager
+def fetch_span(field, term):
+    """ Records one posting fetch of the current trace: time, bytes and postings. """
+    trace = current_trace()
+    if trace is None:
+        yield
+        return
+    fetch = {"field": field, "term": term, "ms": 0.0, "bytes": 0, "postings": 0}
+    _current.fetch = fetch
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        fetch["ms"] = round((time.perf_counter() - start) * 1000, 3)
+        _current.fetch = None
+        trace.add_fetch(fetch)
+
+
+def record_io(n_bytes=0, n_postings=0):
+    """ Counts bytes read / postings decoded for the current trace (and fetch). """
+    trace = current_trace()
+    if trace is not None:
+        trace.add_io(n_bytes, n_postings, getattr(_current, 'fetch', None))
+
+
+# ==============================================================================
+# SEARCH METRICS
+# ==============================================================================
+
+class QueryMetrics:
+    """ The search histograms, and the slow-query log of requests slower than
+        `slow_query_seconds` (one JSON line each, with the stage breakdown and
+        the posting fetches, slowest first).
+
+    Stages are tokenize, search (everything after the result cache missed),
+    and within search: fetch (posting reads and decoding) and results (title
+    lookup); the rest of search is reported as stage score.
+    """
+
+    def __init__(self, registry, slow_query_seconds=0.5, slow_query_log=None):
+        self.slow_query_seconds = slow_query_seconds
+        self.slow_query_log = slow_query_log
+        self._log_lock = threading.Lock()
+        self.request_seconds = registry.histogram(
+            "search_request_seconds", "Search request latency.", ["endpoint"])
+        self.stage_seconds = registry.histogram(
+            "search_stage_seconds", "Time per search stage.", ["endpoint", "stage"])
+        self.fetch_seconds = registry.histogram(
+            "posting_fetch_seconds", "Latency of one posting list fetch.", ["field"])
+        self.bytes_read = registry.counter(
+            "posting_bytes_read_total", "Posting bytes read.", ["endpoint"])
+        self.postings_decoded = registry.counter(
+            "postings_decoded_total", "Postings decoded.", ["endpoint"])
+        self.slow_queries = registry.counter(
+            "search_slow_queries_total", "Requests above the slow-query threshold.", ["endpoint"])
+
+    def observe(self, trace):
+        endpoint = trace.endpoint
+        if "search" in trace.stages:
+            trace.stages["score"] = max(0.0, trace.stages["search"] - trace.stages.get("fetch", 0.0)
+                                        - trace.stages.get("results", 0.0))
+        self.request_seconds.observe(trace.seconds, endpoint)
+        for stage, seconds in trace.stages.items():
+            self.stage_seconds.observe(seconds, endpoint, stage)
+        for fetch in trace.fetches:
+            self.fetch_seconds.observe(fetch["ms"] / 1000, fetch["field"])
+        self.bytes_read.inc(trace.bytes_read, endpoint)
+        self.postings_decoded.inc(trace.postings_decoded, endpoint)
+        if trace.seconds >= self.slow_query_seconds:
+            self.slow_queries.inc(1, endpoint)
+            self.log_slow_query(trace)
+
+    def log_slow_query(self, trace):
+        entry = dict(trace.to_dict(), time=time.strftime("%Y-%m-%dT%H:%M:%S"))
+        print(f"🐢 Slow query ({entry['ms']:.0f} ms) {trace.endpoint} '{trace.query}': {entry['stages_ms']}")
+        if self.slow_query_log is None: return
+        with self._log_lock, open(self.slow_query_log, 'a') as f:
+            f.write(json.dumps(entry) + "\n")
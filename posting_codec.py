@@ -0,0 +1,265 @@
+import struct
+import numpy as np
+
+# ==============================================================================
+# POSTING LIST CODECS
+# ==============================================================================
+# Format 1 (TUPLES): every posting is a fixed 6-byte big-endian (doc_id << 16 | tf).
+#   This is what the original indexes were written with, and it is still the
+#   default of InvertedIndex.posting_format so old pickles keep loading.
+#
+# Format 2 (BLOCKS): postings sorted by doc_id and cut into blocks of
+#   BLOCK_POSTINGS. Layout of one posting list:
+#
+#     list header    LIST_HEADER            n_postings, n_blocks, n_bytes (whole list)
+#     block headers  n_blocks * BLOCK_HEADER_DTYPE
+#     payloads       per block: doc-id gaps bit-packed with `doc_bits`, then
+#                    tf values bit-packed with `tf_bits` (each part byte aligned)
+#
+#   Gaps are stored as (gap - 1) and tfs as (tf - 1), so a run of consecutive
+#   doc ids or a block of tf=1 postings takes zero payload bits. Block headers
+#   are stored together in front of the payloads so they can be read (or
+#   skipped over) without touching the compressed data.
+#
+# Format 3 (IMPACTS): impact-ordered lists. The tf slot of every input posting
+#   holds a quantized 8-bit score (impact). Postings are grouped into one
+#   segment per distinct impact, highest impact first:
+#
+#     list header      LIST_HEADER          n_postings, n_segments, n_bytes (whole list)
+#     segment headers  n_segments * IMPACT_SEGMENT_DTYPE (impact, count, n_bytes)
+#     segments         the doc ids of each segment as a format 2 list (tf=1)
+
+POSTING_FORMAT_TUPLES = 1
+POSTING_FORMAT_BLOCKS = 2
+POSTING_FORMAT_IMPACTS = 3
+
+TUPLE_SIZE = 6
+TF_MASK = 2 ** 16 - 1
+# On-disk dtype of format 1, used to view the bytes without copying.
+POSTING_DTYPE = np.dtype([('doc_id', '>u4'), ('tf', '>u2')])
+# Dtype of decoded format 2 lists.
+DECODED_DTYPE = np.dtype([('doc_id', np.uint32), ('tf', np.uint16)])
+EMPTY_POSTINGS = np.empty(0, dtype=POSTING_DTYPE)
+
+BLOCK_POSTINGS = 128
+LIST_HEADER = struct.Struct('>III')
+BLOCK_HEADER_DTYPE = np.dtype([('first_doc', '>u4'), ('last_doc', '>u4'), ('max_tf', '>u2'),
+                               ('count', 'u1'), ('doc_bits', 'u1'), ('tf_bits', 'u1')])
+IMPACT_BITS = 8
+IMPACT_SEGMENT_DTYPE = np.dtype([('impact', 'u1'), ('count', '>u4'), ('n_bytes', '>u4')])
+
+
+def _pack_bits(values, width):
+    """ Packs non-negative integers into `width` bits each, most significant bit first. """
+    if width == 0 or len(values) == 0:
+        return b''
+    shifts = np.arange(width - 1, -1, -1, dtype=np.uint64)
+    bits = ((values.astype(np.uint64)[:, None] >> shifts) & 1).astype(np.uint8)
+    return np.packbits(bits.ravel()).tobytes()
+
+
+def _bit_width(values):
+    return int(values.max()).bit_length() if len(values) else 0
+
+
+def encode_tuples(pl):
+    """ Format 1: returns the bytes of a list of (doc_id, tf) tuples. """
+    return b''.join([(doc_id << 16 | (tf & TF_MASK)).to_bytes(TUPLE_SIZE, 'big')
+                     for doc_id, tf in pl])
+
+
+def encode_blocks(pl):
+    """ Format 2: returns the bytes of a list of (doc_id, tf) tuples.
+
+    The list is sorted by doc_id first (anchor postings come out of a
+    groupByKey unsorted) and tf values are capped to 16 bits like format 1.
+    """
+    if len(pl) == 0:
+        return LIST_HEADER.pack(0, 0, LIST_HEADER.size)
+    arr = np.array(pl, dtype=np.int64).reshape(-1, 2)
+    arr = arr[np.argsort(arr[:, 0], kind='stable')]
+    doc_ids = arr[:, 0]
+    tfs = np.clip(arr[:, 1], 1, TF_MASK)
+
+    n_postings = len(doc_ids)
+    starts = range(0, n_postings, BLOCK_POSTINGS)
+    headers = np.zeros(len(starts), dtype=BLOCK_HEADER_DTYPE)
+    payloads = []
+    for i, start in enumerate(starts):
+        block_docs = doc_ids[start:start + BLOCK_POSTINGS]
+        block_tfs = tfs[start:start + BLOCK_POSTINGS]
+        gaps = np.diff(block_docs) - 1
+        tf_values = block_tfs - 1
+        doc_bits, tf_bits = _bit_width(gaps), _bit_width(tf_values)
+        headers[i] = (block_docs[0], block_docs[-1], block_tfs.max(),
+                      len(block_docs), doc_bits, tf_bits)
+        payloads.append(_pack_bits(gaps, doc_bits))
+        payloads.append(_pack_bits(tf_values, tf_bits))
+
+    body = headers.tobytes() + b''.join(payloads)
+    return LIST_HEADER.pack(n_postings, len(headers), LIST_HEADER.size + len(body)) + body
+
+
+def encode_impacts(pl):
+    """ Format 3: returns the bytes of a list of (doc_id, impact) tuples, with
+        impacts already quantized to IMPACT_BITS.
+    """
+    if len(pl) == 0:
+        return LIST_HEADER.pack(0, 0, LIST_HEADER.size)
+    arr = np.array(pl, dtype=np.int64).reshape(-1, 2)
+    impacts = np.clip(arr[:, 1], 0, 2 ** IMPACT_BITS - 1)
+    distinct = np.unique(impacts)[::-1]
+    headers = np.zeros(len(distinct), dtype=IMPACT_SEGMENT_DTYPE)
+    segments = []
+    for i, impact in enumerate(distinct.tolist()):
+        doc_ids = np.sort(arr[impacts == impact, 0])
+        segment = encode_blocks([(doc_id, 1) for doc_id in doc_ids.tolist()])
+        headers[i] = (impact, len(doc_ids), len(segment))
+        segments.append(segment)
+
+    body = headers.tobytes() + b''.join(segments)
+    return LIST_HEADER.pack(len(arr), len(headers), LIST_HEADER.size + len(body)) + body
+
+
+def encode_posting_list(pl, posting_format=POSTING_FORMAT_TUPLES):
+    if posting_format == POSTING_FORMAT_BLOCKS:
+        return encode_blocks(pl)
+    if posting_format == POSTING_FORMAT_IMPACTS:
+        return encode_impacts(pl)
+    return encode_tuples(pl)
+
+
+def decode_tuples(buf, n_postings):
+    """ Format 1: zero-copy view of the first `n_postings` postings in `buf`. """
+    n_postings = min(n_postings, len(buf) // TUPLE_SIZE)
+    return np.frombuffer(buf, dtype=POSTING_DTYPE, count=n_postings)
+
+
+def read_list_header(buf):
+    """ Format 2: returns (n_postings, n_blocks, n_bytes) of the list starting at buf[0]. """
+    return LIST_HEADER.unpack_from(buf, 0)
+
+
+def read_block_headers(buf):
+    """ Format 2: returns the block headers of a list as a structured array
+        (first_doc, last_doc, max_tf, count, doc_bits, tf_bits), without decoding
+        any postings.
+    """
+    _, n_blocks, _ = read_list_header(buf)
+    return np.frombuffer(buf, dtype=BLOCK_HEADER_DTYPE, count=n_blocks, offset=LIST_HEADER.size)
+
+
+def _unpack_groups(data, offsets, widths, counts, out, out_pos):
+    """ Unpacks many bit-packed runs at once. Runs with the same (width, count)
+        have the same byte length, so each such group is gathered into one 2-D
+        array and decoded with a single unpackbits.
+    """
+    widths = widths.astype(np.int64)
+    counts = counts.astype(np.int64)
+    keys = widths * 256 + counts
+    for key in np.unique(keys):
+        width, count = divmod(int(key), 256)
+        if count == 0:
+            continue
+        sel = np.flatnonzero(keys == key)
+        rows = out_pos[sel][:, None] + np.arange(count)
+        if width == 0:
+            out[rows] = 0
+            continue
+        n_bytes = (count * width + 7) // 8
+        raw = data[offsets[sel][:, None] + np.arange(n_bytes)]
+        bits = np.unpackbits(raw, axis=1)[:, :count * width].reshape(len(sel), count, width)
+        weights = np.left_shift(np.uint64(1), np.arange(width - 1, -1, -1, dtype=np.uint64))
+        out[rows] = (bits.astype(np.uint64) * weights).sum(axis=2).astype(out.dtype)
+
+
+def decode_blocks(buf, block_ids=None):
+    """ Format 2: decodes the blocks `block_ids` (all blocks by default) of the
+        list in `buf` into a structured array with `doc_id` and `tf` fields,
+        postings in doc id order.
+    """
+    headers = read_block_headers(buf)
+    n_blocks = len(headers)
+    if n_blocks == 0:
+        return np.empty(0, dtype=DECODED_DTYPE)
+
+    counts = headers['count'].astype(np.int64)
+    doc_bits = headers['doc_bits'].astype(np.int64)
+    tf_bits = headers['tf_bits'].astype(np.int64)
+    doc_bytes = ((counts - 1) * doc_bits + 7) // 8
+    tf_bytes = (counts * tf_bits + 7) // 8
+    payload_start = LIST_HEADER.size + n_blocks * BLOCK_HEADER_DTYPE.itemsize
+    block_offsets = payload_start + np.concatenate(([0], np.cumsum(doc_bytes + tf_bytes)[:-1]))
+
+    if block_ids is None:
+        block_ids = np.arange(n_blocks)
+    else:
+        block_ids = np.asarray(block_ids, dtype=np.int64)
+        if len(block_ids) == 0:
+            return np.empty(0, dtype=DECODED_DTYPE)
+    counts = counts[block_ids]
+    out_pos = np.concatenate(([0], np.cumsum(counts)[:-1])).astype(np.int64)
+    n_out = int(counts.sum())
+
+    data = np.frombuffer(buf, dtype=np.uint8)
+    # doc ids: (gap - 1) values fill every position but the first of each
+    # block, then a running sum restarted at each block's first_doc.
+    steps = np.zeros(n_out, dtype=np.int64)
+    _unpack_groups(data, block_offsets[block_ids], doc_bits[block_ids], counts - 1, steps, out_pos + 1)
+    steps += 1
+    steps[out_pos] = 0
+    running = np.cumsum(steps)
+    block_base = headers['first_doc'][block_ids].astype(np.int64) - running[out_pos]
+    doc_ids = running + np.repeat(block_base, counts)
+
+    tfs = np.zeros(n_out, dtype=np.int64)
+    _unpack_groups(data, block_offsets[block_ids] + doc_bytes[block_ids], tf_bits[block_ids],
+                   counts, tfs, out_pos)
+
+    out = np.empty(n_out, dtype=DECODED_DTYPE)
+    out['doc_id'] = doc_ids
+    out['tf'] = tfs + 1
+    return out
+
+
+def read_impact_segments(buf):
+    """ Format 3: returns (segment headers, byte offset of every segment). """
+    _, n_segments, _ = read_list_header(buf)
+    headers = np.frombuffer(buf, dtype=IMPACT_SEGMENT_DTYPE, count=n_segments, offset=LIST_HEADER.size)
+    start = LIST_HEADER.size + n_segments * IMPACT_SEGMENT_DTYPE.itemsize
+    sizes = headers['n_bytes'].astype(np.int64)
+    offsets = start + np.concatenate(([0], np.cumsum(sizes)[:-1])).astype(np.int64)
+    return headers, offsets
+
+
+def decode_impact_segment(buf, offset, n_bytes):
+    """ Format 3: the doc ids of one segment, ascending. """
+    return decode_blocks(memoryview(buf)[offset:offset + n_bytes])['doc_id']
+
+
+def decode_impacts(buf):
+    """ Format 3: all postings as (doc_id, impact in the tf field), in doc id order. """
+    headers, offsets = read_impact_segments(buf)
+    doc_ids = [decode_impact_segment(buf, offset, n_bytes)
+               for offset, n_bytes in zip(offsets.tolist(), headers['n_bytes'].tolist())]
+    out = np.empty(int(headers['count'].sum()), dtype=DECODED_DTYPE)
+    if len(out) == 0: return out
+    out['doc_id'] = np.concatenate(doc_ids)
+    out['tf'] = np.repeat(headers['impact'], headers['count'].astype(np.int64))
+    return out[np.argsort(out['doc_id'], kind='stable')]
+
+
+def decode_posting_list(buf, posting_format=POSTING_FORMAT_TUPLES, max_postings=None):
+    """ Decodes a posting list of either format into a structured array with
+        `doc_id` and `tf` fields. `max_postings` keeps only the first postings
+        (whole blocks are decoded, then trimmed).
+    """
+    if posting_format == POSTING_FORMAT_IMPACTS:
+        return decode_impacts(buf)[:max_postings]
+    if posting_format == POSTING_FORMAT_BLOCKS:
+        if max_postings is None:
+            return decode_blocks(buf)
+        n_blocks = -(-max_postings // BLOCK_POSTINGS)
+        return decode_blocks(buf, np.arange(min(n_blocks, read_list_header(buf)[1])))[:max_postings]
+    n_postings = len(buf) // TUPLE_SIZE if max_postings is None else max_postings
+    return decode_tuples(buf, n_postings)
@@ -0,0 +1,270 @@
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# ==============================================================================
+# QUERY RESULT CACHE
+# ==============================================================================
+# Both caches of the frontend are cleared when the caller reports a new data
+# version (check_version), i.e. when an index or store was loaded again.
+
+
+class _Flight:
+    """ One in-progress computation that concurrent identical requests wait on. """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class ResultCache:
+    """ Bounded cache of serialized query results.
+
+    Entries are evicted least recently used first once their total size goes
+    over `max_bytes`, and expire `ttl` seconds after they were computed.
+    Concurrent misses on the same key are coalesced: one caller computes the
+    value while the others wait for it (single-flight). The cache is cleared
+    whenever the caller reports a new index version.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl=600.0, size_of=len):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._size_of = size_of
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (value, size, expires_at)
+        self._flights = {}
+        self._bytes = 0
+        self._version = None
+        self._counters = dict(hits=0, misses=0, coalesced=0, evictions=0,
+                              expirations=0, invalidations=0, errors=0)
+
+    def check_version(self, version):
+        """ Drops every entry if `version` differs from the last one seen. """
+        with self._lock:
+            if version == self._version: return
+            if self._version is not None:
+                self._counters['invalidations'] += 1
+            self._version = version
+            self._entries.clear()
+            self._bytes = 0
+
+    def get_or_compute(self, key, compute):
+        """ Returns the cached value of `key`, or computes it with compute(). """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, size, expires_at = entry
+                if time.monotonic() < expires_at:
+                    self._entries.move_to_end(key)
+                    self._counters['hits'] += 1
+                    return value
+                self._remove(key)
+                self._counters['expirations'] += 1
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self._counters['misses'] += 1
+                version = self._version
+            else:
+                self._counters['coalesced'] += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None: raise flight.error
+            return flight.value
+
+        try:
+            flight.value = compute()
+        except Exception as e:
+            flight.error = e
+            with self._lock:
+                self._counters['errors'] += 1
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+                # A result computed against an index that was swapped meanwhile is not kept.
+                if flight.error is None and version == self._version:
+                    self._put(key, flight.value)
+            flight.done.set()
+        return flight.value
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats.update(entries=len(self._entries), bytes=self._bytes, max_bytes=self.max_bytes,
+                         ttl=self.ttl, in_flight=len(self._flights))
+        lookups = stats['hits'] + stats['misses'] + stats['coalesced']
+        stats['hit_rate'] = (stats['hits'] + stats['coalesced']) / lookups if lookups else 0.0
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _put(self, key, value):
+        size = self._size_of(value)
+        if size > self.max_bytes: return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (value, size, time.monotonic() + self.ttl)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self._counters['evictions'] += 1
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+
+# ==============================================================================
+# POSTING LIST CACHE (TINYLFU ADMISSION)
+# ==============================================================================
+
+
+_MASK_64 = (1 << 64) - 1
+_MIX_64 = 0x9E3779B97F4A7C15  # 2^64 / golden ratio (Fibonacci hashing)
+_ROW_SEEDS = (0x243F6A8885A308D3, 0x13198A2E03707344, 0xA4093822299F31D0, 0x082EFA98EC4E6C89,
+              0x452821E638D01377, 0xBE5466CF34E90C6C, 0xC0AC29B7C97C50DD, 0x3F84D5B5B5470917)
+
+
+class FrequencySketch:
+    """ Approximate access counts (count-min sketch of saturating 8-bit
+        counters). All counters are halved every `sample_size` increments,
+        so old popularity fades out.
+    """
+
+    def __init__(self, width=1 << 16, depth=4, sample_size=None):
+        self._width = width
+        self._rows = [bytearray(width) for _ in range(depth)]
+        self._sample_size = sample_size or 10 * width
+        self._additions = 0
+
+    def _cells(self, key):
+        # One hash, remixed per row: the low bits of hash((row, key)) collide
+        # together across rows, which makes every row count the same pairs.
+        h = hash(key) & _MASK_64
+        return [(row, (((h ^ seed) * _MIX_64 & _MASK_64) >> 32) % self._width)
+                for seed, row in zip(_ROW_SEEDS, self._rows)]
+
+    def increment(self, key, count=1):
+        for row, col in self._cells(key):
+            row[col] = min(255, row[col] + count)
+        self._additions += count
+        if self._additions >= self._sample_size:
+            for row in self._rows:
+                np.frombuffer(row, dtype=np.uint8)[:] >>= 1
+            self._additions //= 2
+
+    def estimate(self, key):
+        return min(row[col] for row, col in self._cells(key))
+
+
+class PostingCache:
+    """ Decoded posting lists keyed by (field, term), bounded by `max_bytes`.
+
+    Entries are kept in LRU order, and a new list is admitted only if there is
+    room for it or if its access frequency beats that of every entry it would
+    evict (TinyLFU), so a burst of one-off terms cannot flush the hot head
+    terms. Frequencies are counted on every lookup, hit or miss.
+    """
+
+    def __init__(self, max_bytes=512 * 1024 * 1024, sketch_width=1 << 16):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (value, size)
+        self._sketch = FrequencySketch(sketch_width)
+        self._bytes = 0
+        self._version = None
+        self._counters = dict(hits=0, misses=0, admissions=0, rejections=0, evictions=0, invalidations=0)
+
+    def check_version(self, version):
+        """ Drops every entry if `version` differs from the last one seen. """
+        with self._lock:
+            if version == self._version: return
+            if self._version is not None:
+                self._counters['invalidations'] += 1
+                self._entries.clear()
+                self._bytes = 0
+            self._version = version
+
+    def get(self, key):
+        """ The cached value of `key`, or None. Counts the access either way. """
+        with self._lock:
+            self._sketch.increment(key)
+            entry = self._entries.get(key)
+            if entry is None:
+                self._counters['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._counters['hits'] += 1
+            return entry[0]
+
+    def record(self, key, count=1):
+        """ Counts `count` accesses of `key` without a lookup (cache warm-up). """
+        with self._lock:
+            self._sketch.increment(key, count)
+
+    def admits(self, key, size):
+        """ Whether put(key, value of `size` bytes) would currently be accepted. """
+        with self._lock:
+            return self._victims(key, size) is not None
+
+    def put(self, key, value, size):
+        """ Caches `value` if admitted, evicting the entries it displaces. """
+        with self._lock:
+            victims = self._victims(key, size)
+            if victims is None:
+                self._counters['rejections'] += 1
+                return False
+            for victim in victims:
+                self._remove(victim)
+                self._counters['evictions'] += 1
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size)
+            self._bytes += size
+            self._counters['admissions'] += 1
+            return True
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats.update(entries=len(self._entries), bytes=self._bytes, max_bytes=self.max_bytes)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _victims(self, key, size):
+        """ LRU entries to evict so that `size` more bytes fit, or None when
+            the new entry is not worth any of them.
+        """
+        if size > self.max_bytes: return None
+        current = self._entries.get(key)
+        needed = self._bytes - (current[1] if current else 0) + size - self.max_bytes
+        if needed <= 0: return []
+        frequency = self._sketch.estimate(key)
+        victims, freed = [], 0
+        for victim, (_, victim_size) in self._entries.items():
+            if victim == key: continue
+            if self._sketch.estimate(victim) >= frequency: return None
+            victims.append(victim)
+            freed += victim_size
+            if freed >= needed: return victims
+        return None
+
+    def _remove(self, key):
+        _, size = self._entries.pop(key)
+        self._bytes -= size
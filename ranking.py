@@ -0,0 +1,377 @@
+import math
+import numpy as np
+from posting_codec import decode_blocks, read_block_headers, read_impact_segments, decode_impact_segment
+from metrics import record_io
+
+# ==============================================================================
+# RANKING: VECTORIZED SCORING AND TOP-K QUERY PROCESSING
+# ==============================================================================
+
+EMPTY_DOC_IDS = np.empty(0, dtype=np.int64)
+EMPTY_SCORES = np.empty(0, dtype=np.float64)
+
+
+def bm25_idf(doc_freq, total_docs):
+    return math.log(1 + (total_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+
+
+def bm25_saturation(tf, k1, length_norm=1.0):
+    """ TF saturation of BM25, (TF * (k1 + 1)) / (TF + k1 * length_norm), on a whole tf array.
+        length_norm is (1 - b + b * dl / avgdl), per posting or scalar; 1.0 means b=0.
+    """
+    tf = tf.astype(np.float64)
+    return (tf * (k1 + 1)) / (tf + k1 * length_norm)
+
+
+def accumulate_scores(doc_id_arrays, score_arrays):
+    """ Sums per-posting score contributions by document.
+
+    All postings of the query are concatenated and mapped to a compact doc index
+    (the rank of each doc id among the distinct ids of this query), so the sum is
+    a single bincount instead of a dictionary update per posting.
+    Returns (doc_ids, scores) with doc_ids sorted ascending.
+    """
+    if not doc_id_arrays: return EMPTY_DOC_IDS, EMPTY_SCORES
+    doc_ids = np.concatenate([ids.astype(np.int64) for ids in doc_id_arrays])
+    if len(doc_ids) == 0: return EMPTY_DOC_IDS, EMPTY_SCORES
+    contributions = np.concatenate(score_arrays)
+    unique_ids, doc_index = np.unique(doc_ids, return_inverse=True)
+    scores = np.bincount(doc_index, weights=contributions, minlength=len(unique_ids))
+    return unique_ids, scores
+
+
+def top_k(doc_ids, scores, k=100):
+    """ Selects the k best documents with a partial sort. Ties are broken by
+        ascending doc id (doc_ids must be sorted, as returned by accumulate_scores).
+        Returns (doc_ids, scores) ordered best first.
+    """
+    n = len(scores)
+    if n > k:
+        kth_score = np.partition(scores, n - k)[n - k]
+        above = np.flatnonzero(scores > kth_score)
+        ties = np.flatnonzero(scores == kth_score)[:k - len(above)]
+        selected = np.concatenate([above, ties])
+    else:
+        selected = np.arange(n)
+    order = np.lexsort((doc_ids[selected], -scores[selected]))
+    selected = selected[order]
+    return doc_ids[selected], scores[selected]
+
+
+# ==============================================================================
+# BLOCK-MAX TOP-K
+# ==============================================================================
+
+def _ranges(starts, counts):
+    """ Concatenation of arange(start, start + count) for every (start, count). """
+    total = int(counts.sum())
+    if total == 0: return EMPTY_DOC_IDS
+    offsets = np.repeat(starts - np.concatenate(([0], np.cumsum(counts)[:-1])), counts)
+    return offsets + np.arange(total)
+
+
+def _decode_counted(buf, block_ids):
+    postings = decode_blocks(buf, block_ids)
+    record_io(n_postings=len(postings))
+    return postings
+
+
+class PostingBlocks:
+    """ Block-level view of one posting list for the top-k processor.
+
+    Exposes, per block, the doc id range and the max tf (the score upper bound
+    of a block is the term scorer applied to its max tf), and decodes blocks on
+    demand into flat per-list arrays, so a block is decoded at most once per query.
+    """
+
+    def __init__(self, first_doc, last_doc, max_tf, counts, decode):
+        self.first_doc = np.asarray(first_doc, dtype=np.int64)
+        self.last_doc = np.asarray(last_doc, dtype=np.int64)
+        self.max_tf = np.asarray(max_tf, dtype=np.int64)
+        self.counts = np.asarray(counts, dtype=np.int64)
+        self.block_pos = np.concatenate(([0], np.cumsum(self.counts)[:-1])).astype(np.int64)
+        self._decode = decode
+        self._decoded = np.zeros(len(self.counts), dtype=bool)
+        self._doc_ids = None
+        self._tfs = None
+        self._excluded = None
+
+    def __len__(self):
+        return len(self.first_doc)
+
+    def exclude(self, doc_ids):
+        """ Leaves the postings of `doc_ids` (sorted) out of gather, e.g. documents
+            deleted or replaced by a newer delta segment. Block bounds stay valid
+            upper bounds. Returns self.
+        """
+        self._excluded = np.asarray(doc_ids, dtype=np.int64) if len(doc_ids) else None
+        return self
+
+    @classmethod
+    def from_blocks_buffer(cls, buf):
+        """ A block-format (posting_codec format 2) list: real blocks from the headers. """
+        headers = read_block_headers(buf)
+        return cls(headers['first_doc'], headers['last_doc'], headers['max_tf'],
+                   headers['count'], lambda block_ids: _decode_counted(buf, block_ids))
+
+    @classmethod
+    def from_postings(cls, postings, max_tf=None):
+        """ A list without block headers (6-byte tuple format) is a single block
+            bounded by the term-level max tf, when the index stores it.
+        """
+        if len(postings) == 0:
+            return cls([], [], [], [], None)
+        if max_tf is None:
+            max_tf = int(postings['tf'].max())
+        doc_ids = postings['doc_id']
+        return cls([doc_ids[0]], [doc_ids[-1]], [max_tf], [len(postings)],
+                   lambda block_ids: postings)
+
+    @classmethod
+    def from_decoded(cls, headers, postings):
+        """ Blocks over an already decoded list (e.g. from the posting cache):
+            decoding a block is a slice of `postings`.
+        """
+        blocks = cls(*headers, decode=None)
+        blocks._decode = lambda block_ids: postings[_ranges(blocks.block_pos[block_ids], blocks.counts[block_ids])]
+        return blocks
+
+    def headers(self):
+        """ (first_doc, last_doc, max_tf, counts), as taken by from_decoded. """
+        return self.first_doc, self.last_doc, self.max_tf, self.counts
+
+    def gather(self, block_ids):
+        """ Returns (doc_ids, tfs) of the given blocks, decoding the missing ones. """
+        missing = block_ids[~self._decoded[block_ids]]
+        if len(missing):
+            postings = self._decode(missing)
+            if self._doc_ids is None:
+                n_postings = int(self.counts.sum())
+                self._doc_ids = np.empty(n_postings, dtype=np.int64)
+                self._tfs = np.empty(n_postings, dtype=np.int64)
+            at = _ranges(self.block_pos[missing], self.counts[missing])
+            self._doc_ids[at] = postings['doc_id']
+            self._tfs[at] = postings['tf']
+            self._decoded[missing] = True
+        at = _ranges(self.block_pos[block_ids], self.counts[block_ids])
+        doc_ids, tfs = self._doc_ids[at], self._tfs[at]
+        if self._excluded is not None:
+            i = np.minimum(np.searchsorted(self._excluded, doc_ids), len(self._excluded) - 1)
+            keep = self._excluded[i] != doc_ids
+            doc_ids, tfs = doc_ids[keep], tfs[keep]
+        return doc_ids, tfs
+
+
+def _bound(bound_fn, max_tf):
+    """ Upper bound of a monotone scorer over tf in [1, max_tf]. """
+    return np.maximum(bound_fn(max_tf), bound_fn(np.ones_like(max_tf)))
+
+
+def _with_bound(term):
+    """ (blocks, score_fn[, bound_fn]) -> (blocks, score_fn, bound_fn). """
+    blocks, score_fn = term[0], term[1]
+    bound_fn = term[2] if len(term) > 2 else (lambda tfs: score_fn(tfs, None))
+    return blocks, score_fn, bound_fn
+
+
+def top_k_block_max(terms, k=100, extra_ids=EMPTY_DOC_IDS, extra_scores=EMPTY_SCORES,
+                    doc_boost=None, doc_boost_bound=0.0, first_batch=8, exhaustive_below=20000):
+    """ Exact top-k over a sum of per-term scores, skipping blocks that cannot
+        reach the top k (Block-Max WAND style, processed block-at-a-time).
+
+    Parameters:
+    -----------
+      terms: list of (PostingBlocks, score_fn) or (PostingBlocks, score_fn, bound_fn).
+             score_fn(tfs, doc_ids) gives the term's contribution per posting and
+             must be monotone in tf. bound_fn(tfs) must bound it over all documents
+             (e.g. BM25 at the shortest document length); without it the scorer is
+             taken as document independent and bounded by score_fn(tfs, None).
+      extra_ids, extra_scores: exact contributions of other fields, doc ids
+             sorted and unique (e.g. the title and anchor scores of /search).
+      doc_boost: optional function doc_ids -> additive boost (e.g. PageRank),
+             never larger than `doc_boost_bound`.
+      exhaustive_below: queries with fewer postings than this are scored in a
+             single pass, where pruning would cost more than it saves.
+
+    The doc id space is cut into segments at every block boundary. A segment's
+    upper bound is the sum of the bounds of the blocks covering it, plus the
+    largest extra score inside it and the boost bound. Segments are scored
+    exactly in decreasing bound order, in growing batches, until the next bound
+    cannot beat the current k-th result. Ties are broken by ascending doc id,
+    which gives the same ranking as exhaustive scoring with top_k.
+    Returns (doc_ids, scores) ordered best first.
+    """
+    terms = [_with_bound(term) for term in terms if term[0] is not None and len(term[0])]
+    extra_ids = np.asarray(extra_ids, dtype=np.int64)
+    if not terms and len(extra_ids) == 0:
+        return EMPTY_DOC_IDS, EMPTY_SCORES
+
+    # --- 1. Segments and their upper bounds ---
+    edges = [blocks.first_doc for blocks, _, _ in terms] + [blocks.last_doc + 1 for blocks, _, _ in terms]
+    if len(extra_ids):
+        edges.append(extra_ids[[0, -1]] + [0, 1])
+    seg_start = np.unique(np.concatenate(edges))
+    n_segs = len(seg_start) - 1
+    seg_start = seg_start[:-1]
+
+    seg_bound = np.zeros(n_segs)
+    live = np.zeros(n_segs, dtype=bool)
+    seg_blocks = []
+    for blocks, _, bound_fn in terms:
+        n_blocks = len(blocks)
+        j = np.searchsorted(blocks.last_doc, seg_start)
+        jc = np.minimum(j, n_blocks - 1)
+        covered = (j < n_blocks) & (blocks.first_doc[jc] <= seg_start)
+        seg_bound += np.where(covered, _bound(bound_fn, blocks.max_tf)[jc], 0.0)
+        live |= covered
+        seg_blocks.append(np.where(covered, jc, -1))
+
+    if len(extra_ids):
+        extra_seg = np.searchsorted(seg_start, extra_ids, side='right') - 1
+        seg_extra = np.zeros(n_segs)
+        np.maximum.at(seg_extra, extra_seg, extra_scores)
+        seg_bound += seg_extra
+        live[extra_seg] = True
+
+    # Guard against float rounding between the bound and the exact sums.
+    seg_bound = (seg_bound + doc_boost_bound) * (1 + 1e-9) + 1e-12
+    order = np.flatnonzero(live)
+    order = order[np.argsort(-seg_bound[order], kind='stable')]
+
+    # --- 2. Score segments in decreasing bound order ---
+    top_ids, top_scores = EMPTY_DOC_IDS, EMPTY_SCORES
+    remaining, batch = order, first_batch
+    if sum(int(blocks.counts.sum()) for blocks, _, _ in terms) < exhaustive_below:
+        batch = len(order)
+    while len(remaining):
+        if len(top_ids) >= k:
+            # A document enters only with a higher score than the k-th result, or
+            # an equal score and a smaller doc id. The threshold only rises, so
+            # segments filtered out here never need to be revisited.
+            threshold, kth_doc = top_scores[-1], top_ids[-1]
+            bounds = seg_bound[remaining]
+            can_enter = (bounds > threshold) | ((bounds == threshold) & (seg_start[remaining] < kth_doc))
+            remaining = remaining[can_enter]
+            if len(remaining) == 0: break
+        selected, remaining = remaining[:batch], remaining[batch:]
+        batch *= 2
+
+        in_batch = np.zeros(n_segs, dtype=bool)
+        in_batch[selected] = True
+        doc_id_arrays, score_arrays = [], []
+        for (blocks, score_fn, _), block_of_seg in zip(terms, seg_blocks):
+            block_ids = np.unique(block_of_seg[selected])
+            block_ids = block_ids[block_ids >= 0]
+            if len(block_ids) == 0: continue
+            doc_ids, tfs = blocks.gather(block_ids)
+            mask = in_batch[np.searchsorted(seg_start, doc_ids, side='right') - 1]
+            doc_id_arrays.append(doc_ids[mask])
+            score_arrays.append(score_fn(tfs[mask], doc_ids[mask]))
+        if len(extra_ids):
+            mask = in_batch[extra_seg]
+            doc_id_arrays.append(extra_ids[mask])
+            score_arrays.append(extra_scores[mask])
+
+        doc_ids, scores = accumulate_scores(doc_id_arrays, score_arrays)
+        if doc_boost is not None and len(doc_ids):
+            scores = scores + doc_boost(doc_ids)
+
+        merged_ids = np.concatenate([top_ids, doc_ids])
+        merged_scores = np.concatenate([top_scores, scores])
+        by_id = np.argsort(merged_ids, kind='stable')
+        top_ids, top_scores = top_k(merged_ids[by_id], merged_scores[by_id], k)
+
+    return top_ids, top_scores
+
+
+def _in_sorted(sorted_ids, doc_ids):
+    """ Mask of the doc ids present in a sorted unique id array. """
+    if len(sorted_ids) == 0: return np.zeros(len(doc_ids), dtype=bool)
+    i = np.minimum(np.searchsorted(sorted_ids, doc_ids), len(sorted_ids) - 1)
+    return sorted_ids[i] == doc_ids
+
+
+def top_k_candidates(terms, candidates, k=100, extra_ids=EMPTY_DOC_IDS, extra_scores=EMPTY_SCORES,
+                     doc_boost=None):
+    """ Exact top-k of the same sum of scores as top_k_block_max, over the
+        `candidates` only (sorted unique doc ids, e.g. the documents holding a
+        query bigram). Only the blocks whose doc id range covers a candidate
+        are decoded. Returns (doc_ids, scores) ordered best first.
+    """
+    candidates = np.asarray(candidates, dtype=np.int64)
+    extra_ids = np.asarray(extra_ids, dtype=np.int64)
+    if len(candidates) == 0: return EMPTY_DOC_IDS, EMPTY_SCORES
+    doc_id_arrays, score_arrays = [], []
+    for blocks, score_fn, _ in (_with_bound(term) for term in terms if term[0] is not None and len(term[0])):
+        j = np.searchsorted(blocks.last_doc, candidates)
+        jc = np.minimum(j, len(blocks) - 1)
+        covered = (j < len(blocks)) & (blocks.first_doc[jc] <= candidates)
+        block_ids = np.unique(jc[covered])
+        if len(block_ids) == 0: continue
+        doc_ids, tfs = blocks.gather(block_ids)
+        mask = _in_sorted(candidates, doc_ids)
+        doc_id_arrays.append(doc_ids[mask])
+        score_arrays.append(score_fn(tfs[mask], doc_ids[mask]))
+    if len(extra_ids):
+        mask = _in_sorted(candidates, extra_ids)
+        doc_id_arrays.append(extra_ids[mask])
+        score_arrays.append(extra_scores[mask])
+
+    doc_ids, scores = accumulate_scores(doc_id_arrays, score_arrays)
+    if doc_boost is not None and len(doc_ids):
+        scores = scores + doc_boost(doc_ids)
+    return top_k(doc_ids, scores, k)
+
+
+# ==============================================================================
+# SCORE-AT-A-TIME OVER IMPACT-ORDERED LISTS
+# ==============================================================================
+
+class ImpactSegments:
+    """ Segment-level view of one impact-ordered (posting_codec format 3) list. """
+
+    def __init__(self, buf):
+        self._buf = buf
+        headers, self.offsets = read_impact_segments(buf)
+        self.impacts = headers['impact'].astype(np.int64)
+        self.counts = headers['count'].astype(np.int64)
+        self.n_bytes = headers['n_bytes'].astype(np.int64)
+
+    def __len__(self):
+        return len(self.impacts)
+
+    def doc_ids(self, segment):
+        doc_ids = decode_impact_segment(self._buf, int(self.offsets[segment]), int(self.n_bytes[segment]))
+        record_io(n_postings=len(doc_ids))
+        return doc_ids
+
+
+def score_at_a_time(term_segments, postings_budget):
+    """ Accumulates quantized impacts over the segments of all query terms in
+        decreasing impact order, and stops once `postings_budget` postings have
+        been read (the segment crossing the budget is still read in full).
+
+    Parameters:
+    -----------
+      term_segments: list of ImpactSegments, one per query term occurrence.
+
+    Returns (doc_ids, scores) with doc_ids sorted and integer scores in impact
+    units (multiply by the index impact_scale to get back the real scale).
+    """
+    term_segments = [segments for segments in term_segments if segments is not None and len(segments)]
+    if not term_segments: return EMPTY_DOC_IDS, np.empty(0, dtype=np.int64)
+
+    impacts = np.concatenate([segments.impacts for segments in term_segments])
+    counts = np.concatenate([segments.counts for segments in term_segments])
+    term_of = np.repeat(np.arange(len(term_segments)), [len(segments) for segments in term_segments])
+    segment_of = np.concatenate([np.arange(len(segments)) for segments in term_segments])
+
+    order = np.argsort(-impacts, kind='stable')
+    read_before = np.cumsum(counts[order]) - counts[order]
+    order = order[read_before < postings_budget]
+
+    doc_id_arrays = [term_segments[t].doc_ids(s) for t, s in zip(term_of[order].tolist(), segment_of[order].tolist())]
+    impact_arrays = [np.full(count, impact, dtype=np.int64)
+                     for count, impact in zip(counts[order].tolist(), impacts[order].tolist())]
+    doc_ids, scores = accumulate_scores(doc_id_arrays, impact_arrays)
+    return doc_ids, scores.astype(np.int64)
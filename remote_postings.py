@@ -0,0 +1,156 @@
+import os
+import hashlib
+import posixpath
+import threading
+from collections import OrderedDict
+from inverted_index_gcp import BLOCK_SIZE
+
+# ==============================================================================
+# REMOTE POSTING READS (RANGED REQUESTS + LOCAL BLOCK CACHE)
+# ==============================================================================
+# Serves posting lists straight from the object store, without copying the
+# postings tree first. Posting files are split into CACHE_BLOCK_SIZE blocks;
+# a read fetches only the blocks it is missing, one ranged request per run of
+# adjacent missing blocks, and keeps them in a local disk cache evicted least
+# recently used first. Works with any store of index_sync.py (GCS, or a local
+# directory acting as the bucket).
+
+CACHE_BLOCK_SIZE = 256 * 1024
+
+
+class BlockCache:
+    """ Fixed-size blocks of remote files kept on local disk, up to `max_bytes`.
+
+    Each block is one file, cache_dir/<hash of the object name>/<block number>.
+    The LRU order lives in memory; blocks already on disk are picked up when
+    the cache is opened (oldest modification first).
+    """
+
+    def __init__(self, cache_dir, max_bytes=10 * 1024 ** 3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # block path -> size
+        self._bytes = 0
+        self._counters = dict(hits=0, misses=0, evictions=0)
+        os.makedirs(cache_dir, exist_ok=True)
+        existing = []
+        for dir_path, _, file_names in os.walk(cache_dir):
+            for file_name in file_names:
+                path = os.path.join(dir_path, file_name)
+                if file_name.endswith(".tmp"):
+                    os.remove(path)
+                    continue
+                st = os.stat(path)
+                existing.append((st.st_mtime_ns, path, st.st_size))
+        for _, path, size in sorted(existing):
+            self._entries[path] = size
+            self._bytes += size
+        with self._lock:
+            self._evict()
+
+    def _path(self, name, block):
+        return os.path.join(self.cache_dir, hashlib.sha1(name.encode('utf-8')).hexdigest(), str(block))
+
+    def get(self, name, block):
+        """ Bytes of the block, or None when it is not cached. """
+        path = self._path(name, block)
+        with self._lock:
+            if path not in self._entries:
+                self._counters['misses'] += 1
+                return None
+            self._entries.move_to_end(path)
+            self._counters['hits'] += 1
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:  # evicted meanwhile
+            return None
+
+    def put(self, name, block, data):
+        path = self._path(name, block)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self._lock:
+            self._bytes += len(data) - self._entries.pop(path, 0)
+            self._entries[path] = len(data)
+            self._evict()
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and self._entries:
+            path, size = self._entries.popitem(last=False)
+            self._bytes -= size
+            self._counters['evictions'] += 1
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, blocks=len(self._entries), bytes=self._bytes, max_bytes=self.max_bytes)
+
+
+class RemoteFileReader:
+    """ Reads byte ranges of objects in `store` through a BlockCache.
+        Safe to share between threads; n_requests and bytes_fetched count the
+        ranged requests of all of them.
+    """
+
+    def __init__(self, store, cache, block_size=CACHE_BLOCK_SIZE):
+        self.store = store
+        self.cache = cache
+        self.block_size = block_size
+        self.n_requests = 0
+        self.bytes_fetched = 0
+        self._lock = threading.Lock()
+
+    def stats(self):
+        """ The block cache counters, with the ranged requests and the bytes they fetched. """
+        with self._lock:
+            return dict(self.cache.stats(), requests=self.n_requests, bytes_fetched=self.bytes_fetched)
+
+    def read(self, name, start, n_bytes):
+        """ Up to `n_bytes` of object `name` from offset `start` (fewer at the end of the object). """
+        if n_bytes <= 0: return b''
+        first, last = start // self.block_size, (start + n_bytes - 1) // self.block_size
+        blocks = {block: self.cache.get(name, block) for block in range(first, last + 1)}
+
+        # One ranged request per run of adjacent missing blocks
+        missing = [block for block, data in blocks.items() if data is None]
+        runs = []
+        for block in missing:
+            if runs and runs[-1][1] == block - 1:
+                runs[-1][1] = block
+            else:
+                runs.append([block, block])
+        for run_first, run_last in runs:
+            data = self.store.read_range(name, run_first * self.block_size, (run_last + 1) * self.block_size)
+            with self._lock:
+                self.n_requests += 1
+                self.bytes_fetched += len(data)
+            for block in range(run_first, run_last + 1):
+                chunk = data[(block - run_first) * self.block_size:(block - run_first + 1) * self.block_size]
+                blocks[block] = chunk
+                if chunk:
+                    self.cache.put(name, block, chunk)
+
+        joined = b''.join(blocks[block] for block in range(first, last + 1))
+        offset = start - first * self.block_size
+        return joined[offset:offset + n_bytes]
+
+    def read_locs(self, base_dir, posting_locs, n_bytes):
+        """ `n_bytes` of a posting list starting at its first location. A list
+            continues at offset 0 of the next file once a file is BLOCK_SIZE long.
+        """
+        chunks = []
+        for filename, offset in posting_locs:
+            if n_bytes <= 0: break
+            chunk = self.read(posixpath.join(base_dir, filename), offset, min(n_bytes, BLOCK_SIZE - offset))
+            if not chunk: break
+            chunks.append(chunk)
+            n_bytes -= len(chunk)
+        return b''.join(chunks)
@@ -2,14 +2,31 @@ from flask import Flask, request, jsonify, render_template
 from google.cloud import storage
 import pickle
 import os
-import re
 import collections
+import functools
 import math
-import struct
+import time
+import mmap
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import contextmanager
 import gzip
 import csv
-import nltk
-from nltk.corpus import stopwords
+import json
+import numpy as np
+from posting_codec import (POSTING_FORMAT_TUPLES, TUPLE_SIZE, LIST_HEADER, EMPTY_POSTINGS, DECODED_DTYPE,
+                           decode_tuples, decode_posting_list, read_list_header)
+from ranking import (bm25_idf, bm25_saturation, accumulate_scores, top_k,
+                     PostingBlocks, top_k_block_max, top_k_candidates, ImpactSegments, score_at_a_time)
+from doc_stores import DocStatsStore, DocValueStore, TitleStore
+from lexicon import Lexicon, LEXICON_FILES
+from text_analysis import analyze_query
+from query_cache import ResultCache, PostingCache
+from index_sync import GCSObjectStore, SYNC_STATE_FILE, sync as sync_index
+from remote_postings import BlockCache, RemoteFileReader
+from metrics import Registry, QueryMetrics, Trace, current_trace, use_trace, span, fetch_span, record_io
+from segments import SegmentedIndex, read_segments, maybe_merge
+from bigrams import query_bigrams
 
 # ==============================================================================
 # 1. SETUP & CONFIGURATION
@@ -19,35 +36,77 @@ from nltk.corpus import stopwords
 index_body = None
 index_title = None
 index_anchor = None
-page_rank = {}
-id_to_title = {}
-page_views = {}
+index_body_impact = None  # optional impact-ordered body layout
+index_bigram = None  # optional bigram (phrase) index of body collocations
+doc_stats = None  # DocStatsStore: per-document lengths and body norms
+page_rank = DocValueStore.empty()
+id_to_title = TitleStore.empty()
+page_views = DocValueStore.empty(np.int64)
 # CONFIGURATION
 BUCKET_NAME = 'wikipidia_ir_project'
 KEY_FILE_PATH = 'my_gcp_key.json'
+# Postings read per query from the impact-ordered body index (when it is loaded)
+IMPACT_POSTINGS_BUDGET = 1_000_000
+# Result cache of the search endpoints: total size of the cached JSON responses, and their lifetime
+RESULT_CACHE_BYTES = 64 * 1024 * 1024
+RESULT_CACHE_TTL = 600
+# Decoded posting lists of hot terms kept in memory, and the queries whose terms are preloaded at startup
+# (a JSON file of queries, e.g. queries_train.json, or a query log with one query per line)
+POSTING_CACHE_BYTES = 512 * 1024 * 1024
+# Posting fetches run on a shared I/O pool; one query keeps at most QUERY_FANOUT of them in flight
+IO_POOL_SIZE = 16
+QUERY_FANOUT = 4
+WARMUP_QUERIES_PATH = "queries_train.json"
+# Startup: components load in parallel on STARTUP_WORKERS threads, the lazy ones on first use.
+# The server reports ready (/readyz) once the READY_COMPONENTS are loaded.
+# index_anchor may be made lazy too; /search then loads it on the first query.
+STARTUP_WORKERS = 8
+# Read postings from the bucket with ranged requests instead of local files, keeping
+# fetched blocks in a local disk cache (REMOTE_POSTINGS_POOL concurrent connections)
+REMOTE_POSTINGS = False
+# Before loading, bring the local index files up to date with the bucket's manifest (index_sync.py).
+# Whole-index servers only: the manifest covers postings_gcp/, not the shard folders. The lexicons and
+# document stores are then read from the synced copies under postings_gcp/, not from inverted_indexes_pkls/
+# (also after a sync by the VM startup script, which leaves index_sync.py's state file in the working directory).
+SYNC_INDEX_ON_STARTUP = False
+BLOCK_CACHE_DIR = "posting_block_cache"
+BLOCK_CACHE_BYTES = 20 * 1024 ** 3
+REMOTE_POSTINGS_POOL = 32
+LAZY_COMPONENTS = ("page_views",)
+READY_COMPONENTS = ("index_body",)
+# Requests slower than this are written to SLOW_QUERY_LOG with their per-stage breakdown
+SLOW_QUERY_SECONDS = 0.5
+SLOW_QUERY_LOG = "slow_queries.log"
+# Results per page of /search_title and /search_anchor (parameter k), and the largest page allowed
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+# Delta segments (segments.py) of these indexes are searched alongside the base. Their manifests are
+# checked every SEGMENT_REFRESH_SECONDS; with MERGE_SEGMENTS this process also runs the merge policy.
+SEGMENTED_INDEXES = {"index_body": "postings_gcp/postings_body", "index_title": "postings_gcp/postings_title",
+                     "index_anchor": "postings_gcp/postings_anchor"}
+SEGMENT_REFRESH_SECONDS = 30
+MERGE_SEGMENTS = True
+# Bucket folder of this server's index files: empty for the whole index, "shards/shard_XXX/" for
+# one document shard (serve_shard.py). PageRank and page views are global and never prefixed.
+REMOTE_PREFIX = ""
+# With the bigram index loaded, /search scores the query's indexed adjacent pairs as a phrase signal and,
+# when one of them is in at least k documents (its df), ranks only the documents holding one (BIGRAM_CANDIDATES).
+# That top k is then no longer exact: a document without any query pair is left out however well it scores.
+BIGRAM_CANDIDATES = True
 
 # GCS CLIENT (Global)
 storage_client = None
 bucket = None
+# Whether ./postings_gcp was synced with the manifest (here or by the VM startup script)
+index_synced = False
 
 # ==============================================================================
 # 2. TOKENIZER
 # ==============================================================================
 
-RE_WORD = re.compile(r"""[\#\@\w](['\-]?\w){2,24}""", re.UNICODE)
-
-nltk.download('stopwords', quiet=True)
-english_stopwords = frozenset(stopwords.words('english'))
-corpus_stopwords = ["category", "references", "also", "external", "links",
-                    "may", "first", "see", "history", "people", "one", "two",
-                    "part", "thumb", "including", "second", "following",
-                    "many", "however", "would", "became"]
-all_stopwords = english_stopwords.union(corpus_stopwords)
-
-
 def tokenize(text):
-    tokens = [token.group() for token in RE_WORD.finditer(text.lower())]
-    return [token for token in tokens if token not in all_stopwords]
+    """ Query tokens, analyzed exactly as the indexed text (text_analysis.py). """
+    return list(analyze_query(text))
 
 
 # ==============================================================================
@@ -64,61 +123,97 @@ def init_gcp():
     print(f"✅ Authenticated with GCS bucket: {BUCKET_NAME}")
 
 
-def download_all_bin_files(local_dir="postings_gcp"):
-    """Downloads all .bin files from the bucket to local disk."""
-    if not os.path.exists(local_dir):
-        os.makedirs(local_dir)
+def download_all_bin_files(local_dir="."):
+    """Brings the local copy of the index files up to date with the manifest in
+    the bucket: missing or changed files are downloaded in parallel, resumed
+    and checksum-verified (see index_sync.py)."""
+    return sync_index(GCSObjectStore(bucket), local_dir)
 
-    # List all blobs in the bucket that end with .bin
-    blobs = bucket.list_blobs(prefix="postings_gcp/")
 
-    for blob in blobs:
-        if blob.name.endswith(".bin"):
-            local_path = blob.name  # e.g., postings_gcp/postings_body/0_0.bin
+def index_files(remote_prefix, local_prefix, suffixes):
+    """Prefix of the local copies of the index files remote_prefix + suffix.
+    After a manifest sync these are the synced files next to the postings, so
+    a rebuild never pairs new postings with an old lexicon or store; otherwise
+    each file is downloaded once to local_prefix + suffix."""
+    if index_synced and all(os.path.exists(f"{remote_prefix}{suffix}") for suffix in suffixes):
+        return remote_prefix
+    for suffix in suffixes:
+        download_blob(f"{remote_prefix}{suffix}", f"{local_prefix}{suffix}")
+    return local_prefix
 
-            # Create subdirectories if needed
-            local_folder = os.path.dirname(local_path)
-            if not os.path.exists(local_folder):
-                os.makedirs(local_folder)
-
-            # Download if not exists
-            if not os.path.exists(local_path):
-                print(f"⬇️ Downloading {blob.name}...")
-                blob.download_to_filename(local_path)
-            else:
-                print(f"✅ Found {blob.name}, skipping.")
 
 def download_blob(remote_path, local_filename):
     if os.path.exists(local_filename):
         print(f"   -> Found local {local_filename}, skipping download.")
         return
+    if bucket is None:
+        print(f"   ⚠️ {local_filename} not found and no bucket configured.")
+        return
     print(f"   -> Downloading {remote_path} to {local_filename}...")
     try:
+        # Written under a temporary name, so an interrupted download is never mistaken for the file
         blob = bucket.blob(remote_path)
-        blob.download_to_filename(local_filename)
+        blob.download_to_filename(local_filename + ".part")
+        os.replace(local_filename + ".part", local_filename)
     except Exception as e:
         print(f"   ❌ Failed to download {remote_path}: {e}")
 
 
 def load_index(index_name, remote_folder):
-    local_name = f"inverted_indexes_pkls/{index_name}.pkl"
-    remote_path = f"{remote_folder}/index.pkl"
-    download_blob(remote_path, local_name)
+    """Opens an index with the delta segments of its field (see open_segments)."""
+    return open_segments(load_base_index(index_name, remote_folder), remote_folder)
+
+
+def load_base_index(index_name, remote_folder):
+    """Opens the memory-mapped lexicon of an index, falling back to the pickled
+    InvertedIndex of builds that predate it."""
+    local_dir = f"inverted_indexes_pkls/{index_name}_lexicon"
+    os.makedirs(local_dir, exist_ok=True)
+    lexicon_dir = index_files(f"{REMOTE_PREFIX}{remote_folder}/lexicon/", f"{local_dir}/", LEXICON_FILES)
+    if all(os.path.exists(f"{lexicon_dir}{file_name}") for file_name in LEXICON_FILES):
+        print(f"   -> Mapping {lexicon_dir}...")
+        return Lexicon(lexicon_dir)
+
+    local_name = index_files(f"{REMOTE_PREFIX}{remote_folder}/index.pkl",
+                             f"inverted_indexes_pkls/{index_name}.pkl", ("",))
     if not os.path.exists(local_name): return None
     print(f"   -> Loading {local_name}...")
     with open(local_name, 'rb') as f:
         return pickle.load(f)
 
 
+def open_segments(base, remote_folder):
+    """`base` as a SegmentedIndex when its field has delta segments. Segments
+    are written locally, so they are always read from local files."""
+    index = SegmentedIndex.open(base, remote_folder)
+    if index is not base:
+        for segment in index.segments:
+            posting_readers.setdefault(segment.dir, MultiFileReader(segment.dir))
+            segment_folders.add(segment.dir)
+    return index
+
+
+def load_doc_values(name, remote_folder):
+    """Memory-maps a DocValueStore (None when it was not converted yet)."""
+    prefix = index_files(f"{remote_folder}/{name}", f"inverted_indexes_pkls/{name}", ("_ids.npy", "_values.npy"))
+    if not (os.path.exists(f"{prefix}_ids.npy") and os.path.exists(f"{prefix}_values.npy")):
+        return None
+    print(f"   -> Mapping {prefix}_ids.npy / {prefix}_values.npy...")
+    return DocValueStore.load(prefix)
+
+
 def load_pagerank():
-    """Loads PageRank from the CSV.GZ file."""
+    """Maps the PageRank store, falling back to parsing the CSV.GZ file."""
+    store = load_doc_values("pagerank", "postings_gcp/pagerank")
+    if store is not None: return store
+
     local_name = "inverted_indexes_pkls/pagerank.csv.gz"
     # Update this path if it changes in your bucket
     remote_path = "pr/part-00000-c5e092f9-9241-410d-955d-ec78de539def-c000.csv.gz"
 
     download_blob(remote_path, local_name)
 
-    pr_dict = {}
+    pr_ids, pr_values = [], []
     if os.path.exists(local_name):
         print("   -> Processing PageRank CSV...")
         try:
@@ -127,23 +222,34 @@ def load_pagerank():
                 reader = csv.reader(f)
                 for row in reader:
                     if len(row) >= 2:
-                        pr_dict[int(row[0])] = float(row[1])
+                        pr_ids.append(int(row[0]))
+                        pr_values.append(float(row[1]))
         except Exception as e:
             print(f"   ❌ Error reading PageRank: {e}")
-    return pr_dict
+    return DocValueStore.from_pairs(pr_ids, pr_values)
 
 def load_id_map():
-    local_name = "inverted_indexes_pkls/id_to_title.pkl"
-    remote_path = "postings_gcp/id_to_title/id_to_title.pkl"
-    download_blob(remote_path, local_name)
+    """Maps the title store, falling back to the pickled id_to_title dict."""
+    suffixes = ("_ids.npy", "_offsets.npy", "_blob.bin")
+    prefix = index_files(f"{REMOTE_PREFIX}postings_gcp/titles/titles", "inverted_indexes_pkls/titles", suffixes)
+    if all(os.path.exists(f"{prefix}{suffix}") for suffix in suffixes):
+        print(f"   -> Mapping {prefix}_*...")
+        return TitleStore.load(prefix)
+
+    local_name = index_files(f"{REMOTE_PREFIX}postings_gcp/id_to_title/id_to_title.pkl",
+                             "inverted_indexes_pkls/id_to_title.pkl", ("",))
     if os.path.exists(local_name):
         print(f"   -> Loading {local_name}...")
         with open(local_name, 'rb') as f:
-            return pickle.load(f)
-    return {}
+            id_to_title_dict = pickle.load(f)
+        return TitleStore.from_pairs(list(id_to_title_dict.keys()), list(id_to_title_dict.values()))
+    return TitleStore.empty()
 
 def load_pageviews():
-    """Loads PageViews from a Pickle file."""
+    """Maps the PageViews store, falling back to the pickled dict."""
+    store = load_doc_values("pageviews", "postings_gcp/pageviews")
+    if store is not None: return store
+
     local_name = "inverted_indexes_pkls/pageviews_index.pkl"
     # Adjust this remote path to match where you eventually put the file in your bucket
     remote_path = "postings_gcp/pageviews/pageviews_index.pkl"
@@ -154,114 +260,600 @@ def load_pageviews():
         print(f"   -> Loading {local_name}...")
         try:
             with open(local_name, 'rb') as f:
-                return pickle.load(f)
+                pv_dict = pickle.load(f)
+            return DocValueStore.from_pairs(list(pv_dict.keys()), list(pv_dict.values()), np.int64)
         except Exception as e:
             print(f"   ❌ Error reading PageViews pkl: {e}")
-            return {}
+            return DocValueStore.empty(np.int64)
     else:
-        print("   ⚠️ PageViews file not found. Returning empty dictionary.")
-        return {}
+        print("   ⚠️ PageViews file not found. Returning an empty store.")
+        return DocValueStore.empty(np.int64)
+
+def load_doc_stats():
+    """Memory-maps the per-document statistics store (None when it was not built)."""
+    local_name = index_files(f"{REMOTE_PREFIX}postings_gcp/doc_stats/doc_stats.npy",
+                             "inverted_indexes_pkls/doc_stats.npy", ("",))
+    if not os.path.exists(local_name): return None
+    print(f"   -> Mapping {local_name}...")
+    return DocStatsStore.load(local_name)
 # ==============================================================================
-# 4. REMOTE POSTING LIST READER (FIXED)
+# 4. POSTING LIST READER (MEMORY-MAPPED)
 # ==============================================================================
 
 class MultiFileReader:
-    def __init__(self, base_dir):
-        self.base_dir = base_dir  # e.g., "postings_gcp"
-
-    def read(self, posting_locs, df):
-        if not posting_locs: return []
-        b = []
-
-        # OPEN THE FILE LOCALLY
+    """ Reads posting lists from local .bin files.
+
+    Every file is memory-mapped the first time it is touched and the mapping is
+    kept for the life of the process, so a posting list read is a slice of the
+    page cache rather than an open/seek/read. Lists are returned as structured
+    NumPy arrays (fields `doc_id` and `tf`); for the 6-byte tuple format they
+    view the mapping directly.
+
+    With a RemoteFileReader (`remote`) the bytes come from the bucket instead,
+    through its local block cache, under `remote_prefix` (REMOTE_PREFIX).
+    """
+
+    def __init__(self, base_dir, remote=None, remote_prefix=""):
+        self.base_dir = base_dir  # e.g., "postings_gcp/postings_body"
+        self.remote = remote
+        self.remote_dir = f"{remote_prefix}{base_dir}"
+        self._mmaps = {}
+        self._lock = threading.Lock()
+
+    def _get_mmap(self, filename):
+        mm = self._mmaps.get(filename)
+        if mm is not None:
+            return mm
+        with self._lock:
+            mm = self._mmaps.get(filename)
+            if mm is None:
+                file_path = os.path.join(self.base_dir, filename)
+                with open(file_path, 'rb') as f:
+                    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._mmaps[filename] = mm
+        return mm
+
+    def close(self):
+        """ Unmaps the files. A mapping still viewed by a posting array (e.g. in
+            the posting cache) stays alive until that array is dropped.
+        """
+        with self._lock:
+            mmaps, self._mmaps = self._mmaps, {}
+        for mm in mmaps.values():
+            try:
+                mm.close()
+            except BufferError:
+                pass
+
+    def read_bytes(self, posting_locs, n_bytes):
+        """ Returns up to `n_bytes` starting at the first location. A list that
+            spans several files is joined, otherwise the result is a memoryview
+            of the mapped file.
+        """
+        if self.remote is not None:
+            return self.remote.read_locs(self.remote_dir, posting_locs, n_bytes)
+        chunks = []
         for filename, offset in posting_locs:
-            # Construct local path, e.g., "postings_gcp/postings_body/0_0.bin"
-            file_path = os.path.join(self.base_dir, filename)
-
+            if n_bytes <= 0: break
             try:
-                with open(file_path, 'rb') as f:
-                    f.seek(offset)
-                    # 6 bytes per posting (4 for doc_id, 2 for tf)
-                    n_bytes = df * 6
-                    data_bytes = f.read(n_bytes)
-
-                    # Process bytes
-                    for i in range(0, len(data_bytes), 6):
-                        doc_id = struct.unpack("!I", data_bytes[i:i + 4])[0]
-                        tf = struct.unpack("!H", data_bytes[i + 4:i + 6])[0]
-                        b.append((doc_id, tf))
+                mm = self._get_mmap(filename)
             except FileNotFoundError:
-                print(f"❌ File not found: {file_path}")
-            except Exception as e:
-                print(f"❌ Error reading {file_path}: {e}")
+                print(f"❌ File not found: {os.path.join(self.base_dir, filename)}")
+                break
+            except (OSError, ValueError) as e:
+                print(f"❌ Error mapping {os.path.join(self.base_dir, filename)}: {e}")
+                break
+
+            chunk = memoryview(mm)[offset:offset + n_bytes]
+            if len(chunk) == 0: break
+            chunks.append(chunk)
+            n_bytes -= len(chunk)
+
+        if not chunks: return b''
+        if len(chunks) == 1: return chunks[0]
+        return b''.join(chunks)
+
+    def read_list_bytes(self, posting_locs, df, posting_format=POSTING_FORMAT_TUPLES):
+        """ Returns the bytes of a whole posting list of `df` postings. """
+        if posting_format == POSTING_FORMAT_TUPLES:
+            buf = self.read_bytes(posting_locs, df * TUPLE_SIZE)
+            record_io(n_bytes=len(buf))
+            return buf
+        header = self.read_bytes(posting_locs, LIST_HEADER.size)
+        if len(header) < LIST_HEADER.size: return b''
+        _, _, n_bytes = read_list_header(header)
+        buf = self.read_bytes(posting_locs, n_bytes)
+        record_io(n_bytes=len(buf))
+        return buf
+
+    def read(self, posting_locs, df, posting_format=POSTING_FORMAT_TUPLES):
+        """ Returns the postings stored at `posting_locs` as a structured array
+            with `doc_id` and `tf` fields.
+        """
+        if not posting_locs or df <= 0: return EMPTY_POSTINGS
+        buf = self.read_list_bytes(posting_locs, df, posting_format)
+        if posting_format == POSTING_FORMAT_TUPLES:
+            postings = decode_tuples(buf, df)
+        elif len(buf) == 0:
+            return EMPTY_POSTINGS
+        else:
+            postings = decode_posting_list(buf, posting_format)
+        record_io(n_postings=len(postings))
+        return postings
+
+    def read_blocks(self, posting_locs, df, posting_format=POSTING_FORMAT_TUPLES, max_tf=None):
+        """ Returns the list as PostingBlocks for the top-k processor, without
+            decoding any postings of the block format.
+        """
+        if posting_format == POSTING_FORMAT_TUPLES:
+            return PostingBlocks.from_postings(self.read(posting_locs, df, posting_format), max_tf)
+        buf = self.read_list_bytes(posting_locs, df, posting_format)
+        if len(buf) == 0: return None
+        return PostingBlocks.from_blocks_buffer(buf)
+
+    def read_impacts(self, posting_locs, df, posting_format):
+        """ Returns an impact-ordered list as ImpactSegments. """
+        buf = self.read_list_bytes(posting_locs, df, posting_format)
+        if len(buf) == 0: return None
+        return ImpactSegments(buf)
+
+
+# One reader per postings folder, shared by all requests.
+posting_readers = {}
+# Folders of the delta segments with a reader, and the readers of segments no
+# longer searched, closed on the next refresh_segments (after queries that
+# started on the old segments are done)
+segment_folders = set()
+retired_readers = []
+
+
+remote_reader = None
+_remote_reader_lock = threading.Lock()
+
+
+def get_remote_reader():
+    global remote_reader
+    with _remote_reader_lock:
+        if remote_reader is None:
+            store = GCSObjectStore.from_name(BUCKET_NAME, KEY_FILE_PATH, pool_size=REMOTE_POSTINGS_POOL)
+            remote_reader = RemoteFileReader(store, BlockCache(BLOCK_CACHE_DIR, BLOCK_CACHE_BYTES))
+    return remote_reader
+
+
+def get_reader(remote_folder):
+    reader = posting_readers.get(remote_folder)
+    if reader is None:
+        remote = get_remote_reader() if REMOTE_POSTINGS else None
+        reader = posting_readers.setdefault(remote_folder, MultiFileReader(remote_folder, remote, REMOTE_PREFIX))
+    return reader
+
+
+posting_cache = PostingCache(POSTING_CACHE_BYTES)
+
+
+def _max_tf(inverted_index, token):
+    # Indexes built before max_tf was recorded (or a lexicon's 0 = unknown)
+    # bound legacy lists by scanning them.
+    return getattr(inverted_index, 'max_tf', {}).get(token) or None
+
+
+def posting_cache_key(inverted_index, token, remote_folder):
+    """ Posting cache key of `token` in `inverted_index`. A folder can serve
+        another index after a rebuild or a segment swap, so the key holds the
+        index itself; its cached entries keep it alive, so its id is not reused.
+    """
+    return remote_folder, id(inverted_index), token
+
+
+def cached_postings(inverted_index, token, remote_folder):
+    """ Returns (postings, block headers) of `token` from the posting cache.
+        On a miss the list is decoded in full and cached if the cache admits
+        it (a term looked up often enough); otherwise returns None and the
+        caller reads the list directly.
+    """
+    key = posting_cache_key(inverted_index, token, remote_folder)
+    entry = posting_cache.get(key)
+    if entry is not None: return entry[:2]
+
+    df = inverted_index.df.get(token, 0)
+    if df <= 0 or not posting_cache.admits(key, df * DECODED_DTYPE.itemsize): return None
+    posting_locs = inverted_index.posting_locs.get(token, [])
+    reader = get_reader(remote_folder)
+    blocks = reader.read_blocks(posting_locs, df, inverted_index.posting_format, _max_tf(inverted_index, token))
+    if blocks is None: return None
+    postings = reader.read(posting_locs, df, inverted_index.posting_format).astype(DECODED_DTYPE, copy=False)
+    postings.flags.writeable = False
+    headers = blocks.headers()
+    posting_cache.put(key, (postings, headers, inverted_index), postings.nbytes + sum(h.nbytes for h in headers))
+    return postings, headers
 
-        return b
 
-# Updated get_posting_list
 def get_posting_list(inverted_index, token, remote_folder):
-    if not inverted_index: return []
+    """ Returns the posting list of `token` as a structured array with `doc_id`
+        and `tf` fields (empty when the term is unknown).
+    """
+    if not inverted_index: return EMPTY_POSTINGS
+    if isinstance(inverted_index, SegmentedIndex):
+        return inverted_index.merge_postings([get_posting_list(part, token, folder)
+                                              for part, folder in segment_parts(inverted_index, remote_folder)])
     posting_locs = inverted_index.posting_locs.get(token, [])
-    if not posting_locs: return []
+    if not posting_locs: return EMPTY_POSTINGS
 
-    df = inverted_index.df.get(token, 0)
+    entry = cached_postings(inverted_index, token, remote_folder)
+    if entry is not None: return entry[0]
 
-    # --- PRUNING ---
-    MAX_DOCS_TO_READ = 15000
-    if df > MAX_DOCS_TO_READ:
-        df = MAX_DOCS_TO_READ
+    df = inverted_index.df.get(token, 0)
 
-    # --- FIX 2: USE remote_folder AS THE BASE DIR ---
     # The files are downloaded to paths like 'postings_gcp/postings_body'
-    reader = MultiFileReader(base_dir=remote_folder)
-    return reader.read(posting_locs, df)
+    return get_reader(remote_folder).read(posting_locs, df, inverted_index.posting_format)
+
+
+def get_posting_blocks(inverted_index, token, remote_folder):
+    """ Returns the posting list of `token` as PostingBlocks (None when unknown).
+        A SegmentedIndex gives a list: the PostingBlocks of every part holding
+        the term, each leaving out the documents newer parts replace or delete.
+    """
+    if not inverted_index: return None
+    if isinstance(inverted_index, SegmentedIndex):
+        parts = [get_posting_blocks(part, token, folder)
+                 for part, folder in segment_parts(inverted_index, remote_folder)]
+        return [blocks.exclude(inverted_index.deleted_after(i)) for i, blocks in enumerate(parts)
+                if blocks is not None]
+    posting_locs = inverted_index.posting_locs.get(token, [])
+    if not posting_locs: return None
+
+    entry = cached_postings(inverted_index, token, remote_folder)
+    if entry is not None: return PostingBlocks.from_decoded(entry[1], entry[0])
+
+    df = inverted_index.df.get(token, 0)
+    return get_reader(remote_folder).read_blocks(posting_locs, df, inverted_index.posting_format,
+                                                 _max_tf(inverted_index, token))
+
+
+def segment_parts(inverted_index, remote_folder):
+    """ (index, posting folder) of the base and of every delta segment of a SegmentedIndex. """
+    return [(inverted_index.base, remote_folder)] + [(segment.index, segment.dir)
+                                                     for segment in inverted_index.segments]
+
+
+def term_parts(blocks):
+    """ The PostingBlocks of one fetched body term (several for a SegmentedIndex). """
+    if blocks is None: return []
+    return blocks if isinstance(blocks, list) else [blocks]
+
+
+def get_impact_segments(inverted_index, token, remote_folder):
+    """ Returns the impact-ordered list of `token` as ImpactSegments (None when unknown). """
+    if not inverted_index: return None
+    posting_locs = inverted_index.posting_locs.get(token, [])
+    if not posting_locs: return None
+
+    df = inverted_index.df.get(token, 0)
+    return get_reader(remote_folder).read_impacts(posting_locs, df, inverted_index.posting_format)
+
+
+io_pool = ThreadPoolExecutor(IO_POOL_SIZE, thread_name_prefix="postings-io")
+
+
+# Postings folder of every field
+POSTING_FOLDERS = {
+    "body": "postings_gcp/postings_body",
+    "title": "postings_gcp/postings_title",
+    "anchor": "postings_gcp/postings_anchor",
+    "body_impact": "postings_gcp/postings_body_impact",
+    "bigram": "postings_gcp/postings_bigram",
+}
+
+
+def fetch_field(remote_folder):
+    """ The field of a postings folder, the fetch label of the metrics. The
+        folders of delta segments count as their field, so the labels stay a
+        fixed set however many segments are opened.
+    """
+    for field, folder in POSTING_FOLDERS.items():
+        if remote_folder == folder or remote_folder.startswith(folder + "/"):
+            return field
+    return "other"
+
+
+def traced_fetch(trace, fetch_fn, inverted_index, token, remote_folder):
+    """ Runs one posting fetch as part of `trace` (on any thread), recording
+        its time, bytes read and postings decoded under its field.
+    """
+    with use_trace(trace), fetch_span(fetch_field(remote_folder), token):
+        return fetch_fn(inverted_index, token, remote_folder)
+
+
+def fetch_postings(fetches, fanout=QUERY_FANOUT):
+    """ Runs the posting fetches of one query concurrently on the shared I/O pool.
+
+    Parameters:
+    -----------
+      fetches: list of (fetch_fn, inverted_index, token, remote_folder), with
+               fetch_fn one of get_posting_list / get_posting_blocks / get_impact_segments.
+      fanout: most fetches of this query running at once, so a long query
+              leaves pool threads to the others.
+
+    Identical fetches (a repeated query term) run once, and inside
+    shared_postings() once per batch. Returns the results in the order of `fetches`.
+    """
+    memo = getattr(_shared, 'postings', None)
+    unique = {}
+    for fetch in fetches:
+        key = (fetch[0], id(fetch[1]), fetch[2], fetch[3])
+        if memo is None or key not in memo:
+            unique.setdefault(key, fetch)
+    keys = list(unique)
+    trace = current_trace()
+    with span("fetch"):
+        done = _run_fetches(unique, keys, trace, fanout)
+    if memo is not None:
+        memo.update(done)
+        done = memo
+    return [done[(fetch[0], id(fetch[1]), fetch[2], fetch[3])] for fetch in fetches]
+
+
+def _run_fetches(unique, keys, trace, fanout):
+    if len(keys) <= 1 or fanout <= 1:
+        done = {key: traced_fetch(trace, *unique[key]) for key in keys}
+    else:
+        done, pending, waiting = {}, {}, iter(keys)
+
+        def submit_next():
+            key = next(waiting, None)
+            if key is not None:
+                pending[io_pool.submit(traced_fetch, trace, *unique[key])] = key
+
+        for _ in range(fanout):
+            submit_next()
+        while pending:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                done[pending.pop(future)] = future.result()
+                submit_next()
+    return done
+
+
+_shared = threading.local()
+
+
+@contextmanager
+def shared_postings():
+    """ Within the block, fetch_postings on this thread reads every posting
+        list once and hands it to all later queries (batch search).
+    """
+    _shared.postings = {}
+    try:
+        yield
+    finally:
+        _shared.postings = None
+
+
+def posting_fetches(field, query_tokens, inverted_index=None):
+    """ The fetch_postings requests of one field for the query terms. Fields:
+        title, anchor, body (blocks for the top-k processor), body_impact and
+        bigram (terms "w1 w2"). `inverted_index` replaces the loaded index of
+        the field (a query's snapshot of it).
+    """
+    fetch_fn, loaded_index = {
+        "title": (get_posting_list, index_title),
+        "anchor": (get_posting_list, index_anchor),
+        "body": (get_posting_blocks, index_body),
+        "body_impact": (get_impact_segments, index_body_impact),
+        "bigram": (get_posting_list, index_bigram),
+    }[field]
+    if inverted_index is None: inverted_index = loaded_index
+    remote_folder = POSTING_FOLDERS[field]
+    return [(fetch_fn, inverted_index, token, remote_folder) for token in query_tokens]
 
 # ==============================================================================
-# 5. FLASK APP
+# 5. SCORING ENGINE (VECTORIZED)
 # ==============================================================================
 
-class MyFlaskApp(Flask):
-    # Inside class MyFlaskApp(Flask):
+def pagerank_boost(doc_ids):
+    """ log10(PageRank + 1) for every doc id (0 for documents without a PageRank). """
+    return np.log10(np.maximum(page_rank.lookup(doc_ids, 0.0), 0) + 1)
 
-    def run(self, host=None, port=None, debug=None, **options):
-        print("🚀 Initializing Server...")
-        init_gcp()
 
-        global index_body, index_title, index_anchor, page_rank, id_to_title, page_views
+def pagerank_boost_bound():
+    """ Largest possible pagerank_boost (the store caches its max). """
+    return math.log10(max(page_rank.max(), 0) + 1)
 
-        # --- FIX 1: ADD THIS LINE ---
-        print("⬇️ Downloading Postings to Local Disk...")
-     #   download_all_bin_files()
-        # ----------------------------
 
-        print("LOADING DATA...")
-        index_body = load_index("index_body", "postings_gcp/postings_body")
-        index_title = load_index("index_title", "postings_gcp/postings_title")
-        index_anchor = load_index("index_anchor", "postings_gcp/postings_anchor")
-        page_rank = load_pagerank()
-        page_views = load_pageviews()
-        id_to_title = load_id_map()
-        print("✅ Data Loaded. Server Ready!")
-        super(MyFlaskApp, self).run(host=host, port=port, debug=debug, **options)
+def parse_doc_ids(wiki_ids):
+    """ Request ids as an int64 array; ids that are not integers become -1 (unknown). """
+    try:
+        doc_ids = np.asarray(wiki_ids, dtype=np.int64)
+        if doc_ids.ndim == 1: return doc_ids
+    except (ValueError, TypeError, OverflowError):
+        pass
+    return np.array([_parse_doc_id(doc_id) for doc_id in wiki_ids], dtype=np.int64)
 
-app = MyFlaskApp(__name__)
-app.config['JSONIFY_PRETTYPRINT_REGULAR'] = False
 
+def _parse_doc_id(doc_id):
+    try:
+        return int(doc_id)
+    except (ValueError, TypeError, OverflowError):
+        return -1
+
+
+class CorpusStats:
+    """ Body statistics of the whole collection: n_docs, avgdl and the df of
+        the query terms. A shard server scores with the ones the shard
+        coordinator sends instead of its own lexicon's, so idf and length
+        normalization agree across shards.
+    """
+
+    def __init__(self, n_docs, avgdl, df):
+        self.n_docs = n_docs
+        self.avgdl = avgdl
+        self.df = df
+
+    @classmethod
+    def from_json(cls, data):
+        """ From {"n_docs": ..., "avgdl": ..., "df": {term: df}}; raises ValueError when malformed. """
+        try:
+            n_docs = None if data.get("n_docs") is None else int(data["n_docs"])
+            return cls(n_docs, data.get("avgdl"), {str(t): int(df) for t, df in data["df"].items()})
+        except (KeyError, TypeError, ValueError, AttributeError):
+            raise ValueError('stats must be {"n_docs": int, "avgdl": float, "df": {term: int}}')
 
 
-@app.route("/search")
-def search():
-    ''' Returns list of Wiki IDs (Strings) using BM25 for Body, and simple weights for Title/Anchor '''
-    res = []
-    query = request.args.get('query', '')
-    if len(query) == 0: return jsonify(res)
+_corpus = threading.local()
 
-    print(f"\n--- SEARCHING: '{query}' ---")
-    query_tokens = tokenize(query)
-    scores = collections.Counter()
+
+@contextmanager
+def corpus_stats(stats):
+    """ Within the block, this thread scores the body with `stats` (a CorpusStats). """
+    _corpus.stats = stats
+    try:
+        yield
+    finally:
+        _corpus.stats = None
+
+
+def body_stats(body_index=None):
+    """ The statistics the body is scored with: inside corpus_stats() the
+        collection's, otherwise those of `body_index` (default: the loaded
+        body index): n_docs, avgdl, df.
+    """
+    stats = getattr(_corpus, 'stats', None)
+    if stats is not None: return stats
+    return index_body if body_index is None else body_index
+
+
+def body_bm25_term(blocks, weight, k1, b, index):
+    """ A block-max term scoring the body with BM25. Length normalization
+        (b > 0) reads the document lengths from doc_stats (and the delta
+        segments of `index`, the query's body index), and bounds a block by
+        its max tf in the shortest document of the corpus.
+    """
+    if b == 0:
+        return blocks, lambda tf, doc_ids: bm25_saturation(tf, k1) * weight
+    segmented = isinstance(index, SegmentedIndex)
+    avgdl = body_stats(index).avgdl or doc_stats.mean('body_len')
+    min_len = doc_stats.min_positive('body_len')
+    if segmented and index.min_length():
+        min_len = min(min_len, index.min_length())
+    shortest = 1 - b + b * min_len / avgdl
+
+    def score(tf, doc_ids):
+        dl = doc_stats.column('body_len', doc_ids, default=avgdl)
+        if segmented: dl = index.doc_lengths(doc_ids, dl)
+        return bm25_saturation(tf, k1, 1 - b + b * dl / avgdl) * weight
+
+    return blocks, score, lambda tf: bm25_saturation(tf, k1, shortest) * weight
+
+
+def body_cosine_term(blocks, idf, n_docs, index):
+    """ A block-max term scoring the body with TF-IDF divided by the document's
+        TF-IDF norm (cosine, up to the query norm which is the same for every document).
+        Documents of delta segments (of `index`, the query's body index) use
+        norms computed with `n_docs`.
+    """
+    shortest = doc_stats.min_positive('body_norm')
+    if not isinstance(index, SegmentedIndex):
+        score = lambda tf, doc_ids: tf * idf / doc_stats.column('body_norm', doc_ids, default=shortest)
+        return blocks, score, lambda tf: tf * idf / shortest
+    if index.min_norm(n_docs):
+        shortest = min(shortest, index.min_norm(n_docs))
+
+    def score(tf, doc_ids):
+        norms = index.doc_norms(doc_ids, doc_stats.column('body_norm', doc_ids, default=shortest), n_docs)
+        return tf * idf / norms
+
+    return blocks, score, lambda tf: tf * idf / shortest
+
+
+def count_top_k(posting_lists, k=PAGE_SIZE, cursor=None):
+    """ (doc_ids, counts) of the k documents found in the most posting lists,
+        ties by ascending doc id, with a partial sort. With `cursor` (a doc id
+        of an earlier page, usually its last one) the page starts right after
+        that document, so pages stay stable however deep they go; an unknown
+        cursor gives no results.
+    """
+    doc_ids, scores = accumulate_scores([postings['doc_id'] for postings in posting_lists],
+                                        [np.ones(len(postings)) for postings in posting_lists])
+    if cursor is not None:
+        i = np.searchsorted(doc_ids, cursor)
+        if i == len(doc_ids) or doc_ids[i] != cursor: return doc_ids[:0], scores[:0]
+        after = (scores < scores[i]) | ((scores == scores[i]) & (doc_ids > cursor))
+        doc_ids, scores = doc_ids[after], scores[after]
+    return top_k(doc_ids, scores, k)
+
+
+def parse_page_params(k, cursor):
+    """ (k, cursor) of the `k` and `cursor` query parameters (strings or None).
+        Raises ValueError on a malformed value.
+    """
+    try:
+        k = PAGE_SIZE if k is None else int(k)
+        cursor = None if cursor in (None, "") else int(cursor)
+    except ValueError:
+        raise ValueError("k and cursor must be integers")
+    if not 1 <= k <= MAX_PAGE_SIZE:
+        raise ValueError(f"k must be between 1 and {MAX_PAGE_SIZE}")
+    return k, cursor
+
+
+def to_results(doc_ids):
+    """ (wiki_id, title) pairs, with the titles resolved in one batch lookup. """
+    with span("results"):
+        titles = id_to_title.titles(doc_ids, "N/A")
+        if isinstance(index_title, SegmentedIndex):
+            titles = index_title.doc_titles(doc_ids, titles)
+        return list(zip(map(str, doc_ids.tolist()), titles))
+
+# ==============================================================================
+# 6. SEARCH FUNCTIONS
+# ==============================================================================
+# Each endpoint's ranking, from the query tokens to the (wiki_id, title) results.
+
+# Components each search reads (see ensure_loaded)
+SEARCH_COMPONENTS = ("index_body", "index_title", "index_anchor", "index_body_impact", "index_bigram", "doc_stats",
+                     "page_rank", "id_to_title")
+BODY_COMPONENTS = ("index_body", "doc_stats", "id_to_title")
+TITLE_COMPONENTS = ("index_title", "id_to_title")
+ANCHOR_COMPONENTS = ("index_anchor", "id_to_title")
+
+def use_impact_layout(body_index=None):
+    """ The impact-ordered body layout is used when loaded, unless the body
+        index (default: the loaded one) has delta segments (they are not in
+        the impact layout).
+    """
+    if body_index is None: body_index = index_body
+    return index_body_impact is not None and not isinstance(body_index, SegmentedIndex)
+
+
+def search_fetches(query_tokens, impact_layout=None, body_index=None):
+    """ Posting lists read by search_core: title, anchor and body lists of every
+        term, then the bigram lists of the indexed adjacent pairs.
+    """
+    if body_index is None: body_index = index_body
+    if impact_layout is None: impact_layout = use_impact_layout(body_index)
+    body = (posting_fetches("body_impact", query_tokens) if impact_layout
+            else posting_fetches("body", query_tokens, body_index))
+    return (posting_fetches("title", query_tokens) + posting_fetches("anchor", query_tokens) + body
+            + posting_fetches("bigram", query_bigrams(query_tokens, index_bigram)))
+
+
+def search_core(query_tokens, k=100):
+    ''' Returns list of (Wiki ID, title) using BM25 for Body, and simple weights for Title/Anchor '''
+    top_ids, _ = rank_core(query_tokens, k)
+    return to_results(top_ids)
+
+
+def rank_core(query_tokens, k=100):
+    ''' (doc_ids, scores) of the top k of search_core '''
+    ensure_loaded(*SEARCH_COMPONENTS)
+    # One body index for the whole query: refresh_segments may swap the global meanwhile
+    body_index = index_body
+    doc_id_arrays, score_arrays = [], []
+    stats = body_stats(body_index)
 
     # --- CONFIGURATION ---
-    # N: Total number of documents in corpus (approximate from PageRank)
-    N = len(page_rank) if page_rank else 6348910
+    # N: Total number of documents in corpus (from the index, else approximate from PageRank)
+    N = stats.n_docs or (len(page_rank) if page_rank else 6348910)
 
     # Weights (Adjusted W_BODY up because BM25 scores are smaller than raw TF)
     W_TITLE = 0.1
@@ -272,134 +864,615 @@ def search():
 
     W_PR = 0.01
 
+    # Adjacent query pairs found in the bigram index (BM25 of the phrase)
+    W_BIGRAM = 10.0
+
     # BM25 Constants
     k1 = 1.2
-    b = 0  # No length normalization (we don't have doc lengths loaded)
-
-    def calc_idf(doc_freq, total_docs):
-        return math.log(1 + (total_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+    b = 0.75 if doc_stats is not None else 0  # Length normalization needs the doc lengths
 
-    def bm25_saturation(tf):
-        # Simplified BM25 with b=0: (TF * (k1 + 1)) / (TF + k1)
-        return (tf * (k1 + 1)) / (tf + k1)
+    # 0. Fetch the title, anchor and body lists of every term (and the bigram lists) concurrently
+    n_tokens = len(query_tokens)
+    impact_layout = use_impact_layout(body_index)
+    bigrams = query_bigrams(query_tokens, index_bigram)
+    fetched = fetch_postings(search_fetches(query_tokens, impact_layout, body_index))
+    title_lists, anchor_lists = fetched[:n_tokens], fetched[n_tokens:2 * n_tokens]
+    body_lists, bigram_lists = fetched[2 * n_tokens:3 * n_tokens], fetched[3 * n_tokens:]
 
     # 1. Title (Simple Weight - As requested)
-    for token in query_tokens:
-        for doc_id, tf in get_posting_list(index_title, token, "postings_gcp/postings_title"):
-            scores[doc_id] += (1 * W_TITLE)
+    for postings in title_lists:
+        doc_id_arrays.append(postings['doc_id'])
+        score_arrays.append(np.full(len(postings), 1 * W_TITLE))
 
     # 2. Anchor (Simple Weight - As requested)
-    for token in query_tokens:
-        for doc_id, tf in get_posting_list(index_anchor, token, "postings_gcp/postings_anchor"):
-            scores[doc_id] += (tf * W_ANCHOR)
+    for postings in anchor_lists:
+        doc_id_arrays.append(postings['doc_id'])
+        score_arrays.append(postings['tf'] * W_ANCHOR)
+
+    # 2b. Bigrams (BM25 of the phrase, b=0). The bigram index is not updated by
+    # delta segments: documents deleted or replaced since the build are left out.
+    candidate_arrays, max_bigram_df = [], 0
+    for bigram, postings in zip(bigrams, bigram_lists):
+        if isinstance(body_index, SegmentedIndex):
+            postings = body_index.live_postings(0, postings)
+        df = stats.df.get(bigram) or index_bigram.df[bigram]
+        doc_id_arrays.append(postings['doc_id'])
+        score_arrays.append(bm25_saturation(postings['tf'], k1) * bm25_idf(df, N) * W_BIGRAM)
+        candidate_arrays.append(postings['doc_id'])
+        max_bigram_df = max(max_bigram_df, df)
+
+    extra_ids, extra_scores = accumulate_scores(doc_id_arrays, score_arrays)
 
     # 3. Body (BM25)
-    for token in query_tokens:
-        # Get Document Frequency (DF) for IDF calculation
-        df = index_body.df.get(token, 0)
-        if df == 0: continue
+    if impact_layout:
+        # Impact-ordered layout: precomputed BM25 impacts, read highest first
+        # until the postings budget is spent.
+        body_ids, body_impacts = score_at_a_time(body_lists, IMPACT_POSTINGS_BUDGET)
+        doc_ids, scores = accumulate_scores(
+            [extra_ids, body_ids], [extra_scores, body_impacts * (index_body_impact.impact_scale * W_BODY)])
+
+        # 4. PageRank Boost
+        scores += pagerank_boost(doc_ids) * W_PR
+        return top_k(doc_ids, scores, k)
+    else:
+        # Block-max pruning against the top 100
+        body_terms = []
+        for token, blocks in zip(query_tokens, body_lists):
+            # Get Document Frequency (DF) for IDF calculation
+            df = stats.df.get(token, 0)
+            if df == 0: continue
 
-        idf = calc_idf(df, N)
+            idf = bm25_idf(df, N)
 
-        for doc_id, tf in get_posting_list(index_body, token, "postings_gcp/postings_body"):
             # BM25 Score = IDF * (TF saturation)
-            bm25_score = idf * bm25_saturation(tf)
-            scores[doc_id] += (bm25_score * W_BODY)
-
-    # 4. PageRank Boost
-    for doc_id in scores:
-        raw_pr = page_rank.get(doc_id, 0)
-        pr_boost = math.log10(raw_pr + 1) if raw_pr > 0 else 0
-        scores[doc_id] += (pr_boost * W_PR)
-
-    # Final Result
-    top_docs = scores.most_common(100)
-    res = [(str(doc_id), id_to_title.get(doc_id, "N/A")) for doc_id, score in top_docs]
-    print(res[0])
-    print(f"   ➡️ Returning {len(res)} results.")
-    return jsonify(res)
+            for part in term_parts(blocks):
+                body_terms.append(body_bm25_term(part, idf * W_BODY, k1, b, body_index))
+
+        # 4. PageRank Boost
+        if BIGRAM_CANDIDATES and max_bigram_df >= k:
+            # Enough documents hold a query phrase: rank only those, decoding
+            # just the body blocks that cover them. The df decides (not this
+            # index's candidates), so every shard decides like the whole index.
+            return top_k_candidates(body_terms, np.unique(np.concatenate(candidate_arrays)), k,
+                                    extra_ids, extra_scores,
+                                    doc_boost=lambda doc_ids: pagerank_boost(doc_ids) * W_PR)
+        return top_k_block_max(body_terms, k, extra_ids, extra_scores,
+                               doc_boost=lambda doc_ids: pagerank_boost(doc_ids) * W_PR,
+                               doc_boost_bound=pagerank_boost_bound() * W_PR)
+
+
+def body_fetches(query_tokens, body_index=None):
+    """ Posting lists read by search_body_core: the body lists of the indexed terms. """
+    if body_index is None: body_index = index_body
+    return posting_fetches("body", [token for token in query_tokens if token in body_index.df], body_index)
+
+
+def search_body_core(query_tokens, k=100):
+    ''' Returns list of (Wiki ID, title) ordered by TF-IDF '''
+    top_ids, _ = rank_body_core(query_tokens, k)
+    return to_results(top_ids)
+
+
+def rank_body_core(query_tokens, k=100):
+    ''' (doc_ids, scores) of the top k of search_body_core '''
+    ensure_loaded(*BODY_COMPONENTS)
+    # One body index for the whole query: refresh_segments may swap the global meanwhile
+    body_index = index_body
+    body_terms = []
+    stats = body_stats(body_index)
+
+    # 1. Get total number of documents (N)
+    # Indexes built before the corpus stats were stored fall back to the corpus size (~6.3M for English Wiki)
+    N = stats.n_docs or 6348910
+
+    # Skip tokens that don't exist in the index to avoid errors
+    query_tokens = [token for token in query_tokens if token in body_index.df]
+    body_lists = fetch_postings(body_fetches(query_tokens, body_index))
+
+    for token, blocks in zip(query_tokens, body_lists):
+        # 2. Calculate IDF for the term
+        df = stats.df.get(token) or body_index.df[token]
+        idf = math.log(N / df, 10)  # Log base 10 is standard
+
+        # 3. Accumulate score: TF * IDF (cosine-normalized when the doc norms are loaded)
+        for part in term_parts(blocks):
+            if doc_stats is not None:
+                body_terms.append(body_cosine_term(part, idf, N, body_index))
+            else:
+                body_terms.append((part, lambda tf, doc_ids, idf=idf: tf * idf))
+
+    return top_k_block_max(body_terms, k)
+
+
+def search_title_core(query_tokens, k=PAGE_SIZE, cursor=None):
+    ''' Returns list of (Wiki ID, title) by the number of query terms in the title
+        (k results, after the doc id `cursor`) '''
+    ensure_loaded(*TITLE_COMPONENTS)
+    top_ids, _ = count_top_k(fetch_postings(posting_fetches("title", query_tokens)), k, cursor)
+    return to_results(top_ids)
+
+
+def search_anchor_core(query_tokens, k=PAGE_SIZE, cursor=None):
+    ''' Returns list of (Wiki ID, title) by the number of query terms in the anchor text
+        (k results, after the doc id `cursor`) '''
+    ensure_loaded(*ANCHOR_COMPONENTS)
+    top_ids, _ = count_top_k(fetch_postings(posting_fetches("anchor", query_tokens)), k, cursor)
+    return to_results(top_ids)
+
+
+def rank_count_core(field, query_tokens, k=PAGE_SIZE):
+    ''' (doc_ids, counts) of the top k of search_title_core / search_anchor_core (field "title" / "anchor") '''
+    ensure_loaded(f"index_{field}", "id_to_title")
+    return count_top_k(fetch_postings(posting_fetches(field, query_tokens)), k)
+
+
+# Batch search: field -> (search function of (query_tokens, k), posting lists it reads, components it needs)
+BATCH_FIELDS = {
+    "all": (search_core, search_fetches, SEARCH_COMPONENTS),
+    "body": (search_body_core, body_fetches, BODY_COMPONENTS),
+    "title": (search_title_core, lambda query_tokens: posting_fetches("title", query_tokens), TITLE_COMPONENTS),
+    "anchor": (search_anchor_core, lambda query_tokens: posting_fetches("anchor", query_tokens), ANCHOR_COMPONENTS),
+}
+MAX_BATCH_QUERIES = 10000
+# Queries whose posting lists are read together (and held in memory at once)
+BATCH_CHUNK = 256
+BATCH_FANOUT = 8
+
+
+def parse_batch_request(body):
+    """ (queries, field, k) of a /search_batch body: a list of queries, or
+        {"queries": [...], "field": "all" | "body" | "title" | "anchor", "k": 100}.
+        Raises ValueError on a malformed request.
+    """
+    if isinstance(body, list): body = {"queries": body}
+    if not isinstance(body, dict) or not isinstance(body.get("queries"), list):
+        raise ValueError('expected a list of queries or {"queries": [...]}')
+    queries = body["queries"]
+    if not all(isinstance(query, str) for query in queries):
+        raise ValueError("queries must be strings")
+    if len(queries) > MAX_BATCH_QUERIES:
+        raise ValueError(f"at most {MAX_BATCH_QUERIES} queries per batch")
+    field = body.get("field", "all")
+    if field not in BATCH_FIELDS:
+        raise ValueError(f"field must be one of {', '.join(BATCH_FIELDS)}")
+    k = body.get("k", 100)
+    if not isinstance(k, int) or isinstance(k, bool) or not 1 <= k <= MAX_PAGE_SIZE:
+        raise ValueError(f"k must be an integer between 1 and {MAX_PAGE_SIZE}")
+    return queries, field, k
+
+
+# Shard search (a shard server answering the shard coordinator): field -> scored search of (query_tokens, k)
+SHARD_FIELDS = {
+    "all": rank_core,
+    "body": rank_body_core,
+    "title": functools.partial(rank_count_core, "title"),
+    "anchor": functools.partial(rank_count_core, "anchor"),
+}
+
+
+def parse_shard_request(body):
+    """ (query, field, k, CorpusStats) of a /shard_search body:
+        {"query": ..., "field": "all" | "body" | "title" | "anchor", "k": 100,
+         "stats": {"n_docs": ..., "avgdl": ..., "df": {term: df}}}.
+        Without "stats" the shard scores with its own statistics.
+        Raises ValueError on a malformed request.
+    """
+    if not isinstance(body, dict) or not isinstance(body.get("query"), str):
+        raise ValueError('expected {"query": ..., "field": ..., "k": ..., "stats": ...}')
+    field = body.get("field", "all")
+    if field not in SHARD_FIELDS:
+        raise ValueError(f"field must be one of {', '.join(SHARD_FIELDS)}")
+    k = body.get("k", 100)
+    if not isinstance(k, int) or isinstance(k, bool) or not 1 <= k <= MAX_PAGE_SIZE:
+        raise ValueError(f"k must be between 1 and {MAX_PAGE_SIZE}")
+    stats = CorpusStats.from_json(body["stats"]) if body.get("stats") is not None else None
+    return body["query"], field, k, stats
+
+
+def shard_search_results(query, field, k, stats=None):
+    """ This server's top k for the shard coordinator, as [[wiki_id, score,
+        title], ...] best first, scored with the collection's `stats`.
+    """
+    with use_trace(Trace("/shard_search", query)) as trace:
+        with span("tokenize"):
+            query_tokens = tokenize(query)
+        check_index_version()
+        with span("search"), corpus_stats(stats):
+            top_ids, scores = SHARD_FIELDS[field](query_tokens, k)
+            results = [[wiki_id, score, title]
+                       for (wiki_id, title), score in zip(to_results(top_ids), scores.tolist())]
+    query_metrics.observe(trace.finish())
+    return results
+
+
+def search_batch_chunks(queries, field="all", k=100):
+    """ Yields the results of `queries` as NDJSON, one line per query in
+        order ({"query": ..., "results": [[wiki_id, title], ...]}), a chunk of
+        BATCH_CHUNK queries at a time. The distinct posting lists of a chunk
+        are read once, concurrently, and shared by its queries.
+    """
+    search_fn, fetches_fn, components = BATCH_FIELDS[field]
+    ensure_loaded(*components)
+    posting_cache.check_version(index_version())
+    for start in range(0, len(queries), BATCH_CHUNK):
+        chunk = queries[start:start + BATCH_CHUNK]
+        lines = []
+        with use_trace(Trace("/search_batch", f"{len(chunk)} queries")) as trace, shared_postings():
+            with span("tokenize"):
+                chunk_tokens = [tokenize(query) for query in chunk]
+            fetch_postings([fetch for query_tokens in chunk_tokens for fetch in fetches_fn(query_tokens)],
+                           BATCH_FANOUT)
+            with span("search"):
+                for query, query_tokens in zip(chunk, chunk_tokens):
+                    results = search_fn(query_tokens, k) if query_tokens else []
+                    lines.append(json.dumps({"query": query, "results": results}) + "\n")
+        query_metrics.observe(trace.finish())
+        yield "".join(lines)
+
+# ==============================================================================
+# 7. RESULT & POSTING CACHES
+# ==============================================================================
+
+result_cache = ResultCache(RESULT_CACHE_BYTES, RESULT_CACHE_TTL)
+
+# Per-process metrics (each pre-forked worker has its own; scrape them per worker or aggregate)
+metrics_registry = Registry()
+query_metrics = QueryMetrics(metrics_registry, SLOW_QUERY_SECONDS, SLOW_QUERY_LOG)
+
+
+def all_cache_stats():
+    """ The /cache_stats counters of the result, posting and (with remote
+        postings) block caches, as {cache: {stat: value}}.
+    """
+    stats = {"results": result_cache.stats(), "postings": posting_cache.stats()}
+    if remote_reader is not None:
+        stats["blocks"] = remote_reader.stats()
+    return stats
+
+
+def cache_gauges():
+    """ The /cache_stats counters, as (cache, stat) -> value. """
+    return {(name, stat): value for name, stats in all_cache_stats().items() for stat, value in stats.items()}
+
+
+metrics_registry.gauge_callback("search_cache", "Result, posting and block cache counters.",
+                                cache_gauges, ["cache", "stat"])
+
+
+def index_version():
+    """ Identity of the loaded data: loading any component again changes it,
+        which clears the result cache.
+    """
+    return tuple(id(component) for component in (index_body, index_title, index_anchor, index_body_impact,
+                                                  index_bigram, doc_stats, page_rank, id_to_title))
+
+
+def check_index_version():
+    """ Clears the result and posting caches if the loaded data changed (see index_version). """
+    version = index_version()
+    result_cache.check_version(version)
+    posting_cache.check_version(version)
+
+
+def load_warmup_queries(path):
+    """ Queries of a JSON file (a list, or a dict keyed by query like
+        queries_train.json) or of a query log with one query per line.
+    """
+    if not path or not os.path.exists(path): return []
+    if path.endswith(".json"):
+        with open(path, encoding="utf-8") as f:
+            return list(json.load(f))
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def warm_up_posting_cache(queries):
+    """ Preloads the posting lists of the terms of `queries` into the posting
+        cache, most frequent terms first, counting each term as often as it
+        occurs so the cache's frequency filter sees them as hot.
+    """
+    posting_cache.check_version(index_version())
+    token_counts = collections.Counter(token for query in queries for token in tokenize(query))
+    fields = [(index_body, "postings_gcp/postings_body"), (index_title, "postings_gcp/postings_title"),
+              (index_anchor, "postings_gcp/postings_anchor")]
+    n_loaded = 0
+    fields = [(getattr(inverted_index, 'base', inverted_index), remote_folder)
+              for inverted_index, remote_folder in fields]
+    for token, count in token_counts.most_common():
+        for inverted_index, remote_folder in fields:
+            if not inverted_index or token not in inverted_index.df: continue
+            posting_cache.record(posting_cache_key(inverted_index, token, remote_folder), count)
+            if cached_postings(inverted_index, token, remote_folder) is not None:
+                n_loaded += 1
+    stats = posting_cache.stats()
+    print(f"🔥 Posting cache warmed: {n_loaded} lists, {stats['bytes'] / 2 ** 20:.1f} MB")
+
+
+def cached_search_body(endpoint, query, search_fn, dumps, params=()):
+    """ Serialized result of search_fn(query_tokens), served from the result cache.
+        The key is the endpoint, the query tokens (after tokenization, so
+        queries differing only in case or stopwords share an entry) and the
+        scoring parameters of the request; dumps(results) gives the cached bytes.
+    """
+    def compute():
+        with span("search"):
+            return dumps(search_fn(list(query_tokens)))
+
+    with use_trace(Trace(endpoint, query)) as trace:
+        with span("tokenize"):
+            query_tokens = tuple(tokenize(query))
+        check_index_version()
+        body = result_cache.get_or_compute((endpoint, query_tokens, params), compute)
+    query_metrics.observe(trace.finish())
+    return body
+
+
+def cached_search(endpoint, query, search_fn, params=()):
+    """ JSON response of search_fn(query_tokens), served from the result cache. """
+    body = cached_search_body(endpoint, query, search_fn, lambda res: jsonify(res).get_data(), params)
+    return app.response_class(body, mimetype='application/json')
+
+
+def refresh_segments():
+    """ Reopens the delta segments of every loaded index whose segment manifest
+        changed. Queries already running keep the index they started with; the
+        new objects change index_version, which clears the caches. Readers of
+        segments merged or retired away are closed on the next call.
+    """
+    while retired_readers:
+        retired_readers.pop().close()
+    swapped = False
+    for name, remote_folder in SEGMENTED_INDEXES.items():
+        if component_status[name]["state"] != "ready" or globals()[name] is None: continue
+        index = globals()[name]
+        if read_segments(remote_folder)["generation"] != getattr(index, 'generation', 0):
+            globals()[name] = open_segments(getattr(index, 'base', index), remote_folder)
+            swapped = True
+            print(f"🧩 {name}: {len(getattr(globals()[name], 'segments', []))} delta segments")
+    if swapped:
+        live = {segment.dir for name in SEGMENTED_INDEXES for segment in getattr(globals()[name], 'segments', [])}
+        for folder in segment_folders - live:
+            segment_folders.discard(folder)
+            reader = posting_readers.pop(folder, None)
+            if reader is not None: retired_readers.append(reader)
+
+
+def start_segment_maintenance(merge=MERGE_SEGMENTS):
+    """ Starts a background thread that every SEGMENT_REFRESH_SECONDS runs the
+        segment merge policy (with `merge`) and picks up new segments. Merges
+        write new segments and never block queries.
+    """
+    def run():
+        while True:
+            time.sleep(SEGMENT_REFRESH_SECONDS)
+            try:
+                if merge:
+                    for remote_folder in SEGMENTED_INDEXES.values():
+                        maybe_merge(remote_folder)
+                refresh_segments()
+            except Exception as e:
+                print(f"   ❌ Segment maintenance failed: {e}")
+
+    threading.Thread(target=run, name="segments", daemon=True).start()
+
+
+# ==============================================================================
+# 8. STARTUP (PARALLEL & LAZY LOADING)
+# ==============================================================================
+# Every component is loaded by its loader into the global of the same name.
+# State: idle (load_data not called) -> pending / lazy -> loading -> ready / failed
+
+COMPONENT_LOADERS = {
+    "index_body": lambda: load_index("index_body", "postings_gcp/postings_body"),
+    "index_title": lambda: load_index("index_title", "postings_gcp/postings_title"),
+    "index_anchor": lambda: load_index("index_anchor", "postings_gcp/postings_anchor"),
+    "index_body_impact": lambda: load_index("index_body_impact", "postings_gcp/postings_body_impact"),
+    "index_bigram": lambda: load_index("index_bigram", "postings_gcp/postings_bigram"),
+    "doc_stats": load_doc_stats,
+    "page_rank": load_pagerank,
+    "page_views": load_pageviews,
+    "id_to_title": load_id_map,
+}
+component_status = {name: {"state": "idle"} for name in COMPONENT_LOADERS}
+_component_locks = {name: threading.Lock() for name in COMPONENT_LOADERS}
+_component_loaded = {name: threading.Event() for name in COMPONENT_LOADERS}
+started_at = time.time()
+
+
+def load_component(name):
+    """ Loads one component into its global (once), recording its state and load time. """
+    with _component_locks[name]:
+        status = component_status[name]
+        if status["state"] in ("ready", "failed"): return
+        status["state"] = "loading"
+        start = time.perf_counter()
+        try:
+            globals()[name] = COMPONENT_LOADERS[name]()
+            status["state"] = "ready"
+        except Exception as e:
+            status.update(state="failed", error=f"{type(e).__name__}: {e}")
+            print(f"   ❌ Error loading {name}: {e}")
+        finally:
+            status["seconds"] = round(time.perf_counter() - start, 3)
+            _component_loaded[name].set()
+
+
+def ensure_loaded(*names):
+    """ Waits until the given components are loaded, loading lazy ones now.
+        Does nothing for components load_data was never asked to load.
+    """
+    for name in names:
+        state = component_status[name]["state"]
+        if state == "lazy":
+            load_component(name)
+        elif state in ("pending", "loading"):
+            _component_loaded[name].wait()
+
+
+def is_ready():
+    return all(component_status[name]["state"] == "ready" for name in READY_COMPONENTS)
+
+
+def load_data(wait=True, lazy=LAZY_COMPONENTS, gcs=True):
+    """ Loads the indexes and document stores into the module globals in
+        parallel, then warms the posting cache. Components in `lazy` are left
+        for their first use (ensure_loaded).
+
+        With wait=False loading continues in the background and requests wait
+        only for the components they use. The pre-fork master
+        (serve_prefork.py) loads everything up front so its workers share it.
+        With gcs=False only local files are used (e.g. local shard servers).
+    """
+    global index_synced
+    print("🚀 Initializing Server...")
+    if gcs:
+        init_gcp()
+    if gcs and SYNC_INDEX_ON_STARTUP and not REMOTE_POSTINGS and not REMOTE_PREFIX:
+        print("⬇️ Syncing the index files with the bucket manifest...")
+        try:
+            download_all_bin_files()
+        except Exception as e:
+            print(f"   ❌ Index sync failed, loading the local files: {e}")
+    index_synced = os.path.exists(SYNC_STATE_FILE) and not REMOTE_POSTINGS and not REMOTE_PREFIX
+
+    eager = [name for name in COMPONENT_LOADERS if name not in lazy]
+    for name in COMPONENT_LOADERS:
+        if component_status[name]["state"] == "idle":
+            component_status[name]["state"] = "lazy" if name in lazy else "pending"
+
+    def load_eager():
+        print("LOADING DATA...")
+        start = time.perf_counter()
+        with ThreadPoolExecutor(STARTUP_WORKERS, thread_name_prefix="startup") as pool:
+            list(pool.map(load_component, eager))
+        print(f"✅ Data Loaded in {time.perf_counter() - start:.1f}s. Server Ready!")
+        warm_up_posting_cache(load_warmup_queries(WARMUP_QUERIES_PATH))
+        start_segment_maintenance()
+
+    if wait:
+        load_eager()
+    else:
+        threading.Thread(target=load_eager, name="startup", daemon=True).start()
+
+
+# ==============================================================================
+# 9. FLASK APP
+# ==============================================================================
+
+class MyFlaskApp(Flask):
+    # Inside class MyFlaskApp(Flask):
+
+    def run(self, host=None, port=None, debug=None, **options):
+        # Serve right away; requests wait for the components they use (see /readyz)
+        load_data(wait=False)
+        super(MyFlaskApp, self).run(host=host, port=port, debug=debug, **options)
+
+app = MyFlaskApp(__name__)
+app.config['JSONIFY_PRETTYPRINT_REGULAR'] = False
+
+
 
+@app.route("/search")
+def search():
+    ''' Returns list of Wiki IDs (Strings) using BM25 for Body, and simple weights for Title/Anchor '''
+    query = request.args.get('query', '')
+    if len(query) == 0: return jsonify([])
 
-import math  # Make sure to import math
+    print(f"\n--- SEARCHING: '{query}' ---")
+    return cached_search("/search", query, search_core)
 
 
 @app.route("/search_body")
 def search_body():
     ''' Returns list of Wiki IDs (Strings) ordered by TF-IDF '''
-    res = []
     query = request.args.get('query', '')
-    if len(query) == 0: return jsonify(res)
+    if len(query) == 0: return jsonify([])
+    return cached_search("/search_body", query, search_body_core)
 
-    query_tokens = tokenize(query)
-    scores = collections.Counter()
 
-    # 1. Get total number of documents (N)
-    # If index_body doesn't have a total_docs attribute, hardcode the corpus size (e.g., ~6.3M for English Wiki)
-    # or use len(index_body.df) as a proxy if it covers all docs.
-    N = len(index_body.ds) if hasattr(index_body, 'ds') else 6348910
+def paged_search(endpoint, search_fn):
+    ''' A /search_title or /search_anchor response: `k` results (default
+        PAGE_SIZE) after the wiki id `cursor`; pass the last wiki id of a page
+        as the cursor of the next one. '''
+    query = request.args.get('query', '')
+    try:
+        k, cursor = parse_page_params(request.args.get('k'), request.args.get('cursor'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if len(query) == 0: return jsonify([])
+    return cached_search(endpoint, query, functools.partial(search_fn, k=k, cursor=cursor), (k, cursor))
 
-    for token in query_tokens:
-        # Skip tokens that don't exist in the index to avoid errors
-        if token not in index_body.df:
-            continue
 
-        # 2. Calculate IDF for the term
-        df = index_body.df[token]
-        idf = math.log(N / df, 10)  # Log base 10 is standard
+@app.route("/search_title")
+def search_title():
+    ''' Returns list of Wiki IDs (Strings), a page at a time (k, cursor) '''
+    return paged_search("/search_title", search_title_core)
 
-        postings = get_posting_list(index_body, token, "postings_gcp/postings_body")
-        for doc_id, tf in postings:
-            # 3. Accumulate score: TF * IDF
-            scores[doc_id] += (tf * idf)
 
-    top_docs = scores.most_common(100)
-    res = [(str(doc_id), id_to_title.get(doc_id, "N/A")) for doc_id, score in top_docs]
-    return jsonify(res)
+@app.route("/search_anchor")
+def search_anchor():
+    ''' Returns list of Wiki IDs (Strings), a page at a time (k, cursor) '''
+    return paged_search("/search_anchor", search_anchor_core)
 
-@app.route("/search_title")
-def search_title():
-    ''' Returns list of Wiki IDs (Strings) '''
-    res = []
-    query = request.args.get('query', '')
-    if len(query) == 0: return jsonify(res)
 
-    query_tokens = tokenize(query)
-    scores = collections.Counter()
+@app.route("/search_batch", methods=['POST'])
+def search_batch():
+    ''' Runs many queries in one request, reading each posting list once per
+        chunk of queries. Body: a list of queries, or {"queries": [...],
+        "field": "all" | "body" | "title" | "anchor", "k": 100}. Streams
+        back one JSON line per query, in order. '''
+    try:
+        queries, field, k = parse_batch_request(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return app.response_class(search_batch_chunks(queries, field, k), mimetype='application/x-ndjson')
+
+
+@app.route("/shard_search", methods=['POST'])
+def shard_search():
+    ''' Scored top k of this server's documents, for shard_coordinator.py.
+        Body: {"query": ..., "field": "all" | "body" | "title" | "anchor", "k": 100,
+        "stats": {"n_docs": ..., "avgdl": ..., "df": {term: df}}} with the
+        collection's statistics. Returns [[wiki_id, score, title], ...] best first. '''
+    try:
+        query, field, k, stats = parse_shard_request(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(shard_search_results(query, field, k, stats))
 
-    for token in query_tokens:
-        postings = get_posting_list(index_title, token, "postings_gcp/postings_title")
-        for doc_id, tf in postings:
-            scores[doc_id] += 1
 
-    top_docs = sorted(scores.items(), key=lambda x: x[1], reverse=True)
-    res = [(str(doc_id), id_to_title.get(int(doc_id), "N/A")) for doc_id, score in top_docs]
-    return jsonify(res)
+@app.route("/cache_stats")
+def cache_stats():
+    ''' Result, posting and block cache counters (hits, misses, evictions, ...) for monitoring '''
+    return jsonify(all_cache_stats())
 
 
-@app.route("/search_anchor")
-def search_anchor():
-    ''' Returns list of Wiki IDs (Strings) '''
-    res = []
-    query = request.args.get('query', '')
-    if len(query) == 0: return jsonify(res)
+@app.route("/metrics")
+def metrics():
+    ''' Request, stage and posting fetch histograms and cache counters, in the
+        Prometheus text format '''
+    return app.response_class(metrics_registry.render(), mimetype='text/plain; version=0.0.4')
 
-    query_tokens = tokenize(query)
-    scores = collections.Counter()
 
-    for token in query_tokens:
-        postings = get_posting_list(index_anchor, token, "postings_gcp/postings_anchor")
-        for doc_id, tf in postings:
-            scores[doc_id] += 1
+@app.route("/healthz")
+def healthz():
+    ''' Liveness: the process is up and serving '''
+    return jsonify({"status": "ok", "uptime_seconds": round(time.time() - started_at, 1)})
 
-    top_docs = sorted(scores.items(), key=lambda x: x[1], reverse=True)
-    res = [(str(doc_id), id_to_title.get(doc_id, "N/A")) for doc_id, score in top_docs]
-    return jsonify(res)
+
+@app.route("/readyz")
+def readyz():
+    ''' Readiness: 200 once the core components are loaded (503 before), with
+        the state and load time of every component '''
+    body = {"ready": is_ready(), "components": component_status}
+    return jsonify(body), 200 if body["ready"] else 503
 
 
 @app.route("/get_pagerank", methods=['POST'])
 def get_pagerank():
+    ensure_loaded("page_rank")
     wiki_ids = request.get_json() or []
-    res = [page_rank.get(doc_id, 0.0) for doc_id in wiki_ids]
+    res = page_rank.lookup(parse_doc_ids(wiki_ids), 0.0).tolist()
     return jsonify(res)
 
 
@@ -410,19 +1483,10 @@ def get_pageview():
     '''
     # 1. Parse JSON input (expecting a list of IDs)
     wiki_ids = request.get_json() or []
+    ensure_loaded("page_views")
 
-    # 2. Retrieve counts
-    res = []
-    for doc_id in wiki_ids:
-        try:
-            # The dictionary keys are likely integers.
-            # We try to convert the input ID to int just in case.
-            count = page_views.get(int(doc_id), 0)
-        except (ValueError, TypeError):
-            # If conversion fails, try using the key as is (e.g. string)
-            count = page_views.get(doc_id, 0)
-
-        res.append(count)
+    # 2. Retrieve counts (one batch lookup; ids that are not integers get 0)
+    res = page_views.lookup(parse_doc_ids(wiki_ids), 0).tolist()
 
     return jsonify(res)
 
@@ -0,0 +1,230 @@
+import json
+import time
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+import search_frontend as sf
+
+# ==============================================================================
+# ASYNC (ASGI) SERVING
+# ==============================================================================
+# The routes of search_frontend.py as a plain ASGI application, for an async
+# server such as uvicorn:
+#
+#   uvicorn search_frontend_asgi:app --host 0.0.0.0 --port 8080
+#
+# A request holds no thread while it waits. The search itself (posting reads,
+# which search_frontend spreads over its I/O pool, then scoring) runs on
+# SEARCH_WORKERS executor threads and is awaited, so one process keeps
+# hundreds of requests in flight. At most SEARCH_WORKERS searches run at
+# once; up to MAX_QUEUED more wait for a slot, and beyond that requests are
+# refused with 503 instead of queueing without bound.
+#
+# Indexes start loading (search_frontend.load_data) on the ASGI lifespan startup
+# event and the server accepts requests right away; /readyz reports when the
+# core indexes are loaded. Results share search_frontend's caches.
+
+SEARCH_WORKERS = 32
+MAX_QUEUED = 512
+# Largest accepted POST body (the id lists of /get_pagerank and /get_pageview)
+MAX_BODY_BYTES = 16 * 1024 * 1024
+
+search_pool = ThreadPoolExecutor(SEARCH_WORKERS, thread_name_prefix="search")
+_search_slots = None  # asyncio.Semaphore, created on the serving event loop
+_n_waiting = 0
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def dumps(obj):
+    return json.dumps(obj, separators=(",", ":")).encode('utf-8') + b"\n"
+
+
+async def run_in_slot(fn, *args):
+    """ Runs fn(*args) on the search pool, waiting for a free slot. """
+    global _search_slots, _n_waiting
+    if _search_slots is None:
+        _search_slots = asyncio.Semaphore(SEARCH_WORKERS)
+    if _search_slots.locked() and _n_waiting >= MAX_QUEUED:
+        raise HTTPError(503, "too many queries in flight")
+    _n_waiting += 1
+    try:
+        await _search_slots.acquire()
+    finally:
+        _n_waiting -= 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(search_pool, fn, *args)
+    finally:
+        _search_slots.release()
+
+
+async def run_search(endpoint, query, search_fn, params=()):
+    return await run_in_slot(sf.cached_search_body, endpoint, query, search_fn, dumps, params)
+
+
+# ==============================================================================
+# ROUTES
+# ==============================================================================
+
+SEARCH_ROUTES = {
+    "/search": sf.search_core,
+    "/search_body": sf.search_body_core,
+    "/search_title": sf.search_title_core,
+    "/search_anchor": sf.search_anchor_core,
+}
+
+
+# Routes paged with the k and cursor parameters
+PAGED_ROUTES = {"/search_title", "/search_anchor"}
+
+
+async def search_route(path, params, body):
+    query = params.get('query', [''])[0]
+    search_fn, page = SEARCH_ROUTES[path], ()
+    if path in PAGED_ROUTES:
+        try:
+            page = sf.parse_page_params(params.get('k', [None])[0], params.get('cursor', [None])[0])
+        except ValueError as e:
+            raise HTTPError(400, str(e))
+        search_fn = functools.partial(search_fn, k=page[0], cursor=page[1])
+    if len(query) == 0: return dumps([])
+    return await run_search(path, query, search_fn, page)
+
+
+async def doc_value_route(path, params, body):
+    try:
+        wiki_ids = json.loads(body) if body else []
+    except ValueError:
+        raise HTTPError(400, "body is not valid JSON")
+    name, default = ("page_rank", 0.0) if path == "/get_pagerank" else ("page_views", 0)
+    await asyncio.get_running_loop().run_in_executor(search_pool, sf.ensure_loaded, name)
+    store = getattr(sf, name)
+    return dumps(store.lookup(sf.parse_doc_ids(wiki_ids or []), default).tolist())
+
+
+async def search_batch_route(path, params, body):
+    """ Streams the NDJSON of sf.search_batch_chunks; each chunk of queries
+        takes one search slot, so a large batch does not hold the pool.
+    """
+    try:
+        queries, field, k = sf.parse_batch_request(json.loads(body) if body else None)
+    except ValueError as e:
+        raise HTTPError(400, str(e))
+    chunks = sf.search_batch_chunks(queries, field, k)
+
+    async def stream():
+        while True:
+            chunk = await run_in_slot(next, chunks, None)
+            if chunk is None: return
+            yield chunk.encode('utf-8')
+    return stream()
+
+
+async def cache_stats_route(path, params, body):
+    return dumps(sf.all_cache_stats())
+
+
+async def metrics_route(path, params, body):
+    return sf.metrics_registry.render().encode('utf-8'), b'text/plain; version=0.0.4'
+
+
+async def healthz_route(path, params, body):
+    return dumps({"status": "ok", "uptime_seconds": round(time.time() - sf.started_at, 1)})
+
+
+async def readyz_route(path, params, body):
+    body = {"ready": sf.is_ready(), "components": sf.component_status}
+    if not body["ready"]: raise HTTPError(503, body)
+    return dumps(body)
+
+
+ROUTES = {path: ("GET", search_route) for path in SEARCH_ROUTES}
+ROUTES.update({
+    "/search_batch": ("POST", search_batch_route),
+    "/get_pagerank": ("POST", doc_value_route),
+    "/get_pageview": ("POST", doc_value_route),
+    "/cache_stats": ("GET", cache_stats_route),
+    "/metrics": ("GET", metrics_route),
+    "/healthz": ("GET", healthz_route),
+    "/readyz": ("GET", readyz_route),
+})
+
+
+# ==============================================================================
+# ASGI APPLICATION
+# ==============================================================================
+
+async def read_body(receive):
+    chunks, size = [], 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect': raise HTTPError(400, "client disconnected")
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if size > MAX_BODY_BYTES: raise HTTPError(413, "request body too large")
+        chunks.append(chunk)
+        if not message.get('more_body', False):
+            return b''.join(chunks)
+
+
+async def send_response(send, status, body, content_type=b'application/json'):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', content_type),
+                            (b'content-length', str(len(body)).encode('ascii'))]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def send_stream(send, chunks):
+    await send({'type': 'http.response.start', 'status': 200,
+                'headers': [(b'content-type', b'application/x-ndjson')]})
+    async for chunk in chunks:
+        await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, sf.load_data, False)
+            except Exception as e:
+                await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                return
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            search_pool.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        raise ValueError(f"Unsupported ASGI scope type {scope['type']}")
+
+    route = ROUTES.get(scope['path'])
+    try:
+        if route is None: raise HTTPError(404, "not found")
+        method, handler = route
+        if scope['method'] != method: raise HTTPError(405, "method not allowed")
+        params = parse_qs(scope.get('query_string', b'').decode('utf-8', 'replace'))
+        body = await read_body(receive) if method == "POST" else b''
+        status, response = 200, await handler(scope['path'], params, body)
+    except HTTPError as e:
+        detail = e.args[0]
+        status, response = e.status, dumps(detail if isinstance(detail, dict) else {"error": detail})
+    # A handler returns JSON bytes, (bytes, content type), or an async generator to stream
+    if isinstance(response, bytes):
+        await send_response(send, status, response)
+    elif isinstance(response, tuple):
+        await send_response(send, status, *response)
+    else:
+        await send_stream(send, response)
@@ -0,0 +1,479 @@
+import os
+import sys
+import json
+import math
+import time
+import fcntl
+import shutil
+import argparse
+from contextlib import contextmanager, closing
+from collections.abc import Mapping
+import numpy as np
+from inverted_index_gcp import InvertedIndex, MultiFileReader
+from posting_codec import POSTING_FORMAT_BLOCKS, DECODED_DTYPE, LIST_HEADER, read_list_header, decode_posting_list
+from lexicon import Lexicon, write_lexicon
+from doc_stores import DocValueStore, TitleStore, find_rows
+from text_analysis import tokenize
+
+# ==============================================================================
+# DELTA SEGMENTS (INCREMENTAL INDEX UPDATES)
+# ==============================================================================
+# New, updated and deleted documents are appended to a field as small delta
+# segments instead of rebuilding the whole index. The delta segments of a field
+# live next to its base postings, e.g. postings_gcp/postings_body/segments/:
+#
+#   segments.json           live segments, oldest first, and a generation number
+#                           bumped on every change
+#   seg_000007/             one delta segment:
+#     0_000.bin, ...          posting lists (format 2 blocks)
+#     lexicon/                its own term lexicon (lexicon.py)
+#     lengths_*.npy           length in tokens of every document in the segment
+#     deleted.npy             sorted doc ids this segment removes from the older
+#                             segments and the base: deleted documents, and the
+#                             documents it holds a new version of
+#     titles_*                titles of its documents (title field, optional)
+#
+# A document is live in the newest segment (or the base) holding it that no
+# newer segment deletes. SegmentedIndex serves a base index plus its delta
+# segments; the frontend reloads it when the generation changes, so queries
+# already running keep the segments they started with.
+#
+# Merges compact delta segments in the background (maybe_merge): segments are
+# tiered by size, and once the newest MERGE_FACTOR segments share a tier they
+# are merged into one segment of the next tier. Merged-away segments are
+# removed RETIRE_SECONDS later, after every reader has switched. The base is
+# never rewritten; a full build (create_inverted_indexes.py) replaces it.
+#
+#   python segments.py add docs.jsonl        ({"id": ..., "title": ..., "text": ...} per line)
+#   python segments.py delete 12 345
+#   python segments.py merge [--all]
+#   python segments.py list
+
+SEGMENTS_DIR = "segments"
+SEGMENTS_MANIFEST = "segments.json"
+SEGMENT_POSTING_FORMAT = POSTING_FORMAT_BLOCKS
+MERGE_FACTOR = 8
+MAX_SEGMENTS = 32
+RETIRE_SECONDS = 600
+FIELD_DIRS = {"body": "postings_gcp/postings_body", "title": "postings_gcp/postings_title",
+              "anchor": "postings_gcp/postings_anchor"}
+
+
+def segments_dir(field_dir):
+    return os.path.join(field_dir, SEGMENTS_DIR)
+
+
+def read_segments(field_dir):
+    """ The segments manifest of a field (empty when it has no delta segments). """
+    try:
+        with open(os.path.join(segments_dir(field_dir), SEGMENTS_MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"generation": 0, "next_id": 1, "segments": [], "retired": []}
+
+
+def _save_segments(field_dir, manifest, bump=True):
+    if bump:
+        manifest["generation"] += 1
+    path = os.path.join(segments_dir(field_dir), SEGMENTS_MANIFEST)
+    with open(path + ".tmp", 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(path + ".tmp", path)
+
+
+@contextmanager
+def _locked(field_dir, lock_name=".lock"):
+    """ Exclusive lock across threads and processes: `.lock` guards the
+        manifest, `.merge.lock` is held for a whole merge.
+    """
+    os.makedirs(segments_dir(field_dir), exist_ok=True)
+    with open(os.path.join(segments_dir(field_dir), lock_name), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+# ==============================================================================
+# WRITING SEGMENTS
+# ==============================================================================
+
+def _write_segment(field_dir, index, lengths, deleted, titles=None):
+    """ Writes a segment directory from an InvertedIndex holding its posting
+        lists; returns its name. The segment is not live until it is added
+        to the manifest.
+    """
+    with _locked(field_dir):
+        manifest = read_segments(field_dir)
+        name = f"seg_{manifest['next_id']:06d}"
+        manifest["next_id"] += 1
+        _save_segments(field_dir, manifest, bump=False)
+
+    seg_dir = os.path.join(segments_dir(field_dir), name)
+    tmp_dir = seg_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    index.write_posting_lists(tmp_dir, SEGMENT_POSTING_FORMAT)
+    index.n_docs = len(lengths)
+    index.avgdl = sum(lengths.values()) / len(lengths) if lengths else None
+    write_lexicon(index, os.path.join(tmp_dir, "lexicon"))
+    DocValueStore.from_pairs(list(lengths), list(lengths.values()), np.uint32).save(os.path.join(tmp_dir, "lengths"))
+    np.save(os.path.join(tmp_dir, "deleted.npy"), np.unique(np.asarray(sorted(deleted), dtype=np.uint32)))
+    if titles:
+        TitleStore.from_pairs(list(titles), list(titles.values())).save(os.path.join(tmp_dir, "titles"))
+    os.rename(tmp_dir, seg_dir)
+    return name
+
+
+def add_documents(field_dir, docs, deleted=(), titles=None):
+    """ Appends a delta segment to a field and makes it live.
+
+    Parameters:
+    -----------
+      docs: dict mapping doc_id to its list of tokens; a document already in
+            the index is replaced by this version.
+      deleted: doc ids to remove from the field.
+      titles: optional dict doc_id -> title of the documents (title field).
+    Returns the name of the new segment.
+    """
+    docs = {int(doc_id): tokens for doc_id, tokens in docs.items()}
+    removed = {int(doc_id) for doc_id in deleted} - set(docs)
+    lengths = {doc_id: len(tokens) for doc_id, tokens in docs.items()}
+    name = _write_segment(field_dir, InvertedIndex(docs), lengths, removed | set(docs), titles)
+    with _locked(field_dir):
+        manifest = read_segments(field_dir)
+        manifest["segments"].append({"name": name, "n_docs": len(docs), "n_removed": len(removed)})
+        _save_segments(field_dir, manifest)
+    return name
+
+
+def delete_documents(field_dir, doc_ids):
+    return add_documents(field_dir, {}, doc_ids)
+
+
+# ==============================================================================
+# READING SEGMENTS
+# ==============================================================================
+
+class DeltaSegment:
+    """ One delta segment opened for reading. """
+
+    def __init__(self, seg_dir, n_removed=0):
+        self.dir = seg_dir
+        self.name = os.path.basename(seg_dir)
+        self.n_removed = n_removed
+        self.index = Lexicon(os.path.join(seg_dir, "lexicon"))
+        self.lengths = DocValueStore.load(os.path.join(seg_dir, "lengths"))
+        self.deleted = np.load(os.path.join(seg_dir, "deleted.npy")).astype(np.int64)
+        titles_prefix = os.path.join(seg_dir, "titles")
+        self.titles = TitleStore.load(titles_prefix) if os.path.exists(f"{titles_prefix}_ids.npy") else None
+
+    def iter_postings(self):
+        """ (term, decoded posting list) of every term of the segment. """
+        with closing(MultiFileReader(self.dir)) as reader:
+            for term in self.index.terms():
+                locs = self.index.posting_locs[term]
+                _, _, n_bytes = read_list_header(reader.read(locs, LIST_HEADER.size))
+                yield term, decode_posting_list(reader.read(locs, n_bytes), self.index.posting_format)
+
+
+class _CombinedColumn(Mapping):
+    """ A term statistic over the base and the segments: `combine` of the
+        values of the parts holding the term.
+    """
+
+    def __init__(self, columns, combine):
+        self._columns = columns
+        self._combine = combine
+
+    def __getitem__(self, token):
+        values = [column[token] for column in self._columns if token in column]
+        if not values: raise KeyError(token)
+        return self._combine(values)
+
+    def __contains__(self, token):
+        return any(token in column for column in self._columns)
+
+    def __iter__(self):
+        seen = set()
+        for column in self._columns:
+            for token in column:
+                if token not in seen:
+                    seen.add(token)
+                    yield token
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+class SegmentedIndex:
+    """ A base index (Lexicon or InvertedIndex) with the delta segments of its
+        field, offering the term statistics of InvertedIndex: df and
+        term_total are summed over the parts and max_tf is their max (postings
+        of replaced or deleted documents count until they are merged away, as
+        usual for segmented indexes). n_docs is approximate too: a replaced
+        document counts twice until the base is rebuilt.
+
+        Posting lists are read per part, the base first, and combined with
+        live_postings / merge_postings.
+    """
+
+    def __init__(self, base, field_dir, generation, segments):
+        self.base = base
+        self.field_dir = field_dir
+        self.generation = generation
+        self.segments = segments
+        self.posting_format = base.posting_format
+        self.impact_scale = base.impact_scale
+        parts = [base] + [segment.index for segment in segments]
+        self.df = _CombinedColumn([part.df for part in parts], sum)
+        self.term_total = _CombinedColumn([getattr(part, 'term_total', {}) for part in parts], sum)
+        self.max_tf = _CombinedColumn([getattr(part, 'max_tf', {}) for part in parts], max)
+        n_added = sum(len(segment.lengths) for segment in segments)
+        n_removed = sum(segment.n_removed for segment in segments)
+        self.n_docs = base.n_docs + n_added - n_removed if base.n_docs else None
+        self.avgdl = base.avgdl
+        # Doc ids removed from each part (the base first) by the segments newer than it
+        self._deleted_after = []
+        deleted = np.empty(0, dtype=np.int64)
+        for segment in reversed(segments):
+            self._deleted_after.append(deleted)
+            deleted = np.union1d(deleted, segment.deleted)
+        self._deleted_after.append(deleted)
+        self._deleted_after.reverse()
+        self._norms = {}
+
+    @classmethod
+    def open(cls, base, field_dir):
+        """ `base` with the live delta segments of `field_dir`, or `base` itself when there are none. """
+        manifest = read_segments(field_dir)
+        if base is None or not manifest["segments"]: return base
+        segments = [DeltaSegment(os.path.join(segments_dir(field_dir), entry["name"]), entry["n_removed"])
+                    for entry in manifest["segments"]]
+        return cls(base, field_dir, manifest["generation"], segments)
+
+    def deleted_after(self, part):
+        """ Sorted doc ids removed from part `part` (0 = base, i = segment i - 1). """
+        return self._deleted_after[part]
+
+    def live_postings(self, part, postings):
+        """ The postings of part `part` whose documents no newer segment removes. """
+        deleted = self._deleted_after[part]
+        if len(deleted) == 0 or len(postings) == 0: return postings
+        return postings[~find_rows(deleted, postings['doc_id'])[1]]
+
+    def merge_postings(self, parts):
+        """ One posting list, ordered by doc id, from the lists of every part (the base first). """
+        kept = [self.live_postings(i, postings) for i, postings in enumerate(parts) if len(postings)]
+        kept = [postings for postings in kept if len(postings)]
+        if not kept: return np.empty(0, dtype=DECODED_DTYPE)
+        if len(kept) == 1: return kept[0]
+        merged = np.concatenate([postings.astype(DECODED_DTYPE, copy=False) for postings in kept])
+        return merged[np.argsort(merged['doc_id'], kind='stable')]
+
+    def _overlay(self, doc_ids, values, store_of):
+        """ `values` with the value of each document taken from the newest segment holding it. """
+        doc_ids = np.asarray(doc_ids, dtype=np.int64)
+        for segment in self.segments:
+            store = store_of(segment)
+            if store is None or len(store) == 0: continue
+            rows, found = find_rows(store.doc_ids, doc_ids)
+            if found.any():
+                values = np.where(found, store.values[rows], values)
+        return values
+
+    def doc_lengths(self, doc_ids, lengths):
+        """ Document lengths (from the base doc stats) updated by the segments. """
+        return self._overlay(doc_ids, lengths, lambda segment: segment.lengths)
+
+    def min_length(self):
+        """ Smallest non-zero document length in the segments (0 when none). """
+        lengths = [int(segment.lengths.values[segment.lengths.values > 0].min())
+                   for segment in self.segments if np.any(segment.lengths.values > 0)]
+        return min(lengths) if lengths else 0
+
+    def doc_norms(self, doc_ids, norms, n_docs):
+        """ TF-IDF norms (from the base doc stats, idf = log10(n_docs / df))
+            updated with the norms of the documents of the segments.
+        """
+        return self._overlay(doc_ids, norms, lambda segment: self.segment_norms(segment, n_docs))
+
+    def min_norm(self, n_docs):
+        """ Smallest non-zero TF-IDF norm of a document in the segments (0 when none). """
+        norms = [self.segment_norms(segment, n_docs).values for segment in self.segments]
+        norms = [values[values > 0].min() for values in norms if np.any(values > 0)]
+        return float(min(norms)) if norms else 0.0
+
+    def segment_norms(self, segment, n_docs):
+        """ TF-IDF norm of every document of a segment, computed on first use. """
+        key = (segment.name, n_docs)
+        if key not in self._norms:
+            doc_ids = segment.lengths.doc_ids
+            squares = np.zeros(len(doc_ids))
+            for term, postings in segment.iter_postings():
+                idf = math.log10(n_docs / self.df[term])
+                rows, _ = find_rows(doc_ids, postings['doc_id'])
+                np.add.at(squares, rows, (postings['tf'].astype(np.float64) * idf) ** 2)
+            self._norms[key] = DocValueStore(doc_ids, np.sqrt(squares))
+        return self._norms[key]
+
+    def doc_titles(self, doc_ids, titles):
+        """ `titles` (from the base title store) with the titles the segments carry. """
+        titles = list(titles)
+        for segment in self.segments:
+            if segment.titles is None or len(segment.titles) == 0: continue
+            rows, found = find_rows(segment.titles.doc_ids, doc_ids)
+            for i in np.flatnonzero(found).tolist():
+                titles[i] = segment.titles.title(int(rows[i]))
+        return titles
+
+
+# ==============================================================================
+# MERGING
+# ==============================================================================
+
+def _tier(entry):
+    """ floor(log_MERGE_FACTOR(size)) of a segment, its size counting deletions. """
+    size, tier = entry["n_docs"] + entry["n_removed"], 0
+    while size >= MERGE_FACTOR:
+        size //= MERGE_FACTOR
+        tier += 1
+    return tier
+
+
+def pick_merge(entries):
+    """ Names of the consecutive segments the merge policy compacts next, or
+        None: the newest MERGE_FACTOR segments once they share a size tier,
+        or every segment when there are more than MAX_SEGMENTS.
+    """
+    if len(entries) > MAX_SEGMENTS:
+        return [entry["name"] for entry in entries]
+    newest = entries[-MERGE_FACTOR:]
+    if len(entries) >= MERGE_FACTOR and len({_tier(entry) for entry in newest}) == 1:
+        return [entry["name"] for entry in newest]
+    return None
+
+
+def merge_segments(field_dir, names):
+    """ Replaces the consecutive segments `names` by one segment holding
+        their live documents. Returns the new segment's name.
+    """
+    segments = [DeltaSegment(os.path.join(segments_dir(field_dir), name)) for name in names]
+    index = InvertedIndex()
+    lengths, titles, deleted = {}, {}, set()
+    later = np.empty(0, dtype=np.int64)
+    # Newest first: a document's newest version in the run wins
+    for segment in reversed(segments):
+        live = np.ones(len(segment.lengths), dtype=bool)
+        if len(later):
+            live = ~find_rows(later, segment.lengths.doc_ids)[1]
+        for doc_id, length in zip(segment.lengths.doc_ids[live].tolist(), segment.lengths.values[live].tolist()):
+            lengths[doc_id] = length
+        if segment.titles is not None:
+            for doc_id, title in segment.titles.items():
+                if doc_id in lengths and doc_id not in titles:
+                    titles[doc_id] = title
+        for term, postings in segment.iter_postings():
+            if len(later):
+                postings = postings[~find_rows(later, postings['doc_id'])[1]]
+            if len(postings) == 0: continue
+            index._posting_list[term].extend(zip(postings['doc_id'].tolist(), postings['tf'].tolist()))
+            index.df[term] += len(postings)
+            index.term_total[term] += int(postings['tf'].sum())
+            index.max_tf[term] = max(index.max_tf[term], int(postings['tf'].max()))
+        deleted.update(segment.deleted.tolist())
+        later = np.union1d(later, segment.deleted)
+
+    name = _write_segment(field_dir, index, lengths, deleted, titles)
+    with _locked(field_dir):
+        manifest = read_segments(field_dir)
+        current = [entry["name"] for entry in manifest["segments"]]
+        start = current.index(names[0])
+        if current[start:start + len(names)] != list(names):
+            raise RuntimeError(f"Segments {names} changed during the merge")
+        n_removed = sum(entry["n_removed"] for entry in manifest["segments"][start:start + len(names)])
+        manifest["segments"][start:start + len(names)] = [{"name": name, "n_docs": len(lengths),
+                                                           "n_removed": n_removed}]
+        manifest["retired"].extend({"name": old, "time": time.time()} for old in names)
+        _save_segments(field_dir, manifest)
+    return name
+
+
+def remove_retired(field_dir, retire_seconds=RETIRE_SECONDS):
+    """ Deletes the merged-away segments retired more than `retire_seconds` ago. """
+    with _locked(field_dir):
+        manifest = read_segments(field_dir)
+        expired = [entry for entry in manifest["retired"] if time.time() - entry["time"] >= retire_seconds]
+        if not expired: return
+        manifest["retired"] = [entry for entry in manifest["retired"] if entry not in expired]
+        _save_segments(field_dir, manifest, bump=False)
+    for entry in expired:
+        shutil.rmtree(os.path.join(segments_dir(field_dir), entry["name"]), ignore_errors=True)
+
+
+def maybe_merge(field_dir, merge_all=False):
+    """ Runs the merge the policy picks, if any (all segments with
+        `merge_all`), and removes expired retired segments. Queries are not
+        blocked: readers pick up the result on their next refresh. Returns the
+        new segment's name or None.
+    """
+    if not os.path.exists(os.path.join(segments_dir(field_dir), SEGMENTS_MANIFEST)): return None
+    with _locked(field_dir, ".merge.lock"):
+        remove_retired(field_dir)
+        entries = read_segments(field_dir)["segments"]
+        names = [entry["name"] for entry in entries] if merge_all and len(entries) > 1 else pick_merge(entries)
+        if not names: return None
+        start = time.time()
+        name = merge_segments(field_dir, names)
+        print(f"🧩 Merged {len(names)} segments of {field_dir} into {name} in {time.time() - start:.1f}s")
+        return name
+
+
+# ==============================================================================
+# COMMAND LINE
+# ==============================================================================
+
+def add_jsonl(path, field_dirs=FIELD_DIRS):
+    """ Adds (or replaces) the documents of a JSON-lines file, one
+        {"id": ..., "title": ..., "text": ...} per line, to the body and
+        title fields. Anchor text belongs to the pages linking to a document
+        and is not updated.
+    """
+    bodies, titles = {}, {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip(): continue
+            doc = json.loads(line)
+            bodies[int(doc["id"])] = tokenize(doc.get("text", ""))
+            titles[int(doc["id"])] = doc.get("title", "")
+    add_documents(field_dirs["body"], bodies)
+    add_documents(field_dirs["title"], {doc_id: tokenize(title) for doc_id, title in titles.items()}, titles=titles)
+    print(f"✅ Added {len(bodies)} documents")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Add, delete and merge delta segments.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('add').add_argument('docs', help="JSON-lines file of documents")
+    commands.add_parser('delete').add_argument('doc_ids', type=int, nargs='+')
+    commands.add_parser('merge').add_argument('--all', action='store_true', help="merge all segments of a field")
+    commands.add_parser('list')
+    args = parser.parse_args()
+
+    if args.command == 'add':
+        add_jsonl(args.docs)
+    elif args.command == 'delete':
+        for field_dir in FIELD_DIRS.values():
+            delete_documents(field_dir, args.doc_ids)
+        print(f"✅ Deleted {len(args.doc_ids)} documents")
+    elif args.command == 'merge':
+        for field_dir in FIELD_DIRS.values():
+            maybe_merge(field_dir, merge_all=args.all)
+    else:
+        for field, field_dir in FIELD_DIRS.items():
+            manifest = read_segments(field_dir)
+            print(f"{field}: generation {manifest['generation']}, {len(manifest['segments'])} segments")
+            for entry in manifest["segments"]:
+                print(f"   {entry['name']}: {entry['n_docs']} docs, {entry['n_removed']} deleted")
+    sys.exit(0)
@@ -0,0 +1,207 @@
+import os
+import gc
+import sys
+import time
+import signal
+import socket
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.serving import make_server
+import search_frontend
+
+# ==============================================================================
+# PRE-FORK SERVING
+# ==============================================================================
+# Production entry point: the master process loads every index and store once
+# (search_frontend.load_data, nothing left lazy), freezes the loaded objects out of the garbage
+# collector and forks N workers that all accept on the master's listening socket.
+#
+# The workers share the master's memory copy-on-write. The lexicons, posting
+# files and document stores are memory-mapped and the warmed posting cache is
+# plain numpy buffers, so their pages stay shared. gc.freeze() moves every
+# object that exists at fork time into the permanent generation, so the
+# workers' collections never touch (and never copy) those pages.
+#
+# Each worker keeps its own result cache and posting cache, so the memory of
+# cached lists grows with the worker count (POSTING_CACHE_BYTES per worker).
+#
+# Signals handled by the master:
+#   SIGHUP          - graceful rolling restart of the workers (same loaded data)
+#   SIGTERM/SIGINT  - graceful shutdown: workers finish their in-flight requests
+#
+#   python serve_prefork.py --port 8080 --workers 8
+
+DEFAULT_WORKERS = os.cpu_count() or 1
+# Seconds a stopping worker gets to finish its in-flight requests before it is killed
+GRACEFUL_TIMEOUT = 30
+# Delay before respawning a worker that died, so a crashing worker cannot spin
+RESPAWN_DELAY = 1.0
+
+
+def bind_socket(host, port, backlog=2048):
+    """ The listening socket shared by all workers. """
+    sock = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+# ==============================================================================
+# WORKER
+# ==============================================================================
+
+def serve_worker(sock, host, port):
+    """ Runs in a forked worker: serves the Flask app on the inherited socket
+        until SIGTERM, then waits for its in-flight requests and exits.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl-C is handled by the master
+    signal.signal(signal.SIGHUP, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    # Threads do not survive fork(); the worker gets its own I/O pool
+    search_frontend.io_pool = ThreadPoolExecutor(search_frontend.IO_POOL_SIZE, thread_name_prefix="postings-io")
+    # ... and its own delta segment refresh; the master runs the merges
+    search_frontend.start_segment_maintenance(merge=False)
+
+    server = make_server(host, port, search_frontend.app, threaded=True, fd=sock.fileno())
+    # server_close() joins the request threads, so a stopping worker drains them
+    server.daemon_threads = False
+    server.block_on_close = True
+
+    def stop(signum, frame):
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    print(f"👷 Worker {os.getpid()} serving on {host}:{port}")
+    server.serve_forever()
+    server.server_close()
+    search_frontend.io_pool.shutdown(wait=False)
+
+
+# ==============================================================================
+# MASTER
+# ==============================================================================
+
+class PreforkServer:
+    """ Master process: keeps `n_workers` forked workers alive on one socket. """
+
+    def __init__(self, host, port, n_workers=DEFAULT_WORKERS, graceful_timeout=GRACEFUL_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.n_workers = n_workers
+        self.graceful_timeout = graceful_timeout
+        self.sock = None
+        self.workers = set()
+        self._stopping = False
+        self._restart_requested = False
+
+    def spawn_worker(self):
+        pid = os.fork()
+        if pid == 0:
+            status = 0
+            try:
+                serve_worker(self.sock, self.host, self.port)
+            except BaseException as e:
+                print(f"❌ Worker {os.getpid()} failed: {e}", file=sys.stderr)
+                status = 1
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(status)
+        self.workers.add(pid)
+        return pid
+
+    def stop_worker(self, pid):
+        """ Sends SIGTERM to `pid` and waits for it, killing it after the timeout. """
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+        deadline = time.monotonic() + self.graceful_timeout
+        while time.monotonic() < deadline:
+            done, _ = os.waitpid(pid, os.WNOHANG)
+            if done: break
+            time.sleep(0.1)
+        else:
+            print(f"⚠️ Worker {pid} did not stop within {self.graceful_timeout}s, killing it")
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        self.workers.discard(pid)
+
+    def rolling_restart(self):
+        """ Replaces the workers one at a time: a new worker is started before an
+            old one is stopped, so the socket is never left without acceptors.
+        """
+        print("🔄 Restarting workers...")
+        for pid in list(self.workers):
+            self.spawn_worker()
+            self.stop_worker(pid)
+        print("✅ Workers restarted")
+
+    def reap_workers(self):
+        """ Collects exited workers; returns how many there were. """
+        n_exited = 0
+        while self.workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0: break
+            if pid in self.workers:
+                self.workers.discard(pid)
+                n_exited += 1
+                print(f"⚠️ Worker {pid} exited with status {os.waitstatus_to_exitcode(status)}")
+        return n_exited
+
+    def _on_stop(self, signum, frame):
+        self._stopping = True
+
+    def _on_restart(self, signum, frame):
+        self._restart_requested = True
+
+    def serve_forever(self):
+        # Load once, then move everything loaded out of the collector's reach
+        search_frontend.load_data(lazy=())
+        gc.collect()
+        gc.freeze()
+
+        self.sock = bind_socket(self.host, self.port)
+        print(f"🚀 Master {os.getpid()} listening on {self.host}:{self.port} with {self.n_workers} workers")
+        for _ in range(self.n_workers):
+            self.spawn_worker()
+
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        signal.signal(signal.SIGHUP, self._on_restart)
+        try:
+            while not self._stopping:
+                if self._restart_requested:
+                    self._restart_requested = False
+                    self.rolling_restart()
+                if self.reap_workers():
+                    time.sleep(RESPAWN_DELAY)
+                while len(self.workers) < self.n_workers and not self._stopping:
+                    self.spawn_worker()
+                time.sleep(0.2)
+        finally:
+            print("🛑 Stopping workers...")
+            for pid in list(self.workers):
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+            for pid in list(self.workers):
+                self.stop_worker(pid)
+            self.sock.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve the search engine with pre-forked workers.")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--graceful-timeout', type=float, default=GRACEFUL_TIMEOUT)
+    args = parser.parse_args()
+    PreforkServer(args.host, args.port, args.workers, args.graceful_timeout).serve_forever()
@@ -0,0 +1,56 @@
+import os
+import signal
+import argparse
+import threading
+from werkzeug.serving import make_server
+import search_frontend
+
+# ==============================================================================
+# SHARD SERVER
+# ==============================================================================
+# Serves one document shard (create_inverted_indexes.py with N_SHARDS > 0) for
+# shard_coordinator.py. A shard directory has the layout of a whole-index
+# server, with only the shard's documents:
+#
+#   shards/shard_000/
+#     postings_gcp/postings_{body,title,anchor}/   posting files (and delta segments)
+#     inverted_indexes_pkls/                       lexicons, doc_stats.npy, titles_*
+#
+# The server runs the search frontend from that directory. Missing files are
+# downloaded from the shard's folder in the bucket (shards/shard_000/...), the
+# global PageRank and page views from their usual place; without the GCS key
+# file only local files are used. The coordinator queries /shard_search, and
+# /readyz tells it when the shard is loaded.
+#
+#   python serve_shard.py --dir shards/shard_000 --port 9100
+
+DEFAULT_PORT = 9100
+
+
+def serve_shard(shard_dir, host="127.0.0.1", port=DEFAULT_PORT):
+    """ Loads the shard in `shard_dir` and serves it until SIGTERM / SIGINT. """
+    # Paths given relative to the launch directory keep pointing at the same files
+    search_frontend.KEY_FILE_PATH = os.path.abspath(search_frontend.KEY_FILE_PATH)
+    search_frontend.WARMUP_QUERIES_PATH = os.path.abspath(search_frontend.WARMUP_QUERIES_PATH)
+    shard_name = os.path.basename(os.path.normpath(shard_dir))
+    os.chdir(shard_dir)
+    search_frontend.REMOTE_PREFIX = f"shards/{shard_name}/"
+
+    server = make_server(host, port, search_frontend.app, threaded=True)
+    stop = lambda signum, frame: threading.Thread(target=server.shutdown, daemon=True).start()
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    # Listening right away: /readyz answers 503 until the shard is loaded
+    search_frontend.load_data(wait=False, lazy=(), gcs=os.path.exists(search_frontend.KEY_FILE_PATH))
+    print(f"🧱 Shard {shard_name} serving on {host}:{port}")
+    server.serve_forever()
+    server.server_close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve one document shard for shard_coordinator.py.")
+    parser.add_argument('--dir', required=True, help="shard directory, e.g. shards/shard_000")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    args = parser.parse_args()
+    serve_shard(args.dir, args.host, args.port)
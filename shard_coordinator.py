@@ -0,0 +1,291 @@
+import os
+import sys
+import glob
+import time
+import signal
+import argparse
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, wait
+import requests
+from requests.adapters import HTTPAdapter
+from flask import Flask, request, jsonify
+from werkzeug.serving import make_server
+from lexicon import Lexicon
+from metrics import Registry
+from text_analysis import analyze_query
+from bigrams import query_bigrams
+
+# ==============================================================================
+# SHARD COORDINATOR (SCATTER-GATHER)
+# ==============================================================================
+# With N_SHARDS > 0 the build partitions the documents into shards (doc_id %
+# N_SHARDS), each with its own lexicons, postings, doc stats and titles, served
+# by serve_shard.py. The coordinator serves the search routes of
+# search_frontend.py over all shards:
+#   1. looks up the collection statistics of the query terms (n_docs, avgdl,
+#      df) in the lexicon of the whole body index, and the df of the query's
+#      bigrams in the lexicon of the whole bigram index,
+#   2. sends the query and those statistics to /shard_search of every shard in
+#      parallel,
+#   3. merges the scored top-k lists, best score first and ties by ascending
+#      doc id like a single server.
+# A document's score only depends on its own postings, its own doc stats and
+# the collection statistics, so the merged ranking is the one a single server
+# over the whole index returns.
+#
+# A shard that fails or does not answer within SHARD_TIMEOUT is left out of the
+# response, which then lists it in the X-Shards-Missing header (and in the
+# shard_requests_total counter of /metrics).
+#
+#   python shard_coordinator.py --shards http://10.0.0.2:9100,http://10.0.0.3:9100 --port 8080
+#   python shard_coordinator.py --local shards --port 8080   (a serve_shard.py process per shards/shard_*)
+
+# Lexicon of the whole body index, the source of the collection statistics
+GLOBAL_LEXICON_DIR = "inverted_indexes_pkls/index_body_lexicon"
+# Lexicon of the whole bigram index (optional), the source of the bigram df
+GLOBAL_BIGRAM_LEXICON_DIR = "inverted_indexes_pkls/index_bigram_lexicon"
+# Seconds each shard gets to answer
+SHARD_TIMEOUT = 2.0
+# Concurrent shard requests across all queries
+COORDINATOR_POOL = 64
+# Local shards (--local) listen on consecutive ports from LOCAL_SHARD_PORT
+LOCAL_SHARD_PORT = 9100
+LOCAL_READY_TIMEOUT = 600
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+class ShardCoordinator:
+    """ Fans queries out to the shard servers at `shard_urls` and merges their results.
+
+    Parameters:
+    -----------
+      stats_index: Lexicon (or InvertedIndex) of the whole body index, giving
+                   the collection statistics; None lets every shard score with
+                   its own (idf then differs between shards).
+      timeout: seconds each shard gets to answer.
+      bigram_index: Lexicon of the whole bigram index, or None.
+    """
+
+    def __init__(self, shard_urls, stats_index=None, timeout=SHARD_TIMEOUT, registry=None, bigram_index=None):
+        self.shard_urls = [url.rstrip('/') for url in shard_urls]
+        self.stats_index = stats_index
+        self.bigram_index = bigram_index
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=len(self.shard_urls),
+                                                  pool_maxsize=COORDINATOR_POOL))
+        self.pool = ThreadPoolExecutor(COORDINATOR_POOL, thread_name_prefix="shards")
+        registry = registry or Registry()
+        self.shard_seconds = registry.histogram(
+            "shard_request_seconds", "Latency of /shard_search requests, per shard.", ["shard"])
+        self.shard_requests = registry.counter(
+            "shard_requests_total", "Shard requests by outcome (ok, timeout, error).", ["shard", "outcome"])
+
+    def global_stats(self, query_tokens):
+        """ {"n_docs", "avgdl", "df"} of the query terms (and bigrams) over the whole collection, or None. """
+        index = self.stats_index
+        if index is None: return None
+        df = {token: index.df[token] for token in set(query_tokens) if token in index.df}
+        for bigram in query_bigrams(query_tokens, self.bigram_index):
+            df[bigram] = self.bigram_index.df[bigram]
+        return {"n_docs": index.n_docs, "avgdl": index.avgdl, "df": df}
+
+    def _ask(self, url, payload):
+        start = time.perf_counter()
+        try:
+            response = self.session.post(f"{url}/shard_search", json=payload, timeout=self.timeout)
+            response.raise_for_status()
+            return response.json()
+        finally:
+            self.shard_seconds.observe(time.perf_counter() - start, url)
+
+    def search(self, field, query, k=PAGE_SIZE):
+        """ ([[wiki_id, title], ...] best first, urls of the shards missing from them). """
+        payload = {"query": query, "field": field, "k": k, "stats": self.global_stats(analyze_query(query))}
+        futures = {self.pool.submit(self._ask, url, payload): url for url in self.shard_urls}
+        done, _ = wait(futures, timeout=self.timeout)
+        hits, missing = [], []
+        for future, url in futures.items():
+            if future in done and future.exception() is None:
+                hits.extend(future.result())
+                self.shard_requests.inc(1, url, "ok")
+                continue
+            timed_out = future not in done or isinstance(future.exception(), requests.Timeout)
+            if not timed_out:
+                print(f"   ❌ Shard {url} failed: {future.exception()}")
+            future.cancel()
+            missing.append(url)
+            self.shard_requests.inc(1, url, "timeout" if timed_out else "error")
+        return merge_shard_results(hits, k), missing
+
+
+def merge_shard_results(hits, k):
+    """ The k best of the shards' [wiki_id, score, title] hits as [[wiki_id, title], ...],
+        ties by ascending doc id.
+    """
+    best = sorted(hits, key=lambda hit: (-hit[1], int(hit[0])))[:k]
+    return [[wiki_id, title] for wiki_id, _, title in best]
+
+
+# ==============================================================================
+# LOCAL SHARDS
+# ==============================================================================
+
+def start_local_shards(shards_root, base_port=LOCAL_SHARD_PORT, ready_timeout=LOCAL_READY_TIMEOUT):
+    """ Starts a serve_shard.py process for every shards_root/shard_* directory
+        and waits until all are ready. Returns (urls, processes).
+    """
+    shard_dirs = sorted(glob.glob(os.path.join(shards_root, "shard_*")))
+    if not shard_dirs:
+        raise FileNotFoundError(f"No shard_* directories in {shards_root}")
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "serve_shard.py")
+    urls, processes = [], []
+    for i, shard_dir in enumerate(shard_dirs):
+        port = base_port + i
+        processes.append(subprocess.Popen([sys.executable, script, "--dir", shard_dir, "--port", str(port)]))
+        urls.append(f"http://127.0.0.1:{port}")
+
+    deadline = time.monotonic() + ready_timeout
+    pending = list(urls)
+    while pending:
+        if time.monotonic() > deadline or any(process.poll() is not None for process in processes):
+            stop_local_shards(processes)
+            raise RuntimeError(f"Shards not ready: {', '.join(pending)}")
+        try:
+            if requests.get(f"{pending[0]}/readyz", timeout=1).status_code == 200:
+                pending.pop(0)
+                continue
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    print(f"✅ {len(urls)} local shards ready")
+    return urls, processes
+
+
+def stop_local_shards(processes):
+    for process in processes:
+        if process.poll() is None:
+            process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+# ==============================================================================
+# COORDINATOR APP
+# ==============================================================================
+
+app = Flask(__name__)
+app.config['JSONIFY_PRETTYPRINT_REGULAR'] = False
+metrics_registry = Registry()
+request_seconds = metrics_registry.histogram(
+    "coordinator_request_seconds", "Latency of coordinated search requests.", ["endpoint"])
+coordinator = None
+
+
+def coordinated_search(endpoint, field, k=PAGE_SIZE):
+    query = request.args.get('query', '')
+    if len(query) == 0: return jsonify([])
+    start = time.perf_counter()
+    results, missing = coordinator.search(field, query, k)
+    request_seconds.observe(time.perf_counter() - start, endpoint)
+    response = jsonify(results)
+    if missing:
+        response.headers["X-Shards-Missing"] = ",".join(missing)
+    return response
+
+
+def paged_coordinated_search(endpoint, field):
+    """ /search_title and /search_anchor: `k` results (cursor paging needs the
+        cursor's score, which only its shard knows, so it is not supported here).
+    """
+    if request.args.get('cursor'):
+        return jsonify({"error": "cursor is not supported by the shard coordinator"}), 400
+    try:
+        k = int(request.args.get('k', PAGE_SIZE))
+    except ValueError:
+        return jsonify({"error": "k must be an integer"}), 400
+    if not 1 <= k <= MAX_PAGE_SIZE:
+        return jsonify({"error": f"k must be between 1 and {MAX_PAGE_SIZE}"}), 400
+    return coordinated_search(endpoint, field, k)
+
+
+@app.route("/search")
+def search():
+    return coordinated_search("/search", "all")
+
+
+@app.route("/search_body")
+def search_body():
+    return coordinated_search("/search_body", "body")
+
+
+@app.route("/search_title")
+def search_title():
+    return paged_coordinated_search("/search_title", "title")
+
+
+@app.route("/search_anchor")
+def search_anchor():
+    return paged_coordinated_search("/search_anchor", "anchor")
+
+
+@app.route("/metrics")
+def metrics():
+    return app.response_class(metrics_registry.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route("/healthz")
+def healthz():
+    return jsonify({"status": "ok", "shards": coordinator.shard_urls if coordinator else []})
+
+
+def load_global_stats(lexicon_dir=GLOBAL_LEXICON_DIR):
+    """ The lexicon of the whole body index, or None (with a warning) when it is missing. """
+    if os.path.exists(os.path.join(lexicon_dir, "meta.json")):
+        return Lexicon(lexicon_dir)
+    print(f"⚠️ No global lexicon in {lexicon_dir}: shards score with their own statistics")
+    return None
+
+
+def load_global_bigrams(lexicon_dir=GLOBAL_BIGRAM_LEXICON_DIR):
+    """ The lexicon of the whole bigram index, or None when the build wrote none. """
+    if os.path.exists(os.path.join(lexicon_dir, "meta.json")):
+        return Lexicon(lexicon_dir)
+    return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve the search routes over document shards.")
+    shards = parser.add_mutually_exclusive_group(required=True)
+    shards.add_argument('--shards', help="comma-separated shard server URLs")
+    shards.add_argument('--local', metavar='SHARDS_ROOT', help="start a local shard server per SHARDS_ROOT/shard_*")
+    parser.add_argument('--stats', default=GLOBAL_LEXICON_DIR, help="lexicon directory of the whole body index")
+    parser.add_argument('--bigram-stats', default=GLOBAL_BIGRAM_LEXICON_DIR,
+                        help="lexicon directory of the whole bigram index")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--timeout', type=float, default=SHARD_TIMEOUT)
+    args = parser.parse_args()
+
+    processes = []
+    if args.local:
+        urls, processes = start_local_shards(args.local)
+    else:
+        urls = [url for url in args.shards.split(',') if url]
+    coordinator = ShardCoordinator(urls, load_global_stats(args.stats), args.timeout, metrics_registry,
+                                   load_global_bigrams(args.bigram_stats))
+    server = make_server(args.host, args.port, app, threaded=True)
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown, daemon=True).start())
+    print(f"🚀 Coordinator on {args.host}:{args.port} over {len(urls)} shards")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        stop_local_shards(processes)
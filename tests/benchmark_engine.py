@@ -0,0 +1,295 @@
+import os
+import sys
+import io
+import json
+import math
+import time
+import pickle
+import argparse
+import platform
+import tempfile
+import subprocess
+import contextlib
+from collections import Counter, defaultdict
+import numpy as np
+
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, REPO_ROOT)
+
+from inverted_index_gcp import InvertedIndex
+from posting_codec import POSTING_FORMAT_BLOCKS, decode_posting_list
+from ranking import bm25_idf, bm25_saturation, accumulate_scores, top_k
+from lexicon import Lexicon, write_lexicon
+from doc_stores import DocStatsStore, DocValueStore, TitleStore
+from query_cache import PostingCache
+
+# ==============================================================================
+# LOCAL ENGINE BENCHMARK
+# ==============================================================================
+# Generates a synthetic corpus with Zipf-distributed terms, builds the title,
+# body and anchor indexes with InvertedIndex in a temporary directory (the
+# same on-disk layout the frontend serves: posting files, lexicons, document
+# stores) and times every search endpoint in-process, stage by stage:
+#
+#   tokenize, lexicon (df + posting locations), read (posting bytes),
+#   decode, score, top_k, titles (result assembly), and total
+#
+# The stages follow the exhaustive path (read -> decode -> score -> top-k) so
+# each cost is measured on its own; `total` is the endpoint's real search
+# function (block-max pruning included) with the posting cache disabled.
+# Results (p50/p95/p99 in ms) are saved as JSON, named after the current
+# commit, and can be compared with an earlier run:
+#
+#   python tests/benchmark_engine.py
+#   python tests/benchmark_engine.py --compare bench_results/1a2b3c4.json
+
+BENCH_RESULTS_DIR = os.path.join(REPO_ROOT, "bench_results")
+FIELDS = ("title", "body", "anchor")
+# Fields each endpoint reads
+ENDPOINT_FIELDS = {
+    "/search": ("title", "anchor", "body"),
+    "/search_body": ("body",),
+    "/search_title": ("title",),
+    "/search_anchor": ("anchor",),
+}
+STAGES = ("tokenize", "lexicon", "read", "decode", "score", "top_k", "titles", "total")
+PERCENTILES = (50, 95, 99)
+
+
+# ==============================================================================
+# 1. SYNTHETIC CORPUS
+# ==============================================================================
+
+def make_vocabulary(vocab_size):
+    """ Distinct lowercase words that the tokenizer keeps (no stopwords). """
+    letters = "bcdfghjklmnpqrstvwxz"
+    words = []
+    for rank in range(vocab_size):
+        word, n = "", rank
+        while True:
+            word += letters[n % len(letters)] + "aeiou"[n % 5]
+            n //= len(letters)
+            if n == 0: break
+        words.append(word + "x")
+    return words
+
+
+def generate_corpus(n_docs, vocab_size, zipf_s=1.1, body_len=200, seed=0):
+    """ {doc_id: (title tokens, body tokens, anchor tokens)}, word ranks drawn from Zipf(zipf_s). """
+    rng = np.random.default_rng(seed)
+    vocab = np.array(make_vocabulary(vocab_size))
+    p = 1.0 / np.arange(1, vocab_size + 1) ** zipf_s
+    p /= p.sum()
+    doc_ids = np.sort(rng.choice(np.arange(1, n_docs * 10), n_docs, replace=False))
+    lengths = np.maximum(1, rng.lognormal(math.log(body_len), 0.8, n_docs)).astype(int)
+    docs = {}
+    for doc_id, length in zip(doc_ids.tolist(), lengths.tolist()):
+        title = vocab[rng.choice(vocab_size, rng.integers(1, 6), p=p)].tolist()
+        body = vocab[rng.choice(vocab_size, length, p=p)].tolist()
+        anchor = vocab[rng.choice(vocab_size, rng.integers(0, 30), p=p)].tolist()
+        docs[doc_id] = (title, body, anchor)
+    return docs, vocab.tolist(), p
+
+
+def generate_queries(vocab, p, n_queries, seed=1):
+    rng = np.random.default_rng(seed)
+    return [" ".join(np.array(vocab)[rng.choice(len(vocab), rng.integers(1, 5), p=p)].tolist())
+            for _ in range(n_queries)]
+
+
+# ==============================================================================
+# 2. LOCAL INDEX BUILD
+# ==============================================================================
+
+def build_field(docs, field_id, field, root, n_buckets=8):
+    """ Writes the posting files and lexicon of one field; returns the opened Lexicon. """
+    index = InvertedIndex({doc_id: fields[field_id] for doc_id, fields in docs.items()})
+    base_dir = os.path.join(root, "postings_gcp", f"postings_{field}")
+    os.makedirs(base_dir, exist_ok=True)
+    buckets = defaultdict(list)
+    for w in sorted(index._posting_list):
+        buckets[hash(w) % n_buckets].append((w, sorted(index._posting_list[w])))
+    index.posting_locs = defaultdict(list)
+    for bucket_id, w_pl in buckets.items():
+        InvertedIndex.write_a_posting_list((bucket_id, w_pl), base_dir, posting_format=POSTING_FORMAT_BLOCKS)
+        with open(os.path.join(base_dir, f"{bucket_id}_posting_locs.pickle"), 'rb') as f:
+            for w, locs in pickle.load(f).items():
+                index.posting_locs[w].extend((os.path.basename(name), offset) for name, offset in locs)
+    index.posting_format = POSTING_FORMAT_BLOCKS
+    index.n_docs = len(docs)
+    index.avgdl = sum(len(fields[field_id]) for fields in docs.values()) / len(docs)
+    lexicon_dir = os.path.join(root, "inverted_indexes_pkls", f"index_{field}_lexicon")
+    write_lexicon(index, lexicon_dir)
+    return Lexicon(lexicon_dir)
+
+
+def build_engine(docs, root, sf):
+    """ Builds every index and store under `root` and installs them in the frontend module `sf`. """
+    indexes = {field: build_field(docs, field_id, field, root) for field_id, field in enumerate(FIELDS)}
+    doc_ids = np.array(sorted(docs), dtype=np.int64)
+    body_df = Counter(w for fields in docs.values() for w in set(fields[1]))
+    norms = [math.sqrt(sum((tf * math.log10(len(docs) / body_df[w])) ** 2 for w, tf in Counter(docs[d][1]).items()))
+             for d in doc_ids.tolist()]
+    stores_dir = os.path.join(root, "inverted_indexes_pkls")
+    DocStatsStore.write(os.path.join(stores_dir, "doc_stats.npy"), doc_ids,
+                        [len(docs[d][1]) for d in doc_ids.tolist()], [len(docs[d][0]) for d in doc_ids.tolist()],
+                        [len(docs[d][2]) for d in doc_ids.tolist()], norms)
+    DocValueStore.from_pairs(doc_ids, (doc_ids % 97) / 97.0).save(os.path.join(stores_dir, "pagerank"))
+    TitleStore.from_pairs(doc_ids.tolist(), [" ".join(docs[d][0]).title() for d in doc_ids.tolist()]) \
+        .save(os.path.join(stores_dir, "titles"))
+
+    sf.index_title, sf.index_body, sf.index_anchor = indexes["title"], indexes["body"], indexes["anchor"]
+    sf.doc_stats = DocStatsStore.load(os.path.join(stores_dir, "doc_stats.npy"))
+    sf.page_rank = DocValueStore.load(os.path.join(stores_dir, "pagerank"))
+    sf.id_to_title = TitleStore.load(os.path.join(stores_dir, "titles"))
+    # Every read goes to the posting files
+    sf.posting_cache = PostingCache(0)
+
+
+# ==============================================================================
+# 3. STAGE TIMINGS
+# ==============================================================================
+
+def time_query(sf, endpoint, search_fn, query):
+    """ Milliseconds spent in each stage of one query. """
+    timings = {}
+    start = time.perf_counter()
+    tokens = sf.tokenize(query)
+    timings["tokenize"] = time.perf_counter() - start
+
+    lists = []  # (field, token, df, posting_locs)
+    start = time.perf_counter()
+    for field in ENDPOINT_FIELDS[endpoint]:
+        index = getattr(sf, f"index_{field}")
+        index.find.cache_clear()
+        for token in tokens:
+            df = index.df.get(token, 0)
+            if df: lists.append((field, token, df, index.posting_locs.get(token, [])))
+    timings["lexicon"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    buffers = [bytes(sf.get_reader(f"postings_gcp/postings_{field}").read_list_bytes(locs, df, POSTING_FORMAT_BLOCKS))
+               for field, token, df, locs in lists]
+    timings["read"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    postings = [decode_posting_list(buf, POSTING_FORMAT_BLOCKS) for buf in buffers]
+    timings["decode"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    scores = []
+    for (field, token, df, locs), pl in zip(lists, postings):
+        if field == "body":
+            scores.append(bm25_idf(df, sf.index_body.n_docs) * bm25_saturation(pl['tf'], 1.2))
+        else:
+            scores.append(pl['tf'].astype(np.float64))
+    doc_ids, doc_scores = accumulate_scores([pl['doc_id'] for pl in postings], scores)
+    timings["score"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    top_ids, _ = top_k(doc_ids, doc_scores, 100)
+    timings["top_k"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    sf.to_results(top_ids)
+    timings["titles"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    search_fn(tokens)
+    timings["total"] = time.perf_counter() - start
+    return {stage: seconds * 1000 for stage, seconds in timings.items()}
+
+
+def summarize(samples):
+    summary = {}
+    for stage in STAGES:
+        values = np.array([sample[stage] for sample in samples])
+        summary[stage] = {f"p{q}": round(float(np.percentile(values, q)), 4) for q in PERCENTILES}
+        summary[stage]["mean"] = round(float(values.mean()), 4)
+    return summary
+
+
+def run_benchmark(n_docs=10000, vocab_size=50000, n_queries=200, repeats=3, seed=0):
+    with contextlib.redirect_stdout(io.StringIO()):
+        import search_frontend as sf
+    endpoints = {"/search": sf.search_core, "/search_body": sf.search_body_core,
+                 "/search_title": sf.search_title_core, "/search_anchor": sf.search_anchor_core}
+    previous_dir = os.getcwd()
+    with tempfile.TemporaryDirectory() as root:
+        print(f"🏗️ Building a {n_docs}-document corpus ({vocab_size} terms)...")
+        start = time.perf_counter()
+        docs, vocab, p = generate_corpus(n_docs, vocab_size, seed=seed)
+        os.chdir(root)  # the frontend opens postings_gcp/... relative to the working directory
+        try:
+            build_engine(docs, root, sf)
+            print(f"   Built in {time.perf_counter() - start:.1f}s")
+            queries = generate_queries(vocab, p, n_queries, seed + 1)
+            results = {}
+            for endpoint, search_fn in endpoints.items():
+                samples = []
+                with contextlib.redirect_stdout(io.StringIO()):
+                    for query in queries:  # warm-up: page cache, mmaps
+                        search_fn(sf.tokenize(query))
+                    for _ in range(repeats):
+                        samples.extend(time_query(sf, endpoint, search_fn, query) for query in queries)
+                results[endpoint] = summarize(samples)
+        finally:
+            os.chdir(previous_dir)
+            sf.posting_readers.clear()
+    return {"commit": git_commit(), "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(), "numpy": np.__version__,
+            "corpus": {"n_docs": n_docs, "vocab_size": vocab_size, "n_queries": n_queries,
+                       "repeats": repeats, "seed": seed},
+            "results": results}
+
+
+# ==============================================================================
+# 4. REPORTING
+# ==============================================================================
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_report(run, baseline=None):
+    for endpoint, stages in run["results"].items():
+        print(f"\n{endpoint}")
+        header = f"  {'stage':<10}" + "".join(f"{f'p{q} ms':>11}" for q in PERCENTILES)
+        print(header + (f"{'p50 vs base':>13}" if baseline else ""))
+        for stage in STAGES:
+            row = f"  {stage:<10}" + "".join(f"{stages[stage][f'p{q}']:>11.3f}" for q in PERCENTILES)
+            if baseline and endpoint in baseline["results"]:
+                base = baseline["results"][endpoint][stage]["p50"]
+                row += f"{stages[stage]['p50'] / base:>12.2f}x" if base else f"{'-':>13}"
+            print(row)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the search endpoints on a synthetic corpus.")
+    parser.add_argument('--docs', type=int, default=10000)
+    parser.add_argument('--vocab', type=int, default=50000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default=None, help="result file (default: bench_results/<commit>.json)")
+    parser.add_argument('--compare', default=None, help="an earlier result file to compare against")
+    args = parser.parse_args()
+
+    run = run_benchmark(args.docs, args.vocab, args.queries, args.repeats, args.seed)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline["corpus"] != run["corpus"]:
+            print(f"⚠️ Baseline corpus differs: {baseline['corpus']}")
+    print_report(run, baseline)
+
+    out = args.out or os.path.join(BENCH_RESULTS_DIR, f"{run['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump(run, f, indent=1)
+    print(f"\n💾 Saved {out}")
@@ -0,0 +1,64 @@
+import os
+import sys
+import math
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bigrams import (adjacent_pairs, bigram_terms, bigram_counts_batch, log_likelihood_ratio,
+                     collocation_score, query_bigrams)
+from shard_coordinator import ShardCoordinator
+
+
+class BigramIndex:
+    df = {"new york": 40, "york city": 12}
+
+
+class StatsIndex:
+    n_docs = 1000
+    avgdl = 42.0
+    df = {"new": 300, "york": 50}
+
+
+def test_pairs_are_adjacent_after_stopword_removal():
+    assert adjacent_pairs(["university", "california", "berkeley"]) == ["university california",
+                                                                        "california berkeley"]
+    assert adjacent_pairs(["single"]) == []
+    assert bigram_terms("new york") == ["new", "york"]
+
+    docs = [("The University of California, and the university of California!", 7),
+            ("New York", 8)]
+    assert sorted(bigram_counts_batch(docs)) == [("california university", (7, 1)), ("new york", (8, 1)),
+                                                 ("university california", (7, 2))]
+    assert list(bigram_counts_batch(docs, vocabulary={"university", "california"})) == [
+        ("university california", (7, 2)), ("california university", (7, 1))]
+
+
+def test_likelihood_ratio_separates_collocations():
+    # Perfect association in a 2x2 table of 10s
+    assert math.isclose(log_likelihood_ratio(10, 10, 10, 20), 40 * math.log(2))
+    # Independence: observed count equals the expected n_a * n_b / n
+    assert abs(log_likelihood_ratio(5, 50, 1000, 10000)) < 1e-9
+    assert collocation_score(5, 50, 1000, 10000) == 0.0
+    # Seen less often than chance: no collocation
+    assert collocation_score(1, 500, 1000, 10000) == 0.0
+    # A rare pair of frequent words scores below a name that is almost always together
+    name = collocation_score(90, 100, 120, 1_000_000)
+    common = collocation_score(90, 50_000, 60_000, 1_000_000)
+    assert name > 10.83 and name > common
+
+
+def test_query_bigrams_and_global_bigram_df():
+    assert query_bigrams(["new", "york", "city", "new", "york"], BigramIndex()) == ["new york", "york city"]
+    assert query_bigrams(["york", "new"], BigramIndex()) == []
+    assert query_bigrams(["new", "york"], None) == []
+
+    coordinator = ShardCoordinator([], StatsIndex(), bigram_index=BigramIndex())
+    assert coordinator.global_stats(("new", "york", "pizza")) == {
+        "n_docs": 1000, "avgdl": 42.0, "df": {"new": 300, "york": 50, "new york": 40}}
+
+
+if __name__ == "__main__":
+    test_pairs_are_adjacent_after_stopword_removal()
+    test_likelihood_ratio_separates_collocations()
+    test_query_bigrams_and_global_bigram_df()
+    print("✅ All bigram tests passed")
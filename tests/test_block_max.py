@@ -0,0 +1,154 @@
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from posting_codec import POSTING_DTYPE, POSTING_FORMAT_BLOCKS, encode_posting_list, decode_posting_list
+from ranking import (accumulate_scores, top_k, bm25_saturation, PostingBlocks,
+                     top_k_block_max, top_k_candidates)
+
+# ==========================================
+# CONFIGURATION
+# ==========================================
+N_DOCS = 1_000_000
+LIST_SIZES = [40, 900, 30000, 120000]
+K = 100
+
+
+def random_list(rng, df):
+    doc_ids = np.unique(rng.integers(1, N_DOCS, df))
+    tfs = np.minimum(rng.zipf(1.8, len(doc_ids)), 65535)
+    return doc_ids, tfs
+
+
+def as_blocks(doc_ids, tfs, use_block_format):
+    if use_block_format:
+        pl = list(zip(doc_ids.tolist(), tfs.tolist()))
+        return PostingBlocks.from_blocks_buffer(encode_posting_list(pl, POSTING_FORMAT_BLOCKS))
+    postings = np.empty(len(doc_ids), dtype=POSTING_DTYPE)
+    postings['doc_id'], postings['tf'] = doc_ids, tfs
+    return PostingBlocks.from_postings(postings)
+
+
+def test_block_max_matches_exhaustive():
+    rng = np.random.default_rng(42)
+    for trial in range(24):
+        n_terms = 1 + trial % 4
+        bm25 = trial % 2 == 0
+        terms, doc_id_arrays, score_arrays = [], [], []
+        for _ in range(n_terms):
+            doc_ids, tfs = random_list(rng, int(rng.choice(LIST_SIZES)))
+            weight = float(rng.uniform(0.5, 5.0))
+            if bm25:
+                score_fn = lambda tf, ids, w=weight: bm25_saturation(tf, 1.2) * w
+            else:
+                score_fn = lambda tf, ids, w=weight: tf * w
+            terms.append((as_blocks(doc_ids, tfs, trial % 3 != 0), score_fn))
+            doc_id_arrays.append(doc_ids)
+            score_arrays.append(score_fn(tfs, doc_ids))
+
+        extra_ids = np.unique(rng.integers(1, N_DOCS, 500))
+        extra_scores = rng.uniform(0, 3, len(extra_ids))
+        boost = lambda doc_ids: (doc_ids % 5) * 0.02
+
+        doc_ids, scores = accumulate_scores(doc_id_arrays + [extra_ids], score_arrays + [extra_scores])
+        expected_ids, expected_scores = top_k(doc_ids, scores + boost(doc_ids), K)
+
+        got_ids, got_scores = top_k_block_max(terms, K, extra_ids, extra_scores,
+                                              doc_boost=boost, doc_boost_bound=0.08,
+                                              exhaustive_below=0)
+        assert got_ids.tolist() == expected_ids.tolist(), trial
+        assert np.allclose(got_scores, expected_scores), trial
+
+
+def test_block_max_with_length_normalization():
+    # Document-dependent BM25 (b > 0), bounded at the shortest document length.
+    rng = np.random.default_rng(11)
+    k1, b, min_len = 1.2, 0.75, 5
+    lengths = rng.integers(min_len, 2000, N_DOCS)
+    avgdl = lengths.mean()
+    length_norm = lambda ids: 1 - b + b * lengths[ids] / avgdl
+    for trial in range(6):
+        terms, doc_id_arrays, score_arrays = [], [], []
+        for _ in range(1 + trial % 3):
+            doc_ids, tfs = random_list(rng, int(rng.choice(LIST_SIZES)))
+            weight = float(rng.uniform(0.5, 5.0))
+            score_fn = lambda tf, ids, w=weight: bm25_saturation(tf, k1, length_norm(ids)) * w
+            bound_fn = lambda tf, w=weight: bm25_saturation(tf, k1, 1 - b + b * min_len / avgdl) * w
+            terms.append((as_blocks(doc_ids, tfs, True), score_fn, bound_fn))
+            doc_id_arrays.append(doc_ids)
+            score_arrays.append(score_fn(tfs, doc_ids))
+
+        expected_ids, expected_scores = top_k(*accumulate_scores(doc_id_arrays, score_arrays), K)
+        got_ids, got_scores = top_k_block_max(terms, K, exhaustive_below=0)
+        assert got_ids.tolist() == expected_ids.tolist(), trial
+        assert np.allclose(got_scores, expected_scores), trial
+
+
+def test_block_max_over_decoded_lists():
+    # Blocks over a fully decoded list (the posting cache) rank like the encoded ones.
+    rng = np.random.default_rng(5)
+    terms, cached_terms = [], []
+    for _ in range(3):
+        doc_ids, tfs = random_list(rng, 30000)
+        score_fn = lambda tf, ids, w=float(rng.uniform(0.5, 5.0)): tf * w
+        pl = list(zip(doc_ids.tolist(), tfs.tolist()))
+        buf = encode_posting_list(pl, POSTING_FORMAT_BLOCKS)
+        blocks = PostingBlocks.from_blocks_buffer(buf)
+        postings = decode_posting_list(buf, POSTING_FORMAT_BLOCKS)
+        terms.append((blocks, score_fn))
+        cached_terms.append((PostingBlocks.from_decoded(blocks.headers(), postings), score_fn))
+
+    expected = top_k_block_max(terms, K, exhaustive_below=0)
+    got = top_k_block_max(cached_terms, K, exhaustive_below=0)
+    assert got[0].tolist() == expected[0].tolist() and np.allclose(got[1], expected[1])
+
+
+def test_block_max_skips_blocks():
+    # One term whose best postings sit in a few blocks: most blocks are never decoded.
+    rng = np.random.default_rng(7)
+    doc_ids = np.arange(1, 200_001) * 3
+    tfs = np.ones(len(doc_ids), dtype=np.int64)
+    tfs[rng.choice(len(doc_ids), 150, replace=False)] = 50
+    blocks = as_blocks(doc_ids, tfs, use_block_format=True)
+
+    got_ids, _ = top_k_block_max([(blocks, lambda tf, ids: tf * 1.0)], K, exhaustive_below=0)
+    expected_ids, _ = top_k(doc_ids, tfs * 1.0, K)
+    assert got_ids.tolist() == expected_ids.tolist()
+    assert blocks._decoded.sum() < len(blocks) / 5
+
+
+def test_candidates_match_exhaustive_over_candidates():
+    # Scoring restricted to a candidate set (a bigram list) decodes only the blocks covering it.
+    rng = np.random.default_rng(3)
+    terms, doc_id_arrays, score_arrays = [], [], []
+    for _ in range(3):
+        doc_ids, tfs = random_list(rng, 120000)
+        score_fn = lambda tf, ids, w=float(rng.uniform(0.5, 5.0)): bm25_saturation(tf, 1.2) * w
+        terms.append((as_blocks(doc_ids, tfs, True), score_fn))
+        doc_id_arrays.append(doc_ids)
+        score_arrays.append(score_fn(tfs, doc_ids))
+    candidates = np.unique(np.concatenate([rng.choice(doc_id_arrays[0], 150), rng.integers(1, 1000, 50)]))
+    extra_ids = np.unique(rng.integers(1, N_DOCS, 5000))
+    extra_scores = rng.uniform(0, 3, len(extra_ids))
+    boost = lambda doc_ids: (doc_ids % 5) * 0.02
+
+    doc_ids, scores = accumulate_scores(doc_id_arrays + [extra_ids], score_arrays + [extra_scores])
+    keep = np.isin(doc_ids, candidates)
+    expected_ids, expected_scores = top_k(doc_ids[keep], scores[keep] + boost(doc_ids[keep]), K)
+
+    got_ids, got_scores = top_k_candidates(terms, candidates, K, extra_ids, extra_scores, doc_boost=boost)
+    assert got_ids.tolist() == expected_ids.tolist()
+    assert np.allclose(got_scores, expected_scores)
+    assert all(blocks._decoded.sum() < len(blocks) / 2 for blocks, _ in terms)
+    assert len(top_k_candidates(terms, [], K)[0]) == 0
+
+
+if __name__ == "__main__":
+    test_block_max_matches_exhaustive()
+    test_block_max_with_length_normalization()
+    test_block_max_over_decoded_lists()
+    test_block_max_skips_blocks()
+    test_candidates_match_exhaustive_over_candidates()
+    print("✅ Block-max top-k tests passed.")
@@ -0,0 +1,80 @@
+import os
+import sys
+import tempfile
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from doc_stores import DocStatsStore, DocValueStore, TitleStore, TitleStoreWriter
+
+
+def test_doc_stats_round_trip():
+    rng = np.random.default_rng(0)
+    doc_ids = rng.permutation(np.arange(1, 2001) * 7)
+    body_len = rng.integers(0, 5000, len(doc_ids))
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'doc_stats.npy')
+        DocStatsStore.write(path, doc_ids, body_len, body_len % 20, body_len % 300, np.sqrt(body_len))
+        store = DocStatsStore.load(path)
+
+        assert len(store) == len(doc_ids)
+        assert np.all(np.diff(store.doc_ids.astype(np.int64)) > 0)
+
+        # Unknown ids (3 is not a multiple of 7, 10**9 is past the end) get the default.
+        query = np.array([doc_ids[5], 3, doc_ids[0], 10 ** 9])
+        got = store.column('body_len', query, default=-1)
+        assert got.tolist() == [body_len[5], -1, body_len[0], -1]
+        assert np.allclose(store.column('body_norm', query[[0]]), np.sqrt(body_len[5]))
+
+        assert store.min_positive('body_len') == body_len[body_len > 0].min()
+        assert np.isclose(store.mean('body_len'), body_len.mean())
+        del store
+
+
+def test_doc_values_lookup():
+    pagerank = {12: 0.5, 3: 2.25, 7_000_000: 1.0}
+    store = DocValueStore.from_pairs(list(pagerank.keys()), list(pagerank.values()))
+    with tempfile.TemporaryDirectory() as tmp:
+        store.save(os.path.join(tmp, 'pagerank'))
+        store = DocValueStore.load(os.path.join(tmp, 'pagerank'))
+        # Negative and out of uint32 range ids are unknown, not wrapped around.
+        query = [3, 4, 7_000_000, 12, -1, 2 ** 32 + 3]
+        assert store.lookup(query, 0.0).tolist() == [2.25, 0.0, 1.0, 0.5, 0.0, 0.0]
+        assert store.max() == 2.25 and len(store) == 3
+        del store
+
+    empty = DocValueStore.empty(np.int64)
+    assert empty.lookup([1, 2], 0).tolist() == [0, 0] and empty.max() == 0
+
+
+def test_title_store():
+    titles = {42: "Zürich", 7: "Anarchism", 1000: "", 9: "東京"}
+    with tempfile.TemporaryDirectory() as tmp:
+        prefix = os.path.join(tmp, 'titles')
+        with TitleStoreWriter(prefix) as writer:
+            for doc_id in sorted(titles):
+                writer.add(doc_id, titles[doc_id])
+            writer.add(1000, "duplicate id keeps the first title")
+        store = TitleStore.load(prefix)
+
+        assert store.titles(np.array([9, 8, 42, 1000, 7])) == ["東京", "N/A", "Zürich", "", "Anarchism"]
+        assert store.get(5) is None and list(store.items()) == sorted(titles.items())
+        assert TitleStore.from_pairs(list(titles), list(titles.values())).titles([42, 9]) == ["Zürich", "東京"]
+        del store
+
+        try:
+            with TitleStoreWriter(prefix) as writer:
+                writer.add(5, "b")
+                writer.add(3, "a")
+            assert False, "out of order ids must be rejected"
+        except ValueError:
+            pass
+
+    assert TitleStore.empty().titles([1]) == ["N/A"]
+
+
+if __name__ == "__main__":
+    test_doc_stats_round_trip()
+    test_doc_values_lookup()
+    test_title_store()
+    print("✅ Document store tests passed.")
@@ -0,0 +1,98 @@
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from index_sync import LocalObjectStore, write_manifest, read_manifest, sync
+
+
+class CountingStore(LocalObjectStore):
+    """ Records the (name, start offset) of every download. """
+
+    def __init__(self, root):
+        super().__init__(root)
+        self.downloads = []
+
+    def download(self, name, f, start=0):
+        self.downloads.append((name, start))
+        super().download(name, f, start)
+
+
+def make_bucket(root):
+    store = CountingStore(root)
+    store.write("postings_gcp/postings_body/0_000.bin", os.urandom(100000))
+    store.write("postings_gcp/postings_body/lexicon/terms.npy", os.urandom(3000))
+    store.write("postings_gcp/titles/titles_blob.bin", b"")
+    store.write("unrelated/file.txt", b"not part of the index")
+    return store
+
+
+def test_manifest_and_full_sync():
+    with tempfile.TemporaryDirectory() as bucket_dir, tempfile.TemporaryDirectory() as local:
+        store = make_bucket(bucket_dir)
+        manifest = write_manifest(store)
+        assert sorted(manifest["files"]) == ["postings_gcp/postings_body/0_000.bin",
+                                             "postings_gcp/postings_body/lexicon/terms.npy",
+                                             "postings_gcp/titles/titles_blob.bin"]
+        assert read_manifest(store) == manifest
+
+        summary = sync(store, local, workers=4)
+        assert (summary["downloaded"], summary["kept"], summary["failed"]) == (3, 0, 0)
+        assert summary["bytes"] == 103000
+        for name in manifest["files"]:
+            with open(os.path.join(local, name), 'rb') as f:
+                assert f.read() == store.read(name)
+
+        # Nothing to do the second time
+        store.downloads.clear()
+        summary = sync(store, local)
+        assert (summary["downloaded"], summary["kept"]) == (0, 3) and store.downloads == []
+
+        # A changed file in the bucket gets a new index version and is fetched again
+        store.write("postings_gcp/postings_body/lexicon/terms.npy", os.urandom(3000))
+        assert write_manifest(store)["index_version"] != manifest["index_version"]
+        summary = sync(store, local)
+        assert (summary["downloaded"], summary["kept"]) == (1, 2)
+
+
+def test_resume_and_checksum_verification():
+    with tempfile.TemporaryDirectory() as bucket_dir, tempfile.TemporaryDirectory() as local:
+        store = make_bucket(bucket_dir)
+        write_manifest(store)
+        name = "postings_gcp/postings_body/0_000.bin"
+        data = store.read(name)
+        path = os.path.join(local, *name.split('/'))
+        os.makedirs(os.path.dirname(path))
+
+        # An interrupted download resumes where it stopped
+        with open(path + ".part", 'wb') as f:
+            f.write(data[:40000])
+        sync(store, local)
+        assert (name, 40000) in store.downloads
+        with open(path, 'rb') as f:
+            assert f.read() == data
+        assert not os.path.exists(path + ".part")
+
+        # A corrupt partial file fails the checksum and is downloaded again in full
+        os.remove(path)
+        with open(path + ".part", 'wb') as f:
+            f.write(b"x" * 40000)
+        store.downloads.clear()
+        summary = sync(store, local)
+        assert store.downloads == [(name, 40000), (name, 0)] and summary["failed"] == 0
+        with open(path, 'rb') as f:
+            assert f.read() == data
+
+        # A complete but corrupt local file of the right size is replaced
+        with open(path, 'r+b') as f:
+            f.write(b"y")
+        assert sync(store, local)["downloaded"] == 1
+        with open(path, 'rb') as f:
+            assert f.read() == data
+
+
+if __name__ == "__main__":
+    test_manifest_and_full_sync()
+    test_resume_and_checksum_verification()
+    print("✅ All index sync tests passed")
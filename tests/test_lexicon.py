@@ -0,0 +1,53 @@
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from inverted_index_gcp import InvertedIndex
+from lexicon import Lexicon, write_lexicon
+from posting_codec import POSTING_FORMAT_BLOCKS
+
+
+def build_index():
+    docs = {1: ["apple", "banana", "apple"], 2: ["banana", "café"], 3: ["zebra", "apple", "émigré"]}
+    index = InvertedIndex(docs)
+    index.posting_locs = {term: [(f"{i % 3}_000.bin", 6 * i)] for i, term in enumerate(sorted(index.df))}
+    # A list spanning two files
+    index.posting_locs["apple"] = [("2_000.bin", 1999990), ("2_001.bin", 0)]
+    index.posting_format = POSTING_FORMAT_BLOCKS
+    index.n_docs, index.avgdl = 3, 7 / 3
+    return index
+
+
+def test_lexicon_matches_index():
+    index = build_index()
+    with tempfile.TemporaryDirectory() as tmp:
+        write_lexicon(index, tmp)
+        lexicon = Lexicon(tmp)
+
+        assert len(lexicon) == len(index.df)
+        assert sorted(lexicon.df) == sorted(index.df)
+        for term in index.df:
+            assert lexicon.df[term] == index.df[term]
+            assert lexicon.term_total[term] == index.term_total[term]
+            assert lexicon.max_tf[term] == index.max_tf[term]
+            assert lexicon.posting_locs[term] == index.posting_locs[term]
+
+        assert "cherry" not in lexicon.df and lexicon.df.get("cherry", 0) == 0
+        assert lexicon.posting_locs.get("cherry", []) == []
+        assert (lexicon.posting_format, lexicon.n_docs, lexicon.avgdl) == (POSTING_FORMAT_BLOCKS, 3, 7 / 3)
+        assert lexicon.impact_scale == 1.0
+
+
+def test_empty_lexicon():
+    with tempfile.TemporaryDirectory() as tmp:
+        write_lexicon(InvertedIndex(), tmp)
+        lexicon = Lexicon(tmp)
+        assert len(lexicon) == 0 and lexicon.df.get("apple") is None
+
+
+if __name__ == "__main__":
+    test_lexicon_matches_index()
+    test_empty_lexicon()
+    print("✅ Lexicon tests passed.")
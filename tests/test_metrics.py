@@ -0,0 +1,87 @@
+import os
+import sys
+import json
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from metrics import Registry, QueryMetrics, Trace, use_trace, span, fetch_span, record_io
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = Registry()
+    histogram = registry.histogram("latency_seconds", "Latency.", ["endpoint"], buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 2.0):
+        histogram.observe(value, "/search")
+    registry.gauge_callback("cache", "Cache counters.", lambda: {("hits",): 3}, ["stat"])
+    lines = registry.render().splitlines()
+    assert "# TYPE latency_seconds histogram" in lines
+    assert 'latency_seconds_bucket{endpoint="/search",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{endpoint="/search",le="1.0"} 3' in lines
+    assert 'latency_seconds_bucket{endpoint="/search",le="+Inf"} 4' in lines
+    assert 'latency_seconds_sum{endpoint="/search"} 3.05' in lines
+    assert 'latency_seconds_count{endpoint="/search"} 4' in lines
+    assert 'cache{stat="hits"} 3' in lines
+
+
+def test_trace_collects_spans_and_fetches_across_threads():
+    trace = Trace("/search", "hello world")
+    with use_trace(trace):
+        with span("tokenize"):
+            pass
+        record_io(n_bytes=10)
+
+        def fetch(term):
+            with use_trace(trace), fetch_span("body", term):
+                record_io(n_bytes=60, n_postings=10)
+
+        threads = [threading.Thread(target=fetch, args=(term,)) for term in ("hello", "world")]
+        for thread in threads: thread.start()
+        for thread in threads: thread.join()
+    record_io(n_bytes=1000)  # outside the trace: not counted
+    trace.finish()
+
+    assert set(trace.stages) == {"tokenize"}
+    assert (trace.bytes_read, trace.postings_decoded) == (130, 20)
+    assert sorted(fetch["term"] for fetch in trace.fetches) == ["hello", "world"]
+    assert all((fetch["bytes"], fetch["postings"]) == (60, 10) for fetch in trace.fetches)
+
+
+def test_slow_queries_are_logged_with_their_stages():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        log_path = os.path.join(tmp_dir, "slow.log")
+        registry = Registry()
+        query_metrics = QueryMetrics(registry, slow_query_seconds=0.0, slow_query_log=log_path)
+        trace = Trace("/search_body", "slow query")
+        trace.stages.update(search=0.3, fetch=0.1, results=0.05)
+        query_metrics.observe(trace.finish())
+
+        with open(log_path) as f:
+            entry = json.loads(f.readline())
+        assert entry["endpoint"] == "/search_body" and entry["query"] == "slow query"
+        assert entry["stages_ms"]["score"] == 150.0
+        assert 'search_slow_queries_total{endpoint="/search_body"} 1' in registry.render()
+
+        query_metrics.slow_query_seconds = 10.0
+        query_metrics.observe(Trace("/search_body", "fast query").finish())
+        with open(log_path) as f:
+            assert len(f.readlines()) == 1
+
+
+def test_fetch_labels_are_fields_for_segments_too():
+    import search_frontend as sf
+    trace = Trace("/search", "apple")
+    for folder in ("postings_gcp/postings_body", "postings_gcp/postings_body/segments/seg_000007",
+                   "postings_gcp/postings_body/segments/seg_000008", "postings_gcp/postings_body_impact",
+                   "postings_gcp/postings_bigram", "shards/elsewhere"):
+        sf.traced_fetch(trace, lambda index, token, remote_folder: None, None, "apple", folder)
+    assert [fetch["field"] for fetch in trace.fetches] == ["body", "body", "body", "body_impact", "bigram", "other"]
+
+
+if __name__ == "__main__":
+    test_histogram_renders_cumulative_buckets()
+    test_trace_collects_spans_and_fetches_across_threads()
+    test_slow_queries_are_logged_with_their_stages()
+    test_fetch_labels_are_fields_for_segments_too()
+    print("✅ All metrics tests passed")
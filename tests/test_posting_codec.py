@@ -0,0 +1,75 @@
+import os
+import sys
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from posting_codec import (POSTING_FORMAT_TUPLES, POSTING_FORMAT_BLOCKS, POSTING_FORMAT_IMPACTS,
+                           BLOCK_POSTINGS, encode_posting_list, decode_posting_list,
+                           read_list_header, read_block_headers, read_impact_segments)
+
+# ==========================================
+# CONFIGURATION
+# ==========================================
+LIST_SIZES = [0, 1, 2, BLOCK_POSTINGS - 1, BLOCK_POSTINGS, BLOCK_POSTINGS + 1, 5000]
+
+
+def random_posting_list(n, seed):
+    rng = random.Random(seed)
+    doc_ids = sorted(rng.sample(range(1, 70_000_000), n))
+    return [(doc_id, rng.choice([1, 1, 1, 2, 3, rng.randint(1, 65535)])) for doc_id in doc_ids]
+
+
+def as_tuples(arr):
+    return list(zip(arr['doc_id'].tolist(), arr['tf'].tolist()))
+
+
+def test_round_trip_both_formats():
+    for posting_format in (POSTING_FORMAT_TUPLES, POSTING_FORMAT_BLOCKS):
+        for n in LIST_SIZES:
+            pl = random_posting_list(n, seed=n)
+            b = encode_posting_list(pl, posting_format)
+            assert as_tuples(decode_posting_list(b, posting_format)) == pl, (posting_format, n)
+
+
+def test_blocks_header_and_prefix_decode():
+    pl = random_posting_list(1000, seed=7)
+    b = encode_posting_list(pl, POSTING_FORMAT_BLOCKS)
+    n_postings, n_blocks, n_bytes = read_list_header(b)
+    assert (n_postings, n_bytes) == (1000, len(b))
+
+    headers = read_block_headers(b)
+    assert n_blocks == len(headers) == -(-1000 // BLOCK_POSTINGS)
+    assert headers['first_doc'][0] == pl[0][0] and headers['last_doc'][-1] == pl[-1][0]
+    assert headers['max_tf'][0] == max(tf for _, tf in pl[:BLOCK_POSTINGS])
+
+    assert as_tuples(decode_posting_list(b, POSTING_FORMAT_BLOCKS, max_postings=300)) == pl[:300]
+
+
+def test_blocks_sorts_and_compresses():
+    # Anchor postings arrive unsorted; consecutive ids with tf=1 need no payload bits.
+    pl = [(doc_id, 1) for doc_id in range(1000, 3000)]
+    shuffled = pl[:]
+    random.Random(0).shuffle(shuffled)
+    b = encode_posting_list(shuffled, POSTING_FORMAT_BLOCKS)
+    assert as_tuples(decode_posting_list(b, POSTING_FORMAT_BLOCKS)) == pl
+    assert len(b) < len(encode_posting_list(pl, POSTING_FORMAT_TUPLES)) / 20
+
+
+def test_impacts_grouped_by_impact():
+    rng = random.Random(3)
+    pl = [(doc_id, rng.randint(1, 255)) for doc_id, _ in random_posting_list(3000, seed=3)]
+    b = encode_posting_list(pl, POSTING_FORMAT_IMPACTS)
+    assert as_tuples(decode_posting_list(b, POSTING_FORMAT_IMPACTS)) == pl
+
+    headers, _ = read_impact_segments(b)
+    assert headers['impact'].tolist() == sorted({impact for _, impact in pl}, reverse=True)
+    assert headers['count'].sum() == len(pl)
+
+
+if __name__ == "__main__":
+    test_round_trip_both_formats()
+    test_blocks_header_and_prefix_decode()
+    test_blocks_sorts_and_compresses()
+    test_impacts_grouped_by_impact()
+    print("✅ Posting codec tests passed.")
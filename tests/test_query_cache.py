@@ -0,0 +1,121 @@
+import os
+import sys
+import time
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from query_cache import ResultCache, PostingCache, FrequencySketch
+
+
+def test_lru_eviction_by_bytes():
+    cache = ResultCache(max_bytes=30, ttl=60)
+    for key in "abc":
+        cache.get_or_compute(key, lambda: b"x" * 10)
+    cache.get_or_compute("a", lambda: b"recomputed")  # hit: "a" becomes most recent
+    cache.get_or_compute("d", lambda: b"y" * 10)      # evicts "b", the least recent
+
+    assert cache.get_or_compute("a", lambda: b"miss") == b"x" * 10
+    assert cache.get_or_compute("b", lambda: b"miss") == b"miss"
+    stats = cache.stats()
+    assert stats['bytes'] <= 30 and stats['evictions'] >= 1
+
+    # A value larger than the whole budget is returned but not kept.
+    assert cache.get_or_compute("big", lambda: b"z" * 100) == b"z" * 100
+    assert cache.get_or_compute("big", lambda: b"again") == b"again"
+
+
+def test_ttl_and_version_invalidation():
+    cache = ResultCache(ttl=0.05)
+    cache.check_version(1)
+    cache.get_or_compute("q", lambda: b"v1")
+    assert cache.get_or_compute("q", lambda: b"v2") == b"v1"
+    time.sleep(0.06)
+    assert cache.get_or_compute("q", lambda: b"v2") == b"v2"
+    assert cache.stats()['expirations'] == 1
+
+    cache.check_version(2)
+    assert cache.get_or_compute("q", lambda: b"v3") == b"v3"
+    assert cache.stats()['invalidations'] == 1
+
+
+def test_single_flight():
+    cache = ResultCache()
+    calls, release = [], threading.Event()
+
+    def slow():
+        calls.append(1)
+        release.wait(5)
+        return b"result"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute("q", slow)))
+               for _ in range(8)]
+    for t in threads: t.start()
+    while cache.stats()['coalesced'] < 7: time.sleep(0.001)
+    release.set()
+    for t in threads: t.join()
+
+    assert results == [b"result"] * 8 and len(calls) == 1
+    stats = cache.stats()
+    assert (stats['misses'], stats['coalesced']) == (1, 7)
+
+
+def test_errors_are_not_cached():
+    cache = ResultCache()
+
+    def fail():
+        raise RuntimeError("index read failed")
+
+    try:
+        cache.get_or_compute("q", fail)
+        assert False
+    except RuntimeError:
+        pass
+    assert cache.get_or_compute("q", lambda: b"ok") == b"ok"
+    assert cache.stats()['errors'] == 1
+
+
+def test_posting_cache_keeps_frequent_terms():
+    cache = PostingCache(max_bytes=100)
+    for _ in range(5):
+        cache.get(("body", "hot"))
+    assert cache.put(("body", "hot"), "hot list", 60)
+
+    # A term seen once cannot push out a more frequent one...
+    cache.get(("body", "rare"))
+    assert not cache.admits(("body", "rare"), 60)
+    assert not cache.put(("body", "rare"), "rare list", 60)
+    # ...but fits next to it when there is room.
+    assert cache.put(("body", "small"), "small list", 40)
+    assert cache.get(("body", "hot")) == "hot list"
+
+    # A term that became more frequent than the hot one replaces it.
+    for _ in range(10):
+        cache.get(("title", "new"))
+    assert cache.put(("title", "new"), "new list", 90)
+    assert cache.get(("body", "hot")) is None
+    stats = cache.stats()
+    assert stats['bytes'] <= 100 and stats['evictions'] == 2 and stats['rejections'] == 1
+
+    cache.check_version(1)
+    cache.check_version(2)
+    assert cache.get(("title", "new")) is None and cache.stats()['entries'] == 0
+
+
+def test_frequency_sketch_ages():
+    sketch = FrequencySketch(width=64, sample_size=100)
+    sketch.increment("a", 40)
+    assert sketch.estimate("a") >= 40
+    sketch.increment("b", 60)  # reaches the sample size: every counter is halved
+    assert 20 <= sketch.estimate("a") < 40
+
+
+if __name__ == "__main__":
+    test_lru_eviction_by_bytes()
+    test_ttl_and_version_invalidation()
+    test_single_flight()
+    test_errors_are_not_cached()
+    test_posting_cache_keeps_frequent_terms()
+    test_frequency_sketch_ages()
+    print("✅ Result cache tests passed.")
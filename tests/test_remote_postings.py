@@ -0,0 +1,110 @@
+import os
+import sys
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from index_sync import LocalObjectStore
+from remote_postings import BlockCache, RemoteFileReader
+from inverted_index_gcp import BLOCK_SIZE
+
+
+class CountingStore(LocalObjectStore):
+    """ Records every ranged request. """
+
+    def __init__(self, root):
+        super().__init__(root)
+        self.requests = []
+
+    def read_range(self, name, start, end):
+        self.requests.append((name, start, end))
+        return super().read_range(name, start, end)
+
+
+def test_ranged_reads_are_coalesced_and_cached():
+    data = os.urandom(10000)
+    with tempfile.TemporaryDirectory() as bucket_dir, tempfile.TemporaryDirectory() as cache_dir:
+        store = CountingStore(bucket_dir)
+        store.write("postings_body/0_000.bin", data)
+        reader = RemoteFileReader(store, BlockCache(cache_dir), block_size=1000)
+
+        # Blocks 2..4 in one request
+        assert reader.read("postings_body/0_000.bin", 2500, 2000) == data[2500:4500]
+        assert store.requests == [("postings_body/0_000.bin", 2000, 5000)]
+
+        # Cached blocks are not fetched again; the missing runs (1 and 5..8) are, one request each
+        store.requests.clear()
+        assert reader.read("postings_body/0_000.bin", 4000, 1000) == data[4000:5000]
+        assert store.requests == []
+        reader.read("postings_body/0_000.bin", 300, 10)
+        store.requests.clear()
+        assert reader.read("postings_body/0_000.bin", 0, 9000) == data[:9000]
+        assert store.requests == [("postings_body/0_000.bin", 1000, 2000),
+                                  ("postings_body/0_000.bin", 5000, 9000)]
+
+        # Reads past the end of the object are cut short
+        assert reader.read("postings_body/0_000.bin", 9500, 2000) == data[9500:]
+
+        # The cache survives a restart
+        store.requests.clear()
+        reopened = RemoteFileReader(store, BlockCache(cache_dir), block_size=1000)
+        assert reopened.read("postings_body/0_000.bin", 0, 10000) == data
+        assert store.requests == []
+
+
+def test_request_counters_are_exact_across_threads():
+    data = os.urandom(64 * 100)
+    with tempfile.TemporaryDirectory() as bucket_dir, tempfile.TemporaryDirectory() as cache_dir:
+        store = CountingStore(bucket_dir)
+        for i in range(8):
+            store.write(f"postings_body/{i}_000.bin", data)
+        reader = RemoteFileReader(store, BlockCache(cache_dir), block_size=64)
+
+        def read_all(i):
+            # Every other block, so every read is its own request
+            for block in range(0, 100, 2):
+                reader.read(f"postings_body/{i}_000.bin", block * 64, 64)
+
+        threads = [threading.Thread(target=read_all, args=(i,)) for i in range(8)]
+        for thread in threads: thread.start()
+        for thread in threads: thread.join()
+        stats = reader.stats()
+        assert stats["requests"] == len(store.requests) == 8 * 50
+        assert stats["bytes_fetched"] == 8 * 50 * 64 and stats["misses"] == 8 * 50
+
+
+def test_cache_is_bounded_lru():
+    data = os.urandom(8000)
+    with tempfile.TemporaryDirectory() as bucket_dir, tempfile.TemporaryDirectory() as cache_dir:
+        store = CountingStore(bucket_dir)
+        store.write("f.bin", data)
+        cache = BlockCache(cache_dir, max_bytes=3000)
+        reader = RemoteFileReader(store, cache, block_size=1000)
+        for block in (0, 1, 2):
+            reader.read("f.bin", block * 1000, 1000)
+        reader.read("f.bin", 0, 1)  # block 0 is now the most recently used
+        reader.read("f.bin", 5000, 1000)  # evicts block 1
+        stats = cache.stats()
+        assert (stats["blocks"], stats["bytes"], stats["evictions"]) == (3, 3000, 1)
+        assert cache.get("f.bin", 1) is None and cache.get("f.bin", 0) == data[:1000]
+        assert sum(len(files) for _, _, files in os.walk(cache_dir)) == 3
+
+
+def test_posting_list_spanning_files():
+    head, tail = os.urandom(300), os.urandom(500)
+    with tempfile.TemporaryDirectory() as bucket_dir, tempfile.TemporaryDirectory() as cache_dir:
+        store = CountingStore(bucket_dir)
+        store.write("postings_body/0_000.bin", b"\0" * (BLOCK_SIZE - 300) + head)
+        store.write("postings_body/0_001.bin", tail + b"\0" * 100)
+        reader = RemoteFileReader(store, BlockCache(cache_dir))
+        locs = [("0_000.bin", BLOCK_SIZE - 300), ("0_001.bin", 0)]
+        assert reader.read_locs("postings_body", locs, 800) == head + tail
+
+
+if __name__ == "__main__":
+    test_ranged_reads_are_coalesced_and_cached()
+    test_request_counters_are_exact_across_threads()
+    test_cache_is_bounded_lru()
+    test_posting_list_spanning_files()
+    print("✅ All remote posting tests passed")
@@ -0,0 +1,405 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import tempfile
+import threading
+from contextlib import contextmanager
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from posting_codec import DECODED_DTYPE, POSTING_FORMAT_BLOCKS
+from inverted_index_gcp import InvertedIndex
+from lexicon import write_lexicon
+from doc_stores import DocStatsStore, DocValueStore, TitleStore
+from index_sync import LocalObjectStore
+from remote_postings import BlockCache, RemoteFileReader
+from bigrams import adjacent_pairs
+import search_frontend as sf
+import search_frontend_asgi as sfa
+
+# doc_id: (body, title, anchor)
+CORPUS = {
+    11: ("apple banana apple cherry", "Apple", "apple fruit"),
+    23: ("banana bread banana banana", "Banana Bread", "banana recipe"),
+    35: ("cherry apple pie with apple and cherry", "Cherry Pie", "pie"),
+    47: ("date palm banana apple", "Date Palm", "palm tree date"),
+    59: ("apple apple apple orchard", "Apple Orchard", "apple orchard"),
+}
+
+# Doc 2 is the best match of "apple cherry" without holding the pair "apple cherry"
+PHRASE_CORPUS = {
+    2: ("cherry cherry apple apple", "Orchard", "orchard"),
+    4: ("apple cherry banana bread date palm fig", "Fig", "fig"),
+    6: ("banana apple cherry date palm fig bread", "Palm", "palm"),
+    8: ("banana bread", "Bread", "bread"),
+    10: ("date palm", "Date", "date"),
+    12: ("fig bread", "Bread", "bread"),
+}
+
+
+def postings(doc_ids):
+    result = np.zeros(len(doc_ids), dtype=DECODED_DTYPE)
+    result['doc_id'] = doc_ids
+    result['tf'] = 1
+    return result
+
+
+# Doc 5 is in 3 lists, docs 2, 4, 9 in 2, docs 1, 3, 7, 8 in 1
+LISTS = [postings([1, 2, 4, 5, 9]), postings([2, 3, 5, 7]), postings([4, 5, 8, 9])]
+
+
+def pages(posting_lists, k):
+    """ Every page of count_top_k, each one after the last doc of the previous. """
+    result, cursor = [], None
+    while True:
+        doc_ids, _ = count_top_k_list(posting_lists, k, cursor)
+        if not doc_ids: return result
+        result.append(doc_ids)
+        cursor = doc_ids[-1]
+
+
+def count_top_k_list(posting_lists, k, cursor=None):
+    doc_ids, counts = sf.count_top_k(posting_lists, k, cursor)
+    return doc_ids.tolist(), counts.tolist()
+
+
+def test_count_top_k_orders_by_count_then_doc_id():
+    assert count_top_k_list(LISTS, 4) == ([5, 2, 4, 9], [3.0, 2.0, 2.0, 2.0])
+    assert count_top_k_list([], 4) == ([], [])
+
+
+def test_pages_split_ties_without_gaps_or_repeats():
+    # The count-2 tie (2, 4, 9) and the count-1 tie cross page boundaries
+    assert pages(LISTS, 2) == [[5, 2], [4, 9], [1, 3], [7, 8]]
+    assert pages(LISTS, 3) == [[5, 2, 4], [9, 1, 3], [7, 8]]
+    assert count_top_k_list(LISTS, 2, cursor=9) == ([1, 3], [1.0, 1.0])
+    assert count_top_k_list(LISTS, 2, cursor=8) == ([], [])
+
+
+def test_cursor_of_a_deleted_document_gives_no_results():
+    without_4 = [postings([1, 2, 5, 9]), LISTS[1], postings([5, 8, 9])]
+    assert count_top_k_list(without_4, 3, cursor=4) == ([], [])
+    assert count_top_k_list(without_4, 3, cursor=6) == ([], [])
+
+
+def test_page_size_limits():
+    many = [postings(np.arange(1, 2501))]
+    doc_ids, _ = count_top_k_list(many, sf.MAX_PAGE_SIZE)
+    assert doc_ids == list(range(1, sf.MAX_PAGE_SIZE + 1))
+    doc_ids, _ = count_top_k_list(many, sf.MAX_PAGE_SIZE, cursor=doc_ids[-1])
+    assert doc_ids == list(range(sf.MAX_PAGE_SIZE + 1, 2 * sf.MAX_PAGE_SIZE + 1))
+
+
+def test_parse_page_params():
+    assert sf.parse_page_params(None, None) == (sf.PAGE_SIZE, None)
+    assert sf.parse_page_params("1", "") == (1, None)
+    assert sf.parse_page_params(str(sf.MAX_PAGE_SIZE), "123") == (sf.MAX_PAGE_SIZE, 123)
+    for k, cursor in [("0", None), (str(sf.MAX_PAGE_SIZE + 1), None), ("-5", None),
+                      ("ten", None), ("1.5", None), (None, "abc"), (None, "4.0")]:
+        try:
+            sf.parse_page_params(k, cursor)
+            assert False, f"k={k!r}, cursor={cursor!r} must be rejected"
+        except ValueError:
+            pass
+
+
+def test_fetch_postings_runs_concurrently_in_order():
+    lock = threading.Lock()
+    calls, in_flight, most_in_flight = [], [0], [0]
+
+    def slow_fetch(index, token, remote_folder):
+        with lock:
+            calls.append(token)
+            in_flight[0] += 1
+            most_in_flight[0] = max(most_in_flight[0], in_flight[0])
+        time.sleep(0.05)
+        with lock:
+            in_flight[0] -= 1
+        return f"{remote_folder}:{token}"
+
+    tokens = ["a", "b", "a", "c", "d", "e", "f", "b"]
+    fetches = [(slow_fetch, None, token, "postings_gcp/postings_body") for token in tokens]
+    results = sf.fetch_postings(fetches, fanout=3)
+    assert results == [f"postings_gcp/postings_body:{token}" for token in tokens]
+    # Repeated terms are read once; at most `fanout` reads of one query at a time
+    assert sorted(calls) == ["a", "b", "c", "d", "e", "f"]
+    assert most_in_flight[0] == 3
+
+    # Within shared_postings a batch reads every list once across its queries
+    calls.clear()
+    with sf.shared_postings():
+        sf.fetch_postings(fetches[:4])
+        assert sf.fetch_postings(fetches[2:6]) == results[2:6]
+    assert sorted(calls) == ["a", "b", "c", "d", "e"]
+
+
+def write_corpus(root, corpus=CORPUS, bigram_index=False):
+    """ The index files of `corpus` in the layout the loaders read, under `root`,
+        with a bigram index of every adjacent body pair if `bigram_index`.
+    """
+    os.makedirs(os.path.join(root, "inverted_indexes_pkls"))
+    ids = sorted(corpus)
+    tokens = {field: {doc_id: sf.tokenize(corpus[doc_id][i]) for doc_id in ids}
+              for i, field in enumerate(["body", "title", "anchor"])}
+    if bigram_index:
+        tokens["bigram"] = {doc_id: adjacent_pairs(tokens["body"][doc_id]) for doc_id in ids}
+    for field, docs in tokens.items():
+        index = InvertedIndex(docs)
+        folder = os.path.join(root, sf.POSTING_FOLDERS[field])
+        os.makedirs(folder)
+        index.write_posting_lists(folder, POSTING_FORMAT_BLOCKS)
+        index.n_docs = len(docs)
+        index.avgdl = sum(map(len, docs.values())) / len(docs)
+        write_lexicon(index, os.path.join(root, f"inverted_indexes_pkls/index_{field}_lexicon"))
+    lengths = {field: [len(docs[doc_id]) for doc_id in ids] for field, docs in tokens.items()}
+    DocStatsStore.write(os.path.join(root, "inverted_indexes_pkls/doc_stats.npy"), ids, lengths["body"],
+                        lengths["title"], lengths["anchor"], [1.0 + doc_id / 100 for doc_id in ids])
+    TitleStore.from_pairs(ids, [corpus[doc_id][1] for doc_id in ids]).save(
+        os.path.join(root, "inverted_indexes_pkls/titles"))
+    DocValueStore.from_pairs(ids, [doc_id % 7 * 0.5 for doc_id in ids]).save(
+        os.path.join(root, "inverted_indexes_pkls/pagerank"))
+
+
+@contextmanager
+def serving_corpus(corpus=CORPUS, bigram_index=False):
+    """ search_frontend over `corpus` (see write_corpus): every component
+        pending (not loaded yet). The module state is restored afterwards.
+    """
+    names = list(sf.COMPONENT_LOADERS)
+    saved = ({name: getattr(sf, name) for name in names}, {name: dict(sf.component_status[name]) for name in names},
+             dict(sf._component_loaded), set(sf.posting_readers), sf.remote_reader, os.getcwd())
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        write_corpus(tmp_dir, corpus, bigram_index)
+        os.chdir(tmp_dir)
+        try:
+            for name in names:
+                sf.component_status[name] = {"state": "pending"}
+                sf._component_loaded[name] = threading.Event()
+            sf.result_cache.clear()
+            sf.posting_cache.clear()
+            yield
+        finally:
+            globals_, status, events, readers, remote_reader, cwd = saved
+            os.chdir(cwd)
+            for name in names:
+                setattr(sf, name, globals_[name])
+                sf.component_status[name] = status[name]
+            sf._component_loaded.update(events)
+            for folder in set(sf.posting_readers) - readers:
+                sf.posting_readers.pop(folder).close()
+            sf.remote_reader = remote_reader
+            sf.result_cache.clear()
+            sf.posting_cache.clear()
+
+
+def load_all():
+    for name in sf.COMPONENT_LOADERS:
+        sf.load_component(name)
+
+
+async def asgi_request(method, path, query_string=b"", body=b""):
+    """ (status, body bytes) of one request to the ASGI app. """
+    messages, sent = [{'type': 'http.request', 'body': body}], []
+
+    async def receive(): return messages.pop(0)
+
+    async def send(message): sent.append(message)
+
+    await sfa.app({'type': 'http', 'method': method, 'path': path, 'query_string': query_string}, receive, send)
+    return sent[0]['status'], b''.join(message.get('body', b'') for message in sent[1:])
+
+
+class RemoteReaderStub:
+    def stats(self):
+        return {"hits": 3, "misses": 1, "requests": 1}
+
+
+def test_asgi_and_flask_routes_agree():
+    with serving_corpus():
+        load_all()
+        client = sf.app.test_client()
+        gets = [("/search", "query=apple+cherry"), ("/search", "query=banana"), ("/search_body", "query=apple+pie"),
+                ("/search_title", "query=apple+palm&k=1"), ("/search_anchor", "query=apple+palm+tree"),
+                ("/search_title", "query=apple&k=0"), ("/search", "query=")]
+        posts = [("/get_pagerank", [11, 47, 999]), ("/get_pageview", [11]),
+                 ("/search_batch", {"queries": ["apple", "banana bread"], "field": "all", "k": 2})]
+
+        flask = [(r.status_code, r.data) for r in
+                 [client.get(path, query_string=query) for path, query in gets] +
+                 [client.post(path, json=body) for path, body in posts]]
+        sf.result_cache.clear()
+
+        async def run_asgi():
+            responses = [await asgi_request("GET", path, query.encode()) for path, query in gets]
+            responses += [await asgi_request("POST", path, body=json.dumps(body).encode()) for path, body in posts]
+            return responses
+
+        asgi = asyncio.run(run_asgi())
+        for (flask_status, flask_body), (asgi_status, asgi_body), request in zip(flask, asgi, gets + posts):
+            assert flask_status == asgi_status, request
+            if request[0] == "/search_batch":
+                assert list(map(json.loads, flask_body.splitlines())) == list(map(json.loads, asgi_body.splitlines()))
+            else:
+                assert json.loads(flask_body) == json.loads(asgi_body), request
+        assert [status for status, _ in flask] == [200] * 5 + [400, 200] + [200] * 3
+        assert all(json.loads(flask[i][1]) for i in range(5))
+        assert json.loads(flask[3][1]) == [["11", "Apple"]]
+
+
+def test_cache_stats_agree_between_servers():
+    with serving_corpus():
+        sf.remote_reader = RemoteReaderStub()
+        flask_stats = sf.app.test_client().get("/cache_stats").get_json()
+        status, body = asyncio.run(asgi_request("GET", "/cache_stats"))
+        assert status == 200 and json.loads(body) == flask_stats
+        assert flask_stats["blocks"] == {"hits": 3, "misses": 1, "requests": 1}
+        assert set(flask_stats) == {"results", "postings", "blocks"}
+
+
+def test_shard_search_drops_cached_lists_of_swapped_indexes():
+    with serving_corpus():
+        load_all()
+        sf.posting_cache.check_version(None)
+        first = sf.shard_search_results("apple banana", "all", 3)
+        assert [doc_id for doc_id, _, _ in first] and sf.posting_cache.stats()['entries'] > 0
+
+        # refresh_segments swaps the index for a new object
+        sf.index_body = sf.load_index("index_body", sf.POSTING_FOLDERS["body"])
+        invalidations = sf.posting_cache.stats()['invalidations']
+        assert sf.shard_search_results("apple banana", "all", 3) == first
+        assert sf.posting_cache.stats()['invalidations'] == invalidations + 1
+
+
+def test_readyz_until_components_load_and_lazy_loading():
+    with serving_corpus():
+        client = sf.app.test_client()
+        response = client.get("/readyz")
+        assert response.status_code == 503 and response.get_json()["ready"] is False
+        assert asyncio.run(asgi_request("GET", "/readyz"))[0] == 503
+
+        for name in sf.READY_COMPONENTS:
+            sf.load_component(name)
+        response = client.get("/readyz")
+        assert response.status_code == 200 and response.get_json()["ready"] is True
+        status, body = asyncio.run(asgi_request("GET", "/readyz"))
+        assert status == 200 and json.loads(body)["components"]["index_body"]["state"] == "ready"
+
+        # A lazy component loads on its first use; one still loading is waited for
+        sf.component_status["index_title"]["state"] = "lazy"
+        sf.component_status["id_to_title"]["state"] = "lazy"
+        assert client.get("/search_title", query_string={"query": "apple"}).get_json() == [
+            ["11", "Apple"], ["59", "Apple Orchard"]]
+        assert sf.component_status["index_title"]["state"] == "ready"
+        assert "seconds" in sf.component_status["index_title"]
+
+        waiter = threading.Thread(target=sf.ensure_loaded, args=("doc_stats",))
+        waiter.start()
+        waiter.join(0.2)
+        assert waiter.is_alive()  # pending: waits for the startup loader
+        sf.load_component("doc_stats")
+        waiter.join(5)
+        assert not waiter.is_alive() and sf.doc_stats is not None
+
+
+def test_posting_cache_tells_indexes_of_one_folder_apart():
+    folder = "postings_gcp/postings_rebuilt"
+    with serving_corpus():
+        os.makedirs(folder)
+        first = InvertedIndex({1: ["apple"]})
+        first.write_posting_lists(folder, POSTING_FORMAT_BLOCKS)
+        assert sf.get_posting_list(first, "apple", folder)['doc_id'].tolist() == [1]
+        assert sf.posting_cache.stats()['entries'] == 1
+
+        # A rebuild writes another index to the same folder
+        sf.posting_readers.pop(folder).close()
+        second = InvertedIndex({2: ["apple"], 3: ["apple", "pie"]})
+        second.write_posting_lists(folder, POSTING_FORMAT_BLOCKS)
+        assert sf.get_posting_list(second, "apple", folder)['doc_id'].tolist() == [2, 3]
+        assert sf.get_posting_blocks(second, "apple", folder).gather(np.arange(1))[0].tolist() == [2, 3]
+
+
+def test_remote_postings_are_read_under_the_remote_prefix():
+    folder = "postings_gcp/postings_remote"
+    with serving_corpus(), tempfile.TemporaryDirectory() as bucket_dir:
+        # The whole index and shard 1 in one bucket, with the same posting file names
+        whole, shard = InvertedIndex({1: ["apple"], 2: ["apple"]}), InvertedIndex({3: ["apple"], 5: ["apple"]})
+        for index, prefix in [(whole, ""), (shard, "shards/shard_001/")]:
+            os.makedirs(os.path.join(bucket_dir, prefix + folder))
+            index.write_posting_lists(os.path.join(bucket_dir, prefix + folder), POSTING_FORMAT_BLOCKS)
+
+        saved = sf.REMOTE_POSTINGS, sf.REMOTE_PREFIX
+        try:
+            sf.REMOTE_POSTINGS, sf.REMOTE_PREFIX = True, "shards/shard_001/"
+            sf.remote_reader = RemoteFileReader(LocalObjectStore(bucket_dir), BlockCache("block_cache"))
+            assert sf.get_posting_list(shard, "apple", folder)['doc_id'].tolist() == [3, 5]
+        finally:
+            sf.REMOTE_POSTINGS, sf.REMOTE_PREFIX = saved
+        assert not os.path.exists(folder)
+
+
+def test_synced_index_files_are_loaded_next_to_their_postings():
+    with serving_corpus():
+        # A rebuild synced to postings_gcp/ while inverted_indexes_pkls/ still holds the old copies
+        rebuilt = InvertedIndex({7: ["kiwi"]})
+        rebuilt.n_docs, rebuilt.avgdl = 1, 1.0
+        write_lexicon(rebuilt, os.path.join(sf.POSTING_FOLDERS["body"], "lexicon"))
+        os.makedirs("postings_gcp/doc_stats")
+        DocStatsStore.write("postings_gcp/doc_stats/doc_stats.npy", [7], [1], [1], [1], [1.0])
+        os.makedirs("postings_gcp/titles")
+        TitleStore.from_pairs([7], ["Kiwi"]).save("postings_gcp/titles/titles")
+
+        assert "apple" in sf.load_base_index("index_body", sf.POSTING_FOLDERS["body"]).df
+        assert sf.load_id_map().get(7) is None
+        try:
+            sf.index_synced = True
+            index = sf.load_base_index("index_body", sf.POSTING_FOLDERS["body"])
+            assert "kiwi" in index.df and "apple" not in index.df
+            assert sf.load_doc_stats().doc_ids.tolist() == [7]
+            assert sf.load_id_map().get(7) == "Kiwi"
+        finally:
+            sf.index_synced = False
+
+
+def test_bigram_candidates_drop_documents_without_the_phrase():
+    query = sf.tokenize("apple cherry")
+    with serving_corpus(PHRASE_CORPUS, bigram_index=True):
+        load_all()
+        assert sf.index_bigram.df["apple cherry"] == 2
+        saved = sf.BIGRAM_CANDIDATES
+        try:
+            sf.BIGRAM_CANDIDATES = False
+            exhaustive = sf.rank_core(query, 2)[0].tolist()
+            exhaustive_3 = sf.rank_core(query, 3)[0].tolist()
+            sf.BIGRAM_CANDIDATES = True
+            candidates = sf.rank_core(query, 2)[0].tolist()
+            candidates_3 = sf.rank_core(query, 3)[0].tolist()
+        finally:
+            sf.BIGRAM_CANDIDATES = saved
+    # Exact top 2 over all documents: doc 2 scores highest
+    assert exhaustive[0] == 2 and len(exhaustive) == 2
+    # The pair's df (2) reaches k: only the documents holding it are ranked, doc 2 is dropped
+    assert exhaustive_3[0] == 2 and sorted(exhaustive_3[1:]) == [4, 6]
+    assert candidates == exhaustive_3[1:]
+    # Below k no query pair narrows the ranking: exact again
+    assert candidates_3 == exhaustive_3
+
+
+if __name__ == "__main__":
+    test_count_top_k_orders_by_count_then_doc_id()
+    test_pages_split_ties_without_gaps_or_repeats()
+    test_cursor_of_a_deleted_document_gives_no_results()
+    test_page_size_limits()
+    test_parse_page_params()
+    test_fetch_postings_runs_concurrently_in_order()
+    test_asgi_and_flask_routes_agree()
+    test_cache_stats_agree_between_servers()
+    test_readyz_until_components_load_and_lazy_loading()
+    test_shard_search_drops_cached_lists_of_swapped_indexes()
+    test_posting_cache_tells_indexes_of_one_folder_apart()
+    test_remote_postings_are_read_under_the_remote_prefix()
+    test_synced_index_files_are_loaded_next_to_their_postings()
+    test_bigram_candidates_drop_documents_without_the_phrase()
+    print("✅ All search frontend tests passed")
@@ -0,0 +1,156 @@
+import os
+import sys
+import tempfile
+from contextlib import closing
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from inverted_index_gcp import InvertedIndex, MultiFileReader
+from lexicon import Lexicon, write_lexicon
+from posting_codec import LIST_HEADER, EMPTY_POSTINGS, read_list_header, decode_posting_list
+from ranking import PostingBlocks, top_k_block_max
+import segments
+from segments import (SegmentedIndex, add_documents, delete_documents, read_segments, pick_merge,
+                      maybe_merge, remove_retired)
+
+BASE_DOCS = {
+    1: ["apple", "banana"],
+    2: ["apple", "apple", "cherry"],
+    3: ["banana", "cherry"],
+    4: ["apple"],
+}
+
+
+def write_base(field_dir, docs=BASE_DOCS):
+    os.makedirs(field_dir)
+    index = InvertedIndex(docs)
+    index.write_posting_lists(field_dir, segments.SEGMENT_POSTING_FORMAT)
+    index.n_docs = len(docs)
+    write_lexicon(index, os.path.join(field_dir, "lexicon"))
+    return Lexicon(os.path.join(field_dir, "lexicon"))
+
+
+def postings(index, token):
+    """ {doc_id: tf} of `token` over the base and the segments of `index`. """
+    parts = []
+    for part, folder in [(index.base, index.field_dir)] + [(s.index, s.dir) for s in index.segments]:
+        with closing(MultiFileReader(folder)) as reader:
+            parts.append(_read(part, token, reader))
+    merged = index.merge_postings(parts)
+    return dict(zip(merged['doc_id'].tolist(), merged['tf'].tolist()))
+
+
+def _read(part, token, reader):
+    if token not in part.posting_locs: return EMPTY_POSTINGS
+    locs = part.posting_locs[token]
+    _, _, n_bytes = read_list_header(reader.read(locs, LIST_HEADER.size))
+    return decode_posting_list(reader.read(locs, n_bytes), part.posting_format)
+
+
+def test_added_updated_and_deleted_documents():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        field_dir = os.path.join(tmp_dir, "postings_body")
+        base = write_base(field_dir)
+        assert SegmentedIndex.open(base, field_dir) is base
+
+        add_documents(field_dir, {5: ["apple", "date"], 2: ["date"]}, titles={5: "Five", 2: "Two v2"})
+        delete_documents(field_dir, [3])
+        add_documents(field_dir, {5: ["banana", "banana"]})
+        index = SegmentedIndex.open(base, field_dir)
+
+        assert len(index.segments) == 3 and index.generation == read_segments(field_dir)["generation"]
+        assert postings(index, "apple") == {1: 1, 4: 1}
+        assert postings(index, "banana") == {1: 1, 5: 2}
+        assert postings(index, "cherry") == {}
+        assert postings(index, "date") == {2: 1}
+        # Statistics count postings until they are merged away
+        assert index.df["apple"] == 4 and index.df["date"] == 2 and "date" in index.df
+        assert list(index.doc_lengths([1, 2, 5], [2, 3, 0])) == [2, 1, 2]
+        assert index.doc_titles([2, 5, 1], ["Two", "N/A", "One"]) == ["Two v2", "Five", "One"]
+
+        # Block-max scoring over the parts, the base leaving out replaced documents
+        blocks = [PostingBlocks.from_postings(_read(part, "apple", MultiFileReader(folder))).exclude(
+                  index.deleted_after(i)) for i, (part, folder) in
+                  enumerate([(base, field_dir)] + [(s.index, s.dir) for s in index.segments])]
+        top_ids, top_scores = top_k_block_max([(b, lambda tf, doc_ids: tf * 1.0) for b in blocks], 10)
+        assert top_ids.tolist() == [1, 4] and top_scores.tolist() == [1.0, 1.0]
+
+
+def test_merge_policy_tiers_and_cap():
+    small = [{"name": f"s{i}", "n_docs": 3, "n_removed": 0} for i in range(segments.MERGE_FACTOR)]
+    assert pick_merge(small[:-1]) is None
+    assert pick_merge(small) == [entry["name"] for entry in small]
+    large = [{"name": "big", "n_docs": segments.MERGE_FACTOR ** 2, "n_removed": 0}]
+    assert pick_merge(large + small[:-1]) is None
+    assert pick_merge(large + small) == [entry["name"] for entry in small]
+    mixed = [{"name": f"m{i}", "n_docs": 10 ** (i % 3), "n_removed": 0} for i in range(segments.MAX_SEGMENTS + 1)]
+    assert pick_merge(mixed) == [entry["name"] for entry in mixed]
+
+
+def test_merge_keeps_live_documents_and_retires_old_segments():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        field_dir = os.path.join(tmp_dir, "postings_body")
+        base = write_base(field_dir)
+        add_documents(field_dir, {5: ["apple"], 6: ["banana"]}, titles={5: "Five", 6: "Six"})
+        add_documents(field_dir, {5: ["cherry", "cherry"]}, deleted=[6, 1], titles={5: "Five v2"})
+        before = SegmentedIndex.open(base, field_dir)
+        expected = {token: postings(before, token) for token in ("apple", "banana", "cherry")}
+
+        name = maybe_merge(field_dir, merge_all=True)
+        manifest = read_segments(field_dir)
+        assert [entry["name"] for entry in manifest["segments"]] == [name]
+        assert len(manifest["retired"]) == 2
+        after = SegmentedIndex.open(base, field_dir)
+        assert {token: postings(after, token) for token in expected} == expected
+        assert after.df["cherry"] == 3 and after.df.get("banana") == 2
+        assert after.doc_titles([5, 6], ["N/A", "N/A"]) == ["Five v2", "N/A"]
+
+        # Readers of the old generation keep working until the segments are removed
+        assert postings(before, "cherry") == expected["cherry"]
+        remove_retired(field_dir, retire_seconds=0)
+        assert read_segments(field_dir)["retired"] == []
+        assert sorted(os.listdir(segments.segments_dir(field_dir))) == sorted([name, "segments.json", ".lock",
+                                                                               ".merge.lock"])
+
+
+def test_refresh_closes_readers_of_merged_segments():
+    import search_frontend as sf
+    saved = sf.index_body, dict(sf.component_status["index_body"]), set(sf.posting_readers)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.chdir(tmp_dir)
+        try:
+            field_dir = sf.SEGMENTED_INDEXES["index_body"]
+            base = write_base(field_dir)
+            add_documents(field_dir, {5: ["apple"]})
+            add_documents(field_dir, {6: ["apple", "banana"]})
+            sf.index_body = sf.open_segments(base, field_dir)
+            sf.component_status["index_body"]["state"] = "ready"
+            old_dirs = [segment.dir for segment in sf.index_body.segments]
+            assert sf.get_posting_list(sf.index_body, "apple", field_dir)['doc_id'].tolist() == [1, 2, 4, 5, 6]
+            old_readers = [sf.posting_readers[folder] for folder in old_dirs]
+            assert all(reader._mmaps for reader in old_readers)
+
+            maybe_merge(field_dir, merge_all=True)
+            sf.refresh_segments()
+            # Dropped from the shared readers at once, closed one refresh later
+            assert not any(folder in sf.posting_readers for folder in old_dirs)
+            assert sorted(map(id, sf.retired_readers)) == sorted(map(id, old_readers))
+            sf.refresh_segments()
+            assert sf.retired_readers == [] and not any(reader._mmaps for reader in old_readers)
+            assert sf.get_posting_list(sf.index_body, "apple", field_dir)['doc_id'].tolist() == [1, 2, 4, 5, 6]
+        finally:
+            os.chdir(cwd)
+            sf.index_body = saved[0]
+            sf.component_status["index_body"] = saved[1]
+            for folder in set(sf.posting_readers) - saved[2]:
+                sf.posting_readers.pop(folder).close()
+            sf.segment_folders.clear()
+
+
+if __name__ == "__main__":
+    test_added_updated_and_deleted_documents()
+    test_merge_policy_tiers_and_cap()
+    test_merge_keeps_live_documents_and_retires_old_segments()
+    test_refresh_closes_readers_of_merged_segments()
+    print("✅ All segment tests passed")
@@ -0,0 +1,68 @@
+import os
+import sys
+import time
+import threading
+from flask import Flask, request, jsonify
+from werkzeug.serving import make_server
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from metrics import Registry
+from shard_coordinator import ShardCoordinator, merge_shard_results
+
+
+class StatsIndex:
+    n_docs = 1000
+    avgdl = 42.0
+    df = {"apple": 10, "banana": 3}
+
+
+def start_fake_shard(hits, delay=0.0, status=200):
+    """ A shard answering /shard_search with `hits`; returns (url, received payloads, server). """
+    app = Flask(__name__)
+    received = []
+
+    @app.route("/shard_search", methods=['POST'])
+    def shard_search():
+        received.append(request.get_json())
+        time.sleep(delay)
+        return jsonify(hits[:received[-1]["k"]]), status
+
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", received, server
+
+
+def test_merge_orders_by_score_then_doc_id():
+    hits = [["30", 1.5, "c"], ["12", 2.0, "a"], ["7", 1.5, "b"], ["40", 0.5, "d"]]
+    assert merge_shard_results(hits, 3) == [["12", "a"], ["7", "b"], ["30", "c"]]
+    assert merge_shard_results([], 3) == []
+
+
+def test_scatter_gather_with_global_stats_and_slow_shards():
+    shards = [start_fake_shard([["3", 9.0, "three"], ["6", 1.0, "six"]]),
+              start_fake_shard([["4", 5.0, "four"], ["1", 1.0, "one"]]),
+              start_fake_shard([["2", 99.0, "slow"]], delay=1.0),
+              start_fake_shard([], status=500)]
+    registry = Registry()
+    coordinator = ShardCoordinator([url for url, _, _ in shards], StatsIndex(), timeout=0.3, registry=registry)
+    try:
+        results, missing = coordinator.search("all", "Apple apple cherry", k=3)
+        assert results == [["3", "three"], ["4", "four"], ["1", "one"]]
+        assert missing == [shards[2][0], shards[3][0]]
+        payload = shards[0][1][0]
+        assert payload == {"query": "Apple apple cherry", "field": "all", "k": 3,
+                           "stats": {"n_docs": 1000, "avgdl": 42.0, "df": {"apple": 10}}}
+        lines = registry.render().splitlines()
+        assert f'shard_requests_total{{shard="{shards[0][0]}",outcome="ok"}} 1' in lines
+        assert f'shard_requests_total{{shard="{shards[2][0]}",outcome="timeout"}} 1' in lines
+        assert f'shard_requests_total{{shard="{shards[3][0]}",outcome="error"}} 1' in lines
+    finally:
+        for _, _, server in shards:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    test_merge_orders_by_score_then_doc_id()
+    test_scatter_gather_with_global_stats_and_slow_shards()
+    print("✅ All shard coordinator tests passed")
@@ -0,0 +1,77 @@
+import os
+import re
+import sys
+from collections import Counter
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from text_analysis import (ALL_STOPWORDS, ENGLISH_STOPWORDS, QUERY_MEMO_SIZE, analyze_query, tokenize,
+                           word_count, word_counts_batch, anchor_tokens_batch)
+
+TEXTS = [
+    "The History of the United States of America",
+    "Albert Einstein's theory of relativity (1905) – see also: E=mc²",
+    "Rock-'n'-roll, hip-hop and #hashtags @mentions don't won't CAN'T",
+    "Zürich, São Paulo, Москва, 東京 and naïve café façades",
+    "a an the of " + "x" * 30 + " " + "long" * 10,
+    "Category:Living people | References | External links | thumb|200px",
+    "",
+]
+
+
+def test_index_and_query_tokens_match():
+    pairs = [(text, doc_id) for doc_id, text in enumerate(TEXTS)]
+    indexed = {}
+    for token, (doc_id, tf) in word_counts_batch(iter(pairs)):
+        indexed.setdefault(doc_id, Counter())[token] += tf
+    anchors = {}
+    for token, doc_id in anchor_tokens_batch((doc_id, text) for text, doc_id in pairs):
+        anchors.setdefault(doc_id, Counter())[token] += 1
+
+    for text, doc_id in pairs:
+        query_tokens = analyze_query(text)
+        assert indexed.get(doc_id, Counter()) == Counter(query_tokens)
+        assert anchors.get(doc_id, Counter()) == Counter(query_tokens)
+        assert sorted(word_count(text, doc_id)) == sorted((t, (doc_id, tf)) for t, tf in Counter(query_tokens).items())
+        assert not ALL_STOPWORDS.intersection(query_tokens)
+
+
+def test_tokens_match_the_original_analyzer():
+    # The analyzer the existing indexes were built with
+    re_word = re.compile(r"""[\#\@\w](['\-]?\w){2,24}""", re.UNICODE)
+
+    def original(text):
+        tokens = [token.group() for token in re_word.finditer(text.lower())]
+        return [token for token in tokens if token not in ALL_STOPWORDS]
+
+    for text in TEXTS:
+        assert tokenize(text) == original(text) == list(analyze_query(text))
+    assert tokenize("Who wrote the History of Rome?") == ["wrote", "rome"]
+
+
+def test_bundled_stopwords_match_nltk():
+    stopwords = pytest.importorskip("nltk.corpus").stopwords
+    try:
+        nltk_english = frozenset(stopwords.words('english'))
+    except LookupError:
+        pytest.skip("the NLTK stopwords corpus is not installed")
+    assert ENGLISH_STOPWORDS == nltk_english
+
+
+def test_query_memo_is_bounded():
+    analyze_query.cache_clear()
+    for i in range(QUERY_MEMO_SIZE + 10):
+        analyze_query(f"query number {i}")
+    info = analyze_query.cache_info()
+    assert info.maxsize == QUERY_MEMO_SIZE and info.currsize == QUERY_MEMO_SIZE
+    assert analyze_query("Query Number 5") == ("query", "number")
+    assert analyze_query("again again") is analyze_query("again again")
+
+
+if __name__ == "__main__":
+    test_index_and_query_tokens_match()
+    test_tokens_match_the_original_analyzer()
+    test_bundled_stopwords_match_nltk()
+    test_query_memo_is_bounded()
+    print("✅ All text analysis tests passed")
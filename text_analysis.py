@@ -0,0 +1,84 @@
+import re
+from collections import Counter
+from functools import lru_cache
+
+# ==============================================================================
+# TEXT ANALYSIS (SHARED BY THE INDEX BUILD AND THE FRONTEND)
+# ==============================================================================
+# Documents are tokenized at index time and queries at search time with the
+# same rules, so a query term matches the indexed term exactly: lowercase,
+# RE_WORD tokens, minus ALL_STOPWORDS. The stopword list is bundled (NLTK's
+# English list plus frequent Wikipedia boilerplate words), so nothing is
+# downloaded at startup. Changing any of this requires rebuilding the indexes.
+
+RE_WORD = re.compile(r"""[\#\@\w](['\-]?\w){2,24}""", re.UNICODE)
+
+# nltk.corpus.stopwords.words('english')
+ENGLISH_STOPWORDS = frozenset([
+    'i', 'me', 'my', 'myself', 'we', 'our', 'ours', 'ourselves', 'you', "you're", "you've", "you'll", "you'd",
+    'your', 'yours', 'yourself', 'yourselves', 'he', 'him', 'his', 'himself', 'she', "she's", 'her', 'hers',
+    'herself', 'it', "it's", 'its', 'itself', 'they', 'them', 'their', 'theirs', 'themselves', 'what', 'which',
+    'who', 'whom', 'this', 'that', "that'll", 'these', 'those', 'am', 'is', 'are', 'was', 'were', 'be', 'been',
+    'being', 'have', 'has', 'had', 'having', 'do', 'does', 'did', 'doing', 'a', 'an', 'the', 'and', 'but', 'if',
+    'or', 'because', 'as', 'until', 'while', 'of', 'at', 'by', 'for', 'with', 'about', 'against', 'between',
+    'into', 'through', 'during', 'before', 'after', 'above', 'below', 'to', 'from', 'up', 'down', 'in', 'out',
+    'on', 'off', 'over', 'under', 'again', 'further', 'then', 'once', 'here', 'there', 'when', 'where', 'why',
+    'how', 'all', 'any', 'both', 'each', 'few', 'more', 'most', 'other', 'some', 'such', 'no', 'nor', 'not',
+    'only', 'own', 'same', 'so', 'than', 'too', 'very', 's', 't', 'can', 'will', 'just', 'don', "don't",
+    'should', "should've", 'now', 'd', 'll', 'm', 'o', 're', 've', 'y', 'ain', 'aren', "aren't", 'couldn',
+    "couldn't", 'didn', "didn't", 'doesn', "doesn't", 'hadn', "hadn't", 'hasn', "hasn't", 'haven', "haven't",
+    'isn', "isn't", 'ma', 'mightn', "mightn't", 'mustn', "mustn't", 'needn', "needn't", 'shan', "shan't",
+    'shouldn', "shouldn't", 'wasn', "wasn't", 'weren', "weren't", 'won', "won't", 'wouldn', "wouldn't",
+])
+CORPUS_STOPWORDS = frozenset(["category", "references", "also", "external", "links",
+                              "may", "first", "see", "history", "people", "one", "two",
+                              "part", "thumb", "including", "second", "following",
+                              "many", "however", "would", "became"])
+ALL_STOPWORDS = ENGLISH_STOPWORDS | CORPUS_STOPWORDS
+
+# Distinct queries whose analysis is memoized (least recently used dropped first)
+QUERY_MEMO_SIZE = 8192
+
+
+def iter_tokens(text):
+    """ The tokens of `text`, in order, as a generator. """
+    for match in RE_WORD.finditer(text.lower()):
+        token = match.group()
+        if token not in ALL_STOPWORDS:
+            yield token
+
+
+def tokenize(text):
+    return list(iter_tokens(text))
+
+
+@lru_cache(maxsize=QUERY_MEMO_SIZE)
+def analyze_query(query):
+    """ The tokens of a query, as a tuple; repeated queries are served from a bounded memo. """
+    return tuple(iter_tokens(query))
+
+
+# ==============================================================================
+# INDEX BUILD
+# ==============================================================================
+# For Spark: rdd.flatMap(lambda x: word_count(x[0], x[1])) per document, or
+# rdd.mapPartitions(word_counts_batch) to stream a whole partition through
+# one generator, counting each document's terms without a token list.
+
+def word_count(text, doc_id):
+    """ (token, (doc_id, tf)) for every distinct token of a document. """
+    return [(token, (doc_id, tf)) for token, tf in Counter(iter_tokens(text)).items()]
+
+
+def word_counts_batch(pairs):
+    """ Yields (token, (doc_id, tf)) for every (text, doc_id) of `pairs`. """
+    for text, doc_id in pairs:
+        for token, tf in Counter(iter_tokens(text)).items():
+            yield token, (doc_id, tf)
+
+
+def anchor_tokens_batch(pairs):
+    """ Yields (token, doc_id) for every token occurrence of every (doc_id, anchor text) of `pairs`. """
+    for doc_id, text in pairs:
+        for token in iter_tokens(text):
+            yield token, doc_id